@@ -0,0 +1,201 @@
+#!/usr/bin/python
+
+"""
+Compares ``get_btag_weights`` of ``boostedhiggs/corrections.py`` (all the SF variations evaluated on one flat array of
+the selected jets, and per-event segmented products) with the per-flavour jagged evaluation it replaces, in timing and
+in agreement of the nominal and up/down weights, on synthetic jets and b-tagging SFs. A fraction of the events has a
+None jet selector, like the events without a candidate fatjet in the ``dr_jet_fj > 0.8`` selection of the processor.
+
+Needs the compiled JECs loaded by ``boostedhiggs/corrections.py``, which are not in the repository (they are pickled
+with the python version that runs them), built once with:
+    python -m boostedhiggs.build_jec --output boostedhiggs/data/jec_compiled.pkl
+
+Usage:
+    python benchmarks/btag_weights.py --year 2017 --nevents 200000 --none-fraction 0.1
+"""
+
+import argparse
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+import awkward as ak
+import correctionlib.schemav2 as cs
+import numpy as np
+from coffea.nanoevents.methods import nanoaod
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import boostedhiggs.corrections as corrections  # noqa: E402
+
+SYSTS = ["central", "up", "down", "up_correlated", "down_correlated"]
+
+
+def btag_correction(name, flavours):
+    """SFs linear in pt and |eta|, shifted by flavour and systematic."""
+
+    def content(i):
+        return cs.Category(
+            nodetype="category",
+            input="flavor",
+            content=[
+                cs.CategoryItem(
+                    key=f,
+                    value=cs.Formula(
+                        nodetype="formula",
+                        expression=f"{1 + 0.01 * i + 0.003 * f}+0.0005*x-0.01*y",
+                        parser="TFormula",
+                        variables=["pt", "abseta"],
+                    ),
+                )
+                for f in flavours
+            ],
+        )
+
+    return cs.Correction(
+        name=name,
+        version=1,
+        inputs=[
+            cs.Variable(name="systematic", type="string"),
+            cs.Variable(name="working_point", type="string"),
+            cs.Variable(name="flavor", type="int"),
+            cs.Variable(name="abseta", type="real"),
+            cs.Variable(name="pt", type="real"),
+        ],
+        output=cs.Variable(name="weight", type="real"),
+        data=cs.Category(
+            nodetype="category",
+            input="systematic",
+            content=[
+                cs.CategoryItem(
+                    key=syst,
+                    value=cs.Category(
+                        nodetype="category",
+                        input="working_point",
+                        content=[cs.CategoryItem(key=wp, value=content(i)) for wp in "LMT"],
+                    ),
+                )
+                for i, syst in enumerate(SYSTS)
+            ],
+        ),
+    )
+
+
+def write_pog_json(tmpdir, year):
+    """Writes the synthetic SFs where ``get_pog_json("btagging", year)`` looks for them under ``tmpdir``."""
+    obj, filename = corrections.pog_jsons["btagging"]
+    path = os.path.join(tmpdir, "POG", obj, corrections.get_UL_year(year))
+    os.makedirs(path)
+    cset = cs.CorrectionSet(
+        schema_version=2,
+        corrections=[btag_correction("deepJet_comb", [4, 5]), btag_correction("deepJet_incl", [0])],
+    )
+    with gzip.open(os.path.join(path, filename), "wt") as f:
+        f.write(cset.model_dump_json(exclude_unset=True))
+    corrections.pog_correction_path = tmpdir + "/"
+
+
+def reference_btag_weights(year, jets, jet_selector, wp="M", algo="deepJet", systematics=False):
+    """The previous implementation: the light and b/c jets are evaluated and reduced as jagged arrays per variation."""
+    cset = corrections.get_correctionset(corrections.get_pog_json("btagging", year))
+    efflookup = corrections.get_btag_efficiency(algo, wp, corrections.get_UL_year(year))
+
+    def _btagSF(jets, flavour, syst="central"):
+        j, nj = ak.flatten(jets), ak.num(jets)
+        corrs = cset[f"{algo}_comb"] if flavour == "bc" else cset[f"{algo}_incl"]
+        sf = corrs.evaluate(syst, wp, np.array(j.hadronFlavour), np.array(abs(j.eta)), np.array(j.pt))
+        return ak.unflatten(sf, nj)
+
+    lightJets = jets[jet_selector & (jets.hadronFlavour == 0)]
+    bcJets = jets[jet_selector & (jets.hadronFlavour > 0)]
+
+    lightEff = efflookup(lightJets.pt, abs(lightJets.eta), lightJets.hadronFlavour)
+    bcEff = efflookup(bcJets.pt, abs(bcJets.eta), bcJets.hadronFlavour)
+
+    lightPass = lightJets.btagDeepB > corrections.btagWPs[algo][year][wp]
+    bcPass = bcJets.btagDeepB > corrections.btagWPs[algo][year][wp]
+
+    def _combine(eff, sf, passbtag):
+        tagged_sf = ak.prod(sf[passbtag], axis=-1)
+        untagged_sf = ak.prod(((1 - sf * eff) / (1 - eff))[~passbtag], axis=-1)
+        return ak.fill_none(tagged_sf * untagged_sf, 1.0)
+
+    ret_weights = {
+        "weight_btag": _combine(bcEff, _btagSF(bcJets, "bc"), bcPass)
+        * _combine(lightEff, _btagSF(lightJets, "light"), lightPass)
+    }
+    if systematics:
+        for syst, name in zip(SYSTS[1:], [f"{year}Up", f"{year}Down", "CorrelatedUp", "CorrelatedDown"]):
+            ret_weights[f"weight_btagSFlight{name}"] = _combine(lightEff, _btagSF(lightJets, "light", syst), lightPass)
+            ret_weights[f"weight_btagSFbc{name}"] = _combine(bcEff, _btagSF(bcJets, "bc", syst), bcPass)
+    return ret_weights
+
+
+def make_jets(rng, nevents, none_fraction):
+    counts = rng.integers(0, 9, nevents)
+    n = int(np.sum(counts))
+
+    def jagged(values):
+        return ak.unflatten(values, counts)
+
+    jets = ak.zip(
+        {
+            "pt": jagged(rng.uniform(20, 800, n).astype(np.float32)),
+            "eta": jagged(rng.uniform(-2.5, 2.5, n).astype(np.float32)),
+            "phi": jagged(rng.uniform(-np.pi, np.pi, n).astype(np.float32)),
+            "mass": jagged(np.ones(n, np.float32)),
+            "hadronFlavour": jagged(rng.choice([0, 4, 5], n).astype(np.int32)),
+            "btagDeepB": jagged(rng.uniform(0, 1, n).astype(np.float32)),
+        },
+        with_name="Jet",
+        behavior=nanoaod.behavior,
+    )
+    selector = (jets.pt > 30) & (abs(jets.eta) < 2.5)
+    # option-type selector, None for the events without a candidate fatjet
+    selector = ak.mask(selector, rng.uniform(0, 1, nevents) >= none_fraction)
+    return jets, selector
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    jets, selector = make_jets(rng, args.nevents, args.none_fraction)
+
+    # the untagged factors are infinite for the jets with an efficiency of 1, in both implementations
+    with tempfile.TemporaryDirectory() as tmpdir, np.errstate(divide="ignore", invalid="ignore"):
+        write_pog_json(tmpdir, args.year)
+
+        print(f"{args.nevents} events ({args.none_fraction:.0%} with a None selector), {ak.sum(ak.num(jets))} jets")
+        print(f"{'':<16}{'reference [s]':>15}{'flat [s]':>10}{'max |diff|':>12}")
+        for systematics in [False, True]:
+            start = time.perf_counter()
+            reference = reference_btag_weights(args.year, jets, selector, wp=args.wp, systematics=systematics)
+            t_reference = time.perf_counter() - start
+            out = corrections.get_btag_weights(args.year, jets, selector, wp=args.wp, systematics=systematics)
+            t_flat = time.perf_counter() - start - t_reference
+
+            assert sorted(reference) == sorted(out)
+            diff = max(
+                np.nanmax(np.abs(ak.to_numpy(reference[key]) - ak.to_numpy(out[key])), initial=0.0) for key in reference
+            )
+            name = "systematics" if systematics else "nominal"
+            print(f"{name:<16}{t_reference:>15.3f}{t_flat:>10.3f}{diff:>12.2e}")
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python benchmarks/btag_weights.py --year 2017 --nevents 200000 --none-fraction 0.1
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--year", dest="year", default="2017", choices=["2016APV", "2016", "2017", "2018"], help="year")
+    parser.add_argument("--wp", dest="wp", default="M", choices=["L", "M", "T"], help="b-tagging working point")
+    parser.add_argument("--nevents", dest="nevents", type=int, default=200000, help="number of events")
+    parser.add_argument(
+        "--none-fraction", dest="none_fraction", type=float, default=0.1, help="fraction of events with a None selector"
+    )
+    parser.add_argument("--seed", dest="seed", type=int, default=42, help="random seed")
+
+    args = parser.parse_args()
+
+    main(args)
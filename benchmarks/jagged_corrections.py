@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+"""
+Compares ``evaluate_jagged`` of ``boostedhiggs/corrections.py`` (one flatten of the fields and one unflatten of the
+results per collection) with the flatten -> evaluate -> unflatten per correction call it replaces, in timing, in
+peak memory allocated (traced with tracemalloc) and in agreement, on synthetic fatjets. The correction is either a
+cheap (eta, pt)-binned SF like the pileup ID one, where the flatten/unflatten overhead dominates, or the msoftdrop
+correction, where the correctionlib evaluation does.
+
+Needs the compiled JECs loaded by ``boostedhiggs/corrections.py``, which are not in the repository (they are pickled
+with the python version that runs them), built once with:
+    python -m boostedhiggs.build_jec --output boostedhiggs/data/jec_compiled.pkl
+
+Usage:
+    python benchmarks/jagged_corrections.py --nevents 500000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import awkward as ak
+import correctionlib.schemav2 as cs
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from boostedhiggs.corrections import evaluate_jagged, msdcorr  # noqa: E402
+
+
+def binned_correction(rng):
+    edges = {"eta": list(np.linspace(-2.5, 2.5, 11)), "pt": list(np.linspace(0, 2000, 21))}
+    correction = cs.Correction(
+        name="binned",
+        version=1,
+        inputs=[cs.Variable(name="eta", type="real"), cs.Variable(name="pt", type="real")],
+        output=cs.Variable(name="weight", type="real"),
+        data=cs.MultiBinning(
+            nodetype="multibinning",
+            inputs=["eta", "pt"],
+            edges=list(edges.values()),
+            content=list(rng.uniform(0.9, 1.1, 10 * 20)),
+            flow="clamp",
+        ),
+    )
+    return correction.to_evaluator()
+
+
+def get_calls(args, rng):
+    """
+    Returns the fields needed, the per-call (jagged inputs -> flat values) and the batched (flat inputs -> flat values)
+    evaluation.
+    """
+    if args.correction == "msd":
+        corr = msdcorr["msdfjcorr"]
+        return (
+            ["msd", "pt", "eta"],
+            lambda fatjets, msd: corr.evaluate(
+                np.array(ak.flatten(msd / fatjets.pt)),
+                np.array(ak.flatten(np.log(fatjets.pt))),
+                np.array(ak.flatten(fatjets.eta)),
+            ),
+            lambda x: corr.evaluate(x["msd"] / x["pt"], np.log(x["pt"]), x["eta"]),
+        )
+
+    corr = binned_correction(rng)
+    return (
+        ["pt", "eta"],
+        lambda fatjets, msd: corr.evaluate(np.array(ak.flatten(fatjets.eta)), np.array(ak.flatten(fatjets.pt))),
+        lambda x: corr.evaluate(x["eta"], x["pt"]),
+    )
+
+
+def per_call(call, fatjets, msd, ncalls, reduce):
+    """The previous pattern: every call flattens its inputs and unflattens its output."""
+    out = {}
+    for i in range(ncalls):
+        out[i] = ak.unflatten(call(fatjets, msd), ak.num(fatjets))
+        if reduce:
+            out[i] = ak.prod(out[i], axis=1)
+    return out
+
+
+def batched(call, fields, fatjets, msd, ncalls, reduce):
+    return evaluate_jagged(
+        fatjets,
+        {field: msd if field == "msd" else fatjets[field] for field in fields},
+        {i: call for i in range(ncalls)},
+        reduce="prod" if reduce else None,
+    )
+
+
+def measure(func, nrepeat):
+    func()  # warm-up
+    start = time.perf_counter()
+    for _ in range(nrepeat):
+        out = func()
+    elapsed = (time.perf_counter() - start) / nrepeat
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, out
+
+
+def agree(a, b):
+    return all(
+        np.array_equal(ak.to_numpy(ak.flatten(a[key], axis=None)), ak.to_numpy(ak.flatten(b[key], axis=None))) for key in a
+    )
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    counts = rng.integers(0, 4, args.nevents)
+    n = int(np.sum(counts))
+    fatjets = ak.zip(
+        {
+            "pt": ak.unflatten(rng.uniform(200, 1500, n).astype(np.float32), counts),
+            "eta": ak.unflatten(rng.uniform(-2.4, 2.4, n).astype(np.float32), counts),
+        }
+    )
+    msd = ak.unflatten(rng.uniform(20, 250, n).astype(np.float32), counts)
+
+    fields, reference_call, batched_call = get_calls(args, rng)
+
+    print(f"{args.nevents} events, {n} fatjets, {args.ncalls} {args.correction} calls, {args.nrepeat} repetitions")
+    print(f"{'':<20}{'per call [ms]':>15}{'batched [ms]':>14}{'per call [MB]':>15}{'batched [MB]':>14}{'identical':>11}")
+    for name, reduce in [("jagged", False), ("per-event product", True)]:
+        t_reference, m_reference, out_reference = measure(
+            lambda: per_call(reference_call, fatjets, msd, args.ncalls, reduce), args.nrepeat
+        )
+        t_kernel, m_kernel, out_kernel = measure(
+            lambda: batched(batched_call, fields, fatjets, msd, args.ncalls, reduce), args.nrepeat
+        )
+        print(
+            f"{name:<20}{1e3 * t_reference:>15.1f}{1e3 * t_kernel:>14.1f}{m_reference / 1e6:>15.1f}{m_kernel / 1e6:>14.1f}"
+            f"{str(agree(out_reference, out_kernel)):>11}"
+        )
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python benchmarks/jagged_corrections.py --nevents 500000
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nevents", dest="nevents", type=int, default=200000, help="number of events")
+    parser.add_argument("--ncalls", dest="ncalls", type=int, default=3, help="corrections per collection (e.g. nom/up/down)")
+    parser.add_argument(
+        "--correction", dest="correction", default="binned", choices=["binned", "msd"], help="correction evaluated"
+    )
+    parser.add_argument("--nrepeat", dest="nrepeat", type=int, default=5, help="number of repetitions")
+    parser.add_argument("--seed", dest="seed", type=int, default=42, help="random seed")
+
+    args = parser.parse_args()
+
+    main(args)
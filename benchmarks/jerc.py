@@ -0,0 +1,124 @@
+#!/usr/bin/python
+
+"""
+Compares the correctionlib JEC/JER of ``boostedhiggs/jerc.py`` with the coffea ``CorrectedJetsFactory`` of
+``boostedhiggs/build_jec.py`` (built from the same text files), in timing and in agreement of the corrected pt and
+mass (nominal, JER and JES variations), on synthetic jets. The time of the coffea factory includes materializing the
+lazy variations.
+
+Needs the compiled JECs loaded by ``boostedhiggs/corrections.py``, which are not in the repository (they are pickled
+with the python version that runs them), built once with:
+    python -m boostedhiggs.build_jec --output boostedhiggs/data/jec_compiled.pkl
+
+Usage:
+    python benchmarks/jerc.py --year 2017 --nevents 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import awkward as ak
+import cachetools
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from boostedhiggs.build_jec import fatjet_factory, jet_factory  # noqa: E402
+from boostedhiggs.corrections import get_UL_year  # noqa: E402
+from boostedhiggs.jerc import get_jerc_evaluator  # noqa: E402
+
+
+def make_jets(rng, nevents, fatjets):
+    counts = rng.integers(0, 4 if fatjets else 8, nevents)
+    n = int(np.sum(counts))
+
+    def jagged(values):
+        return ak.unflatten(values.astype(np.float32), counts)
+
+    pt = rng.uniform(200 if fatjets else 15, 2000, n)
+    matched = rng.uniform(0, 1, n) < 0.8
+    pt_gen = np.where(matched, pt * rng.normal(1, 0.1, n), 0)
+    jets = ak.zip(
+        {
+            "pt": jagged(pt),
+            "eta": jagged(rng.uniform(-2.5 if fatjets else -5, 2.5 if fatjets else 5, n)),
+            "mass": jagged(rng.uniform(10, 300, n)),
+            "area": jagged(rng.uniform(1.8, 2.1, n) if fatjets else rng.uniform(0.4, 0.6, n)),
+            "rawFactor": jagged(rng.uniform(0, 0.2, n)),
+            "matched_gen": ak.zip({"pt": ak.unflatten(ak.mask(pt_gen.astype(np.float32), matched), counts)}),
+        },
+        depth_limit=2,
+    )
+    event_rho = ak.Array(rng.uniform(0, 50, nevents).astype(np.float32))
+    return jets, event_rho
+
+
+def run_coffea(factory, jets, event_rho, shifts):
+    raw = 1 - jets.rawFactor
+    inputs = ak.zip(
+        {
+            "pt": jets.pt,
+            "eta": jets.eta,
+            "mass": jets.mass,
+            "area": jets.area,
+            "pt_raw": raw * jets.pt,
+            "mass_raw": raw * jets.mass,
+            "pt_gen": ak.values_astype(ak.fill_none(jets.matched_gen.pt, 0), np.float32),
+            "event_rho": ak.broadcast_arrays(event_rho, jets.pt)[0],
+        }
+    )
+    corrected = factory.build(inputs, cachetools.Cache(np.inf))
+
+    out = {"": corrected}
+    for shift in shifts:
+        for var in ["up", "down"]:
+            out[f"{shift}_{var}"] = corrected[shift][var]
+    return {key: (ak.to_numpy(ak.flatten(jets.pt)), ak.to_numpy(ak.flatten(jets.mass))) for key, jets in out.items()}
+
+
+def measure(func, nrepeat):
+    func()  # warm-up
+    start = time.perf_counter()
+    for _ in range(nrepeat):
+        out = func()
+    return (time.perf_counter() - start) / nrepeat, out
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    year = args.year[:4]
+    shifts = ["JER", "JES_jes", "JES_FlavorQCD", "JES_RelativeBal", "JES_Absolute", f"JES_BBEC1_{year}", "JES_Total"]
+    corr_key = f"{get_UL_year(args.year)}mc".replace("_UL", "")
+
+    print(f"{args.year}, {args.nevents} events, {len(shifts)} shifts, {args.nrepeat} repetitions")
+    print(f"{'':<8}{'jets':>10}{'coffea [ms]':>14}{'correctionlib [ms]':>20}{'max rel. diff':>15}")
+    for jet_type, factory in [("ak8", fatjet_factory[corr_key]), ("ak4", jet_factory[corr_key])]:
+        jets, event_rho = make_jets(rng, args.nevents, jet_type == "ak8")
+        evaluator = get_jerc_evaluator(args.year, jet_type)
+
+        t_coffea, out_coffea = measure(lambda: run_coffea(factory, jets, event_rho, shifts), args.nrepeat)
+        t_correctionlib, (out_correctionlib, _) = measure(lambda: evaluator.correct(jets, event_rho, shifts), args.nrepeat)
+
+        diff = max(
+            np.max(np.abs(out_correctionlib[key][i] / out_coffea[key][i] - 1)) for key in out_coffea for i in range(2)
+        )
+        print(
+            f"{jet_type:<8}{len(out_coffea[''][0]):>10}{1e3 * t_coffea:>14.1f}{1e3 * t_correctionlib:>20.1f}{diff:>15.2e}"
+        )
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python benchmarks/jerc.py --year 2017 --nevents 100000
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--year", dest="year", default="2017", help="year", type=str)
+    parser.add_argument("--nevents", dest="nevents", type=int, default=50000, help="number of events")
+    parser.add_argument("--nrepeat", dest="nrepeat", type=int, default=3, help="number of repetitions")
+    parser.add_argument("--seed", dest="seed", type=int, default=42, help="random seed")
+
+    args = parser.parse_args()
+
+    main(args)
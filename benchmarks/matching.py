@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+"""
+Compares the compiled ΔR matching kernels of ``boostedhiggs/matching.py`` with the awkward expressions
+they replace, in timing and in agreement, on synthetic jagged collections.
+
+Usage:
+    python benchmarks/matching.py --nevents 500000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import awkward as ak
+import numpy as np
+from coffea.nanoevents.methods import candidate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from boostedhiggs.matching import any_within, count_within, delta_r_to, nearest, within_cone  # noqa: E402
+
+
+def make_candidates(rng, counts):
+    n = int(np.sum(counts))
+    fields = {
+        "pt": rng.uniform(30, 500, n).astype(np.float32),
+        "eta": rng.uniform(-2.5, 2.5, n).astype(np.float32),
+        "phi": rng.uniform(-np.pi, np.pi, n).astype(np.float32),
+        "mass": rng.uniform(0, 50, n).astype(np.float32),
+        "charge": np.zeros(n, dtype=np.float32),
+    }
+    return ak.zip(
+        {key: ak.unflatten(value, counts) for key, value in fields.items()},
+        with_name="PtEtaPhiMCandidate",
+        behavior=candidate.behavior,
+    )
+
+
+def timeit(func, nrepeat):
+    func()  # warm-up (numba compilation)
+    start = time.perf_counter()
+    for _ in range(nrepeat):
+        out = func()
+    return (time.perf_counter() - start) / nrepeat, out
+
+
+def agree(a, b):
+    a, b = ak.fill_none(ak.flatten(a, axis=None), -1), ak.fill_none(ak.flatten(b, axis=None), -1)
+    return np.mean(ak.to_numpy(a) == ak.to_numpy(b))
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+
+    jets = make_candidates(rng, rng.integers(0, 8, args.nevents))
+    # one optional target (e.g. the candidate lepton) per event
+    target = ak.firsts(make_candidates(rng, rng.integers(0, 2, args.nevents)))
+    pfcands = make_candidates(rng, rng.integers(0, 100, args.nevents))
+    genlep = ak.to_regular(make_candidates(rng, np.ones(args.nevents, dtype=np.int64)), axis=1)
+
+    benchmarks = {
+        "nearest": (
+            lambda: nearest(jets, target, keepdims=True),
+            lambda: ak.argmin(jets.delta_r(target), axis=1, keepdims=True),
+        ),
+        "delta_r_to > 0.8": (
+            lambda: delta_r_to(jets, target) > 0.8,
+            lambda: jets.delta_r(target) > 0.8,
+        ),
+        "count_within": (
+            lambda: count_within(jets, target, 0.8),
+            lambda: ak.sum(target.delta_r(jets) < 0.8, axis=1),
+        ),
+        "any_within": (
+            lambda: any_within(jets, target, 0.8),
+            lambda: ak.any(target.delta_r(jets) < 0.8, axis=1),
+        ),
+        "within_cone": (
+            lambda: within_cone(pfcands, genlep, 0.1),
+            lambda: genlep.delta_r(pfcands) < 0.1,
+        ),
+    }
+
+    print(f"{args.nevents} events, {args.nrepeat} repetitions")
+    print(f"{'':<20}{'kernel [ms]':>14}{'awkward [ms]':>14}{'speedup':>10}{'agreement':>12}")
+    for name, (kernel, reference) in benchmarks.items():
+        t_kernel, out_kernel = timeit(kernel, args.nrepeat)
+        t_reference, out_reference = timeit(reference, args.nrepeat)
+        print(
+            f"{name:<20}{1e3 * t_kernel:>14.1f}{1e3 * t_reference:>14.1f}"
+            f"{t_reference / t_kernel:>10.1f}{agree(out_kernel, out_reference):>12.6f}"
+        )
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python benchmarks/matching.py --nevents 500000
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nevents", dest="nevents", type=int, default=200000, help="number of events")
+    parser.add_argument("--nrepeat", dest="nrepeat", type=int, default=5, help="number of repetitions")
+    parser.add_argument("--seed", dest="seed", type=int, default=42, help="random seed")
+
+    args = parser.parse_args()
+
+    main(args)
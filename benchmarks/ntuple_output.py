@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+"""
+Compares the output of the training ntuples of ``InputProcessor``: the previous path (``.tolist()`` of every column,
+``pd.DataFrame``, ``dropna`` and ``pa.Table.from_pandas``) and the arrow tables built from the numpy arrays of
+``boostedhiggs/ntuples.py``, in throughput and in the content of the written parquet files, on synthetic columns
+(per-event scalars and optionally (events, particles) PF candidate features).
+
+Usage:
+    python benchmarks/ntuple_output.py --nevents 20000 --npf-features 10
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from boostedhiggs.ntuples import from_arrow_column, write_parquet  # noqa: E402
+
+
+def make_columns(rng, nevents, nscalars, npf_features, npf):
+    columns = {f"var{i}": rng.normal(size=nevents).astype(np.float32) for i in range(nscalars)}
+    # very few NaNs, as the genjetmass of the ntuples
+    columns["var0"][rng.uniform(size=nevents) < 1e-3] = np.nan
+    columns["n_bjets_M"] = rng.integers(0, 4, nevents)
+    for i in range(npf_features):
+        columns[f"pfcand_var{i}"] = rng.normal(size=(nevents, npf)).astype(np.float32)
+    return columns
+
+
+def write_pandas(columns, path):
+    columns = {key: value.squeeze().tolist() for key, value in columns.items()}
+    df = pd.DataFrame(columns)
+    df = df.dropna()
+    table = pa.Table.from_pandas(df)
+    if len(table) != 0:
+        pq.write_table(table, path)
+    return len(table)
+
+
+def measure(func, nrepeat):
+    func()  # warm-up
+    start = time.perf_counter()
+    for _ in range(nrepeat):
+        out = func()
+    return (time.perf_counter() - start) / nrepeat, out
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    columns = make_columns(rng, args.nevents, args.nscalars, args.npf_features, args.npf)
+    size = sum(value.nbytes for value in columns.values()) / 1e6
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = {"pandas": os.path.join(tmpdir, "pandas.parquet"), "arrow": os.path.join(tmpdir, "arrow.parquet")}
+        t_pandas, n_pandas = measure(lambda: write_pandas(columns, paths["pandas"]), args.nrepeat)
+        t_arrow, n_arrow = measure(lambda: write_parquet(columns, paths["arrow"]), args.nrepeat)
+
+        tables = {key: pq.read_table(path) for key, path in paths.items()}
+        same = n_pandas == n_arrow and all(
+            np.array_equal(
+                np.array(tables["pandas"][key].to_pylist(), dtype=value.dtype),
+                from_arrow_column(tables["arrow"][key]),
+            )
+            for key, value in columns.items()
+        )
+
+    print(
+        f"{args.nevents} events, {args.nscalars} scalars, {args.npf_features} x {args.npf} PF features ({size:.0f} MB), "
+        f"{n_arrow} events written"
+    )
+    print(f"{'':<10}{'time [s]':>10}{'events/s':>12}")
+    for name, t in [("pandas", t_pandas), ("arrow", t_arrow)]:
+        print(f"{name:<10}{t:>10.3f}{args.nevents / t:>12.0f}")
+    print(f"speedup: {t_pandas / t_arrow:.1f}x, same content: {same}")
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python benchmarks/ntuple_output.py --nevents 20000 --npf-features 10
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nevents", dest="nevents", type=int, default=20000, help="number of events")
+    parser.add_argument("--nscalars", dest="nscalars", type=int, default=150, help="number of per-event columns")
+    parser.add_argument("--npf-features", dest="npf_features", type=int, default=10, help="number of PF features")
+    parser.add_argument("--npf", dest="npf", type=int, default=128, help="number of PF candidates per jet")
+    parser.add_argument("--nrepeat", dest="nrepeat", type=int, default=3, help="number of repetitions")
+    parser.add_argument("--seed", dest="seed", type=int, default=42, help="random seed")
+
+    args = parser.parse_args()
+
+    main(args)
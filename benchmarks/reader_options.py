@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+"""
+Compares the events/s of the coffea Runner with the uproot reader presets of ``boostedhiggs/data/reader_presets.json``
+on synthetic local NanoAOD-like files, for a wide read (all the PFCands fields) and a narrow read (a few event and
+fatjet branches).
+
+The files are read from local disk (after a warm-up pass, from the page cache), so only the options that apply
+to local files (mmap, num_workers, begin_chunk_size, align_clusters) make a difference here, the xrootd handler does not.
+
+Usage:
+    python benchmarks/reader_options.py --nfiles 4 --nevents 100000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import awkward as ak
+import numpy as np
+import uproot
+from coffea import processor
+from coffea.nanoevents import BaseSchema
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from boostedhiggs.reader import get_reader_options, load_reader_presets, runner_kwargs, set_uproot_defaults  # noqa: E402
+
+PFCANDS_FIELDS = [
+    "pt",
+    "eta",
+    "phi",
+    "mass",
+    "charge",
+    "pdgId",
+    "d0",
+    "dz",
+    "puppiWeight",
+    "trkChi2",
+    "vtxChi2",
+    "lostInnerHits",
+]
+
+
+class ReadProcessor(processor.ProcessorABC):
+    def __init__(self, wide):
+        self._wide = wide
+
+    def process(self, events):
+        if self._wide:
+            total = sum(ak.sum(events[f"PFCands_{field}"]) for field in PFCANDS_FIELDS)
+        else:
+            total = ak.sum(events.FatJet_pt) + ak.sum(events.MET_pt) + ak.sum(events.run)
+        return {"nevents": len(events), "total": float(total)}
+
+    def postprocess(self, accumulator):
+        return accumulator
+
+
+def make_files(directory, nfiles, nevents, nclusters, seed):
+    rng = np.random.default_rng(seed)
+    files = []
+    for i in range(nfiles):
+        path = os.path.join(directory, f"file{i}.root")
+        with uproot.recreate(path) as f:
+            for j in range(nclusters):
+                n = nevents // nclusters
+                npf = rng.poisson(60, n)
+                nfj = rng.integers(0, 4, n)
+                pfcands = {
+                    field: ak.unflatten(rng.normal(size=np.sum(npf)).astype(np.float32), npf) for field in PFCANDS_FIELDS
+                }
+                chunk = {
+                    "run": np.full(n, 1, dtype=np.int32),
+                    "MET_pt": rng.exponential(50, n).astype(np.float32),
+                    "PFCands": ak.zip(pfcands),
+                    "FatJet": ak.zip({"pt": ak.unflatten(rng.exponential(300, np.sum(nfj)).astype(np.float32), nfj)}),
+                }
+                if j == 0:
+                    f["Events"] = chunk
+                else:
+                    f["Events"].extend(chunk)
+        files.append(path)
+    return files
+
+
+def run(files, options, wide, chunksize):
+    set_uproot_defaults(options)
+    runner = processor.Runner(
+        executor=processor.IterativeExecutor(status=False),
+        schema=BaseSchema,
+        chunksize=chunksize,
+        **runner_kwargs(options),
+    )
+    start = time.perf_counter()
+    out = runner({"synthetic": files}, "Events", processor_instance=ReadProcessor(wide))
+    return out["nevents"] / (time.perf_counter() - start)
+
+
+def main(args):
+    presets = args.presets.split(",") if args.presets else list(load_reader_presets())
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = make_files(directory, args.nfiles, args.nevents, args.nclusters, args.seed)
+        print(f"{args.nfiles} files x {args.nevents} events, {sum(os.path.getsize(f) for f in files) / 1e6:.0f} MB")
+
+        # warm-up (page cache, imports)
+        run(files, get_reader_options("default"), True, args.chunksize)
+
+        print(f"{'preset':<12}{'wide [evt/s]':>16}{'narrow [evt/s]':>16}")
+        for preset in presets:
+            options = get_reader_options(preset)
+            rates = [max(run(files, options, wide, args.chunksize) for _ in range(args.nrepeat)) for wide in [True, False]]
+            print(f"{preset:<12}{rates[0]:>16.0f}{rates[1]:>16.0f}")
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python benchmarks/reader_options.py --nfiles 4 --nevents 100000
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nfiles", dest="nfiles", type=int, default=2, help="number of files")
+    parser.add_argument("--nevents", dest="nevents", type=int, default=50000, help="number of events per file")
+    parser.add_argument("--nclusters", dest="nclusters", type=int, default=7, help="number of clusters per file")
+    parser.add_argument("--chunksize", dest="chunksize", type=int, default=10000, help="chunk size")
+    parser.add_argument("--presets", dest="presets", default=None, help="presets separated by commas (default: all)")
+    parser.add_argument("--nrepeat", dest="nrepeat", type=int, default=3, help="number of repetitions (best is kept)")
+    parser.add_argument("--seed", dest="seed", type=int, default=42, help="random seed")
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,142 @@
+"""
+b-tagging efficiency maps for the b-tag SFs (``get_btag_weights``), with the full statistics of whole datasets:
+fills the (pt, |eta|, hadron flavour, pass WP) histograms of the AK4 jets for all the taggers and working points of
+``btagWPs`` in one pass, merged by the coffea accumulator, and writes the ``btageff_{tagger}_{wp}_{year}_UL.coffea``
+lookups in ``postprocess`` (and with ``python -m boostedhiggs.btageffprocessor`` from the pkls of several jobs).
+
+Run e.g. as:
+    python run.py --year 2016APV,2016,2017,2018 --processor btageff --executor futures --workers 8 \
+        --config samples_inclusive.yaml --key mc --sample TTToSemiLeptonic
+"""
+
+import os
+import warnings
+from typing import Dict, Tuple
+
+import awkward as ak
+import hist
+import numpy as np
+from coffea import processor
+from coffea import util as cutil
+from coffea.lookup_tools.dense_lookup import dense_lookup
+
+from boostedhiggs.corrections import btagWPs, get_UL_year
+
+warnings.filterwarnings("ignore", message="Found duplicate branch ")
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+warnings.filterwarnings("ignore", message="Missing cross-reference index ")
+np.seterr(invalid="ignore")
+
+TAGGER_BRANCHES = {"deepJet": "btagDeepFlavB", "deepCSV": "btagDeepB"}
+
+HIST_KEY = "btageff"
+
+
+def make_btageff_hist() -> hist.Hist:
+    return (
+        # fixed categories, so that the histograms of all the chunks can be added
+        hist.Hist.new.StrCat(list(btagWPs["deepJet"]), name="year")
+        .StrCat(list(TAGGER_BRANCHES), name="tagger")
+        .StrCat(["L", "M", "T"], name="wp")
+        .Reg(20, 40, 300, name="pt")
+        .Reg(4, 0, 2.5, name="abseta")
+        .IntCat([0, 4, 5], name="flavor")
+        .Bool(name="passWP")
+        .Double()
+    )
+
+
+def make_btageff_lookups(h: hist.Hist) -> Dict[Tuple[str, str, str], dense_lookup]:
+    """
+    Returns the efficiency lookups of the years filled in the histogram, {(tagger, wp, year): lookup(pt, abseta, flavor)}.
+    The bins without jets have an efficiency of 0 (the b-tag weight of such jets is 1).
+    """
+    lookups = {}
+    for year in h.axes["year"]:
+        if h[{"year": year}].sum() == 0:
+            continue
+        for tagger in h.axes["tagger"]:
+            for wp in h.axes["wp"]:
+                counts = h[{"year": year, "tagger": tagger, "wp": wp}]
+                passing = counts[{"passWP": True}].values()
+                total = counts[{"passWP": sum}].values()
+                eff = np.divide(passing, total, out=np.zeros_like(total), where=total > 0)
+                lookups[(tagger, wp, year)] = dense_lookup(eff, [ax.edges for ax in counts[{"passWP": sum}].axes])
+    return lookups
+
+
+def save_btageff_lookups(h: hist.Hist, output_location: str):
+    os.makedirs(output_location, exist_ok=True)
+    for (tagger, wp, year), lookup in make_btageff_lookups(h).items():
+        filename = os.path.join(output_location, f"btageff_{tagger}_{wp}_{get_UL_year(year)}.coffea")
+        cutil.save(lookup, filename)
+        print(f"Saved {filename}")
+
+
+class BTagEfficiencyProcessor(processor.ProcessorABC):
+    def __init__(
+        self,
+        year="2017",
+        yearmod="",
+        output_location="./outfiles/",
+    ):
+        self._year = year
+        self._yearmod = yearmod
+        self._output_location = output_location
+
+    @property
+    def accumulator(self):
+        return self._accumulator
+
+    def process(self, events: ak.Array):
+        """Returns the (pt, |eta|, flavour, pass WP) histogram of the jets in the b-tagging phase space."""
+        # datasets of multi-year filesets are tagged with their year (see ``make_multiyear_fileset``)
+        year = events.metadata.get("year", self._year + self._yearmod)
+
+        h = make_btageff_hist()
+        if not hasattr(events, "genWeight"):
+            return {HIST_KEY: h}
+
+        # b-tagging only applied for jets with |eta| < 2.5
+        jets = events.Jet
+        jets = ak.flatten(jets[(jets.pt > 30) & (abs(jets.eta) < 2.5)])
+        pt, abseta, flavor = jets.pt, abs(jets.eta), jets.hadronFlavour
+
+        for tagger, branch in TAGGER_BRANCHES.items():
+            for wp, cut in btagWPs[tagger][year].items():
+                h.fill(
+                    year=year,
+                    tagger=tagger,
+                    wp=wp,
+                    pt=pt,
+                    abseta=abseta,
+                    flavor=flavor,
+                    passWP=jets[branch] > cut,
+                )
+
+        return {HIST_KEY: h}
+
+    def postprocess(self, accumulator):
+        if self._output_location is not None and HIST_KEY in accumulator:
+            save_btageff_lookups(accumulator[HIST_KEY], self._output_location)
+        return accumulator
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python -m boostedhiggs.btageffprocessor outfiles/*.pkl --outdir boostedhiggs/data
+    import argparse
+    import pickle
+
+    parser = argparse.ArgumentParser(description="merges the btageff histograms of several jobs and writes the lookups")
+    parser.add_argument("pkls", nargs="+", help="output pkls of run.py --processor btageff")
+    parser.add_argument("--outdir", default="boostedhiggs/data", type=str, help="directory of the lookups")
+    args = parser.parse_args()
+
+    merged = None
+    for filename in args.pkls:
+        with open(filename, "rb") as f:
+            h = pickle.load(f)[HIST_KEY]
+        merged = h if merged is None else merged + h
+
+    save_btageff_lookups(merged, args.outdir)
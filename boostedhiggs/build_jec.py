@@ -194,10 +194,15 @@ if __name__ == "__main__":
     import cloudpickle
 
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument("--output", default="jec_compiled.pkl.gz", type=str)
+    parser.add_argument(
+        "--output",
+        default="jec_compiled.pkl.gz",
+        help="gzipped if it ends with .gz, corrections.py loads an uncompressed boostedhiggs/data/jec_compiled.pkl",
+        type=str,
+    )
     args = parser.parse_args()
 
-    with gzip.open(args.output, "wb") as fout:
+    with (gzip.open if args.output.endswith(".gz") else open)(args.output, "wb") as fout:
         cloudpickle.dump(
             {
                 "jet_factory": jet_factory,
@@ -0,0 +1,256 @@
+import gzip
+import importlib.resources
+import os
+import re
+
+import awkward as ak
+import correctionlib.schemav2 as cs
+import numpy as np
+from coffea.jetmet_tools.JetCorrectionUncertainty import split_jec_name
+from coffea.lookup_tools.txt_converters import (
+    convert_jec_txt_file,
+    convert_jersf_txt_file,
+    convert_jr_txt_file,
+    convert_junc_txt_file,
+)
+
+from .jerc import JERC_TAGS, JET_TYPES, jerc_filename
+
+"""
+Converts the JEC/JER text files of ``build_jec.py`` into one correctionlib json per year (``jerc_{year}_UL.json.gz``)
+with the names of the POG ``jet_jerc.json.gz``/``fatJet_jerc.json.gz``, evaluated by ``boostedhiggs/jerc.py``:
+
+    - {jec}_L1FastJet_{jet}, {jec}_L2Relative_{jet} and their product {jec}_L1L2L3Res_{jet} (a compound correction,
+      the MC L3Absolute and L2L3Residual are 1)
+    - {jec}_Total_{jet} (from the Uncertainty file) and {jec}_Regrouped_{source}_AK4PFchs (from the RegroupedV2 files)
+    - {jer}_PtResolution_{jet} and {jer}_ScaleFactor_{jet} (with a systematic input: nom, up, down)
+
+The text files are parsed with the coffea converters and evaluated the same way as by the coffea lookups: the formula
+variables are clamped to the ranges of their bin, the JEC and resolution are 1 outside of the binning and the
+uncertainties are interpolated linearly between the pT knots (clamped).
+
+Run once as:
+    python -m boostedhiggs.build_jerc
+"""
+
+FORMULA_VARIABLES = ["x", "y", "z", "t"]
+
+
+def _clamped_expression(formula: str, nvars: int, mins, maxs) -> str:
+    """Substitutes each formula variable by its value clamped to [min, max] (as done by the coffea lookups)."""
+    clamps = {
+        var: f"min(max({var},{repr(float(lo))}),{repr(float(hi))})"
+        for var, lo, hi in zip(FORMULA_VARIABLES[:nvars], mins, maxs)
+    }
+    return re.sub(r"\b[xyzt]\b", lambda match: clamps.get(match.group(0), match.group(0)), formula)
+
+
+def _read_formula(path: str) -> str:
+    """Returns the (TFormula) formula of the header of a jec.txt/jr.txt file, e.g. ``{1 JetEta 1 JetPt formula ...}``."""
+    with open(path, "r") as f:
+        layout = f.readline().strip().strip("{}").split()
+    nBinnedVars = int(layout[0])
+    nEvalVars = int(layout[nBinnedVars + 1])
+    return layout[nBinnedVars + nEvalVars + 2].replace("TMath::", "")
+
+
+def _standard_function(name: str, lookup, formula: str, description: str) -> cs.Correction:
+    """Converts a ``jme_standard_function`` (jec.txt, jr.txt) to nested binnings of parametrized formulas."""
+    _, (bins, bin_order), (clamp_mins, clamp_maxs, var_order), (parms, _) = lookup
+
+    def content(index):
+        # with one binned variable, the clamps and parameters are still jagged (one entry per bin)
+        idx = tuple(index) if len(index) > 1 else (index[0], 0)
+        return cs.Formula(
+            nodetype="formula",
+            expression=_clamped_expression(
+                formula,
+                len(var_order),
+                [float(clamp_mins[var][idx]) for var in var_order],
+                [float(clamp_maxs[var][idx]) for var in var_order],
+            ),
+            parser="TFormula",
+            variables=var_order,
+            parameters=[float(parm[idx]) for parm in parms],
+        )
+
+    def binning(depth, index):
+        edges = bins[bin_order[depth]] if depth == 0 else bins[bin_order[depth]][index[0]]
+        edges = [float(edge) for edge in np.asarray(edges)]
+        nbins = len(edges) - 1
+        return cs.Binning(
+            nodetype="binning",
+            input=bin_order[depth],
+            edges=edges,
+            content=[
+                binning(depth + 1, index + [i]) if depth + 1 < len(bin_order) else content(index + [i]) for i in range(nbins)
+            ],
+            # the coffea lookups return 1 outside of the binning
+            flow=1.0,
+        )
+
+    inputs = list(dict.fromkeys(bin_order + var_order))
+    return cs.Correction(
+        name=name,
+        description=description,
+        version=1,
+        inputs=[cs.Variable(name=var, type="real") for var in inputs],
+        output=cs.Variable(name="correction", type="real"),
+        data=binning(0, []),
+    )
+
+
+def _scale_factor(name: str, lookup, description: str) -> cs.Correction:
+    """Converts a ``jersf_lookup`` (jersf.txt) binned in eta to a category of the systematics."""
+    _, (bins, bin_order), _, ((central, up, down), _) = lookup
+    if len(bin_order) != 1:
+        raise ValueError(f"{name}: only scale factors binned in {bin_order[0]} are supported")
+
+    edges = [float(edge) for edge in np.asarray(bins[bin_order[0]])]
+    return cs.Correction(
+        name=name,
+        description=description,
+        version=1,
+        inputs=[cs.Variable(name=bin_order[0], type="real"), cs.Variable(name="systematic", type="string")],
+        output=cs.Variable(name="scale_factor", type="real"),
+        data=cs.Category(
+            nodetype="category",
+            input="systematic",
+            content=[
+                cs.CategoryItem(
+                    key=key,
+                    value=cs.Binning(
+                        nodetype="binning",
+                        input=bin_order[0],
+                        edges=edges,
+                        content=[float(v) for v in ak.flatten(values)],
+                        flow="clamp",
+                    ),
+                )
+                for key, values in [("nom", central), ("up", up), ("down", down)]
+            ],
+        ),
+    )
+
+
+def _uncertainty(name: str, lookup, description: str) -> cs.Correction:
+    """Converts a ``jec_uncertainty_lookup`` (junc.txt) to a linear interpolation in pT per eta bin."""
+    _, (bins, bin_order), (values, var_order) = lookup
+    knots = [float(knot) for knot in values["knots"]]
+    if not np.array_equal(values["ups"], values["downs"]):
+        raise ValueError(f"{name}: asymmetric uncertainties are not supported")
+
+    def interpolation(ups):
+        return cs.Binning(
+            nodetype="binning",
+            input=var_order[0],
+            edges=knots,
+            content=[
+                cs.Formula(
+                    nodetype="formula",
+                    expression=_clamped_expression(f"[0]+([1]-[0])*(x-{repr(lo)})/{repr(hi - lo)}", 1, [lo], [hi]),
+                    parser="TFormula",
+                    variables=var_order,
+                    parameters=[float(ups[i]), float(ups[i + 1])],
+                )
+                for i, (lo, hi) in enumerate(zip(knots[:-1], knots[1:]))
+            ],
+            flow="clamp",
+        )
+
+    return cs.Correction(
+        name=name,
+        description=description,
+        version=1,
+        inputs=[cs.Variable(name=var, type="real") for var in bin_order + var_order],
+        output=cs.Variable(name="uncertainty", type="real"),
+        data=cs.Binning(
+            nodetype="binning",
+            input=bin_order[0],
+            edges=[float(edge) for edge in np.asarray(bins[bin_order[0]])],
+            content=[interpolation(ups) for ups in values["ups"]],
+            flow="clamp",
+        ),
+    )
+
+
+def _convert(converter, filename: str):
+    with importlib.resources.path("boostedhiggs.data", filename) as path:
+        return converter(str(path))
+
+
+def _convert_standard_function(converter, name: str, filename: str) -> cs.Correction:
+    with importlib.resources.path("boostedhiggs.data", filename) as path:
+        ((_, lookup),) = converter(str(path)).items()
+        return _standard_function(name, lookup, _read_formula(str(path)), filename)
+
+
+def build_corrections(year: str):
+    """Returns the corrections (AK4PFchs and AK8PFPuppi) of a year."""
+    jec, jer = JERC_TAGS[year]["jec"], JERC_TAGS[year]["jer"]
+
+    corrections = []
+    compounds = []
+    sources_done = set()
+    for jet_type, sources_jet_type in JET_TYPES.values():
+        levels = []
+        for level in ["L1FastJet", "L2Relative"]:
+            filename = f"{jec}_{level}_{jet_type}.jec.txt"
+            corrections.append(_convert_standard_function(convert_jec_txt_file, f"{jec}_{level}_{jet_type}", filename))
+            levels.append(f"{jec}_{level}_{jet_type}")
+
+        compounds.append(
+            cs.CompoundCorrection(
+                name=f"{jec}_L1L2L3Res_{jet_type}",
+                description=" * ".join(levels),
+                inputs=[cs.Variable(name=var, type="real") for var in ["JetA", "JetEta", "JetPt", "Rho"]],
+                output=cs.Variable(name="correction", type="real"),
+                inputs_update=["JetPt"],
+                input_op="*",
+                output_op="*",
+                stack=levels,
+            )
+        )
+
+        filename = f"{jec}_Uncertainty_{jet_type}.junc.txt"
+        ((_, lookup),) = _convert(convert_junc_txt_file, filename).items()
+        corrections.append(_uncertainty(f"{jec}_Total_{jet_type}", lookup, filename))
+
+        if sources_jet_type not in sources_done:
+            filename = f"RegroupedV2_{jec}_UncertaintySources_{sources_jet_type}.junc.txt"
+            for (name, _), lookup in _convert(convert_junc_txt_file, filename).items():
+                source = split_jec_name(os.path.basename(name).split(".")[0])[3]
+                corrections.append(_uncertainty(f"{jec}_Regrouped_{source}_{sources_jet_type}", lookup, filename))
+            sources_done.add(sources_jet_type)
+
+        filename = f"{jer}_PtResolution_{jet_type}.jr.txt"
+        corrections.append(_convert_standard_function(convert_jr_txt_file, f"{jer}_PtResolution_{jet_type}", filename))
+
+        filename = f"{jer}_SF_{jet_type}.jersf.txt"
+        ((_, lookup),) = _convert(convert_jersf_txt_file, filename).items()
+        corrections.append(_scale_factor(f"{jer}_ScaleFactor_{jet_type}", lookup, filename))
+
+    return corrections, compounds
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--years", default=",".join(JERC_TAGS), type=str, help="years separated by commas")
+    parser.add_argument("--outdir", default=os.path.join(os.path.dirname(__file__), "data"), type=str)
+    args = parser.parse_args()
+
+    for year in args.years.split(","):
+        corrections, compounds = build_corrections(year)
+        cset = cs.CorrectionSet(
+            schema_version=2,
+            description=f"JEC/JER of {year} converted from the text files by boostedhiggs/build_jerc.py",
+            corrections=corrections,
+            compound_corrections=compounds,
+        )
+
+        output = os.path.join(args.outdir, jerc_filename(year))
+        with gzip.open(output, "wt") as fout:
+            fout.write(cset.model_dump_json(exclude_unset=True))
+        print(f"Wrote {len(corrections)} corrections and {len(compounds)} compound corrections to {output}")
@@ -0,0 +1,180 @@
+"""
+SQLite catalog of the PFNano files of ``fileset/pfnanoindex_{pfnano}_{year}.json``, indexed by PFNano version, year and
+sample, so that the files of a sample are looked up without loading and scanning the full index json.
+
+Each file is stored with its position in the index (the order of the files, used by the job splitting), and its size,
+number of entries and sum of generator weights (``genEventSumw`` of the ``Runs`` tree, None for data) once they are
+filled with ``fill_metadata`` (e.g. by ``fileset/build_catalog.py``). An index json is (re-)imported when it is first
+queried or when it changed since it was imported, keeping the metadata of the files that are still in it.
+"""
+
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+import uproot
+
+INDEX_PATH = "fileset/pfnanoindex_{pfnano}_{year}.json"
+REDIRECTOR = "root://cmseos.fnal.gov/"
+
+
+def get_file_metadata(filename: str, timeout: int = 60) -> Dict:
+    """Returns the size [bytes], number of entries and sum of generator weights of a NanoAOD file."""
+    with uproot.open({filename: None}, timeout=timeout) as f:
+        sumgenweight = None
+        if "Runs" in f and "genEventSumw" in f["Runs"]:
+            sumgenweight = float(np.sum(f["Runs"]["genEventSumw"].array(library="np")))
+        return {
+            "size": f.file.source.num_bytes,
+            "numentries": f["Events"].num_entries,
+            "sumgenweight": sumgenweight,
+        }
+
+
+class FilesetCatalog:
+    """Catalog of the files of the PFNano index jsons, backed by a SQLite file."""
+
+    def __init__(self, path: str = "fileset/catalog.sqlite", index_path: str = INDEX_PATH):
+        self._path = path
+        self._index_path = index_path
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._path, timeout=60)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "pfnano TEXT, year TEXT, subdir TEXT, sample TEXT, idx INTEGER, path TEXT, "
+                "size INTEGER, numentries INTEGER, sumgenweight REAL, "
+                "PRIMARY KEY (pfnano, year, sample, idx))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_path ON files (path)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS indexes (pfnano TEXT, year TEXT, mtime REAL, PRIMARY KEY (pfnano, year))"
+            )
+        return self._conn
+
+    def __getstate__(self):
+        # the connection is re-opened after unpickling
+        return {**self.__dict__, "_conn": None}
+
+    def add_index(self, pfnano: str, year: str, index_json: Optional[str] = None) -> int:
+        """(Re-)imports the files of an index json, keeping the metadata of the files already in the catalog."""
+        index_json = index_json or self._index_path.format(pfnano=pfnano, year=year)
+        with open(index_json, "r") as f:
+            index = json.load(f)
+
+        metadata = {
+            row[0]: row[1:]
+            for row in self.conn.execute(
+                "SELECT path, size, numentries, sumgenweight FROM files WHERE pfnano = ? AND year = ?", (pfnano, year)
+            )
+        }
+
+        rows = []
+        for subdir, samples in index[year].items():
+            for sample, flist in samples.items():
+                for idx, path in enumerate(flist):
+                    rows.append((pfnano, year, subdir, sample, idx, path) + metadata.get(path, (None, None, None)))
+
+        with self.conn:
+            self.conn.execute("DELETE FROM files WHERE pfnano = ? AND year = ?", (pfnano, year))
+            self.conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO indexes VALUES (?, ?, ?)", (pfnano, year, os.stat(index_json).st_mtime)
+            )
+        return len(rows)
+
+    def ensure_index(self, pfnano: str, year: str):
+        """Imports the index json of (pfnano, year) if it is not in the catalog or changed since it was imported."""
+        index_json = self._index_path.format(pfnano=pfnano, year=year)
+        row = self.conn.execute("SELECT mtime FROM indexes WHERE pfnano = ? AND year = ?", (pfnano, year)).fetchone()
+        if row is None or (os.path.exists(index_json) and os.stat(index_json).st_mtime != row[0]):
+            self.add_index(pfnano, year, index_json)
+
+    def samples(self, pfnano: str, year: str) -> Dict[str, str]:
+        """Returns the samples of (pfnano, year) and their subdirectory, {sample: subdir}."""
+        self.ensure_index(pfnano, year)
+        query = "SELECT DISTINCT sample, subdir FROM files WHERE pfnano = ? AND year = ? ORDER BY subdir, sample"
+        return dict(self.conn.execute(query, (pfnano, year)).fetchall())
+
+    def files(
+        self, pfnano: str, year: str, samples: Optional[List[str]] = None, redirector: str = REDIRECTOR
+    ) -> Dict[str, List[str]]:
+        """Returns the files of the samples (all the samples if None), in the order of the index, {sample: [files]}."""
+        files = {}
+        for sample, path in self._select("sample, path", pfnano, year, samples):
+            files.setdefault(sample, []).append(redirector + path)
+        return files
+
+    def file_metadata(self, pfnano: str, year: str, samples: Optional[List[str]] = None) -> Dict[str, List[Dict]]:
+        """Returns the files of the samples with their metadata (None if not filled), {sample: [{"path", ...}]}."""
+        out = {}
+        for sample, path, size, numentries, sumgenweight in self._select(
+            "sample, path, size, numentries, sumgenweight", pfnano, year, samples
+        ):
+            out.setdefault(sample, []).append(
+                {"path": path, "size": size, "numentries": numentries, "sumgenweight": sumgenweight}
+            )
+        return out
+
+    def numentries(self, paths: List[str], redirector: str = REDIRECTOR) -> Dict[str, int]:
+        """Returns the number of entries of the files of ``paths`` (with the redirector) that have their metadata."""
+        numentries = {}
+        for path in paths:
+            if not path.startswith(redirector):
+                continue
+            row = self.conn.execute(
+                "SELECT numentries FROM files WHERE path = ? AND numentries IS NOT NULL", (path[len(redirector) :],)
+            ).fetchone()
+            if row is not None:
+                numentries[path] = row[0]
+        return numentries
+
+    def fill_metadata(
+        self,
+        pfnano: str,
+        year: str,
+        samples: Optional[List[str]] = None,
+        redirector: str = REDIRECTOR,
+        workers: int = 16,
+        timeout: int = 60,
+    ) -> List[str]:
+        """Opens the files without metadata to fill it, returns the files that failed."""
+        to_get = [path for _, path, size in self._select("sample, path, size", pfnano, year, samples) if size is None]
+        print(f"Filling the metadata of {len(to_get)} files")
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(get_file_metadata, redirector + path, timeout): path for path in to_get}
+            for i, future in enumerate(as_completed(futures)):
+                path = futures[future]
+                try:
+                    metadata = future.result()
+                except Exception as e:
+                    print(f"Failed {path}: {e}")
+                    failed.append(path)
+                    continue
+
+                with self.conn:
+                    self.conn.execute(
+                        "UPDATE files SET size = ?, numentries = ?, sumgenweight = ? WHERE path = ?",
+                        (metadata["size"], metadata["numentries"], metadata["sumgenweight"], path),
+                    )
+                if (i + 1) % 100 == 0:
+                    print(f"{i + 1}/{len(to_get)}")
+
+        return failed
+
+    def _select(self, columns: str, pfnano: str, year: str, samples: Optional[List[str]] = None) -> List:
+        self.ensure_index(pfnano, year)
+        query = f"SELECT {columns} FROM files WHERE pfnano = ? AND year = ?"
+        params = [pfnano, year]
+        if samples is not None:
+            query += f" AND sample IN ({', '.join('?' * len(samples))})"
+            params += list(samples)
+        return self.conn.execute(query + " ORDER BY sample, idx", params).fetchall()
@@ -1,7 +1,8 @@
+import functools
 import importlib.resources
 import pickle
 import warnings
-from typing import Dict
+from typing import Callable, Dict, Optional, Union
 
 import awkward as ak
 import correctionlib
@@ -11,6 +12,8 @@ from coffea.analysis_tools import Weights
 from coffea.nanoevents.methods import candidate, vector
 from coffea.nanoevents.methods.nanoaod import GenParticleArray, JetArray
 
+from .jerc import get_jerc_evaluator
+
 ak.behavior.update(vector.behavior)
 
 btagWPs = {
@@ -60,6 +63,54 @@ btagWPs = {
     },
 }
 
+
+def segmented_prod(values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Products of the consecutive segments of ``counts`` elements along the last axis of ``values`` (e.g. per-event
+    products of flat per-jet values, for several rows of variations at once), 1 for the empty segments.
+    """
+    out = np.ones(values.shape[:-1] + (len(counts),), dtype=values.dtype)
+    nonempty = counts > 0
+    if np.any(nonempty):
+        # reduceat does not handle empty segments, these are left to 1
+        starts = np.cumsum(counts) - counts
+        out[..., nonempty] = np.multiply.reduceat(values, starts[nonempty], axis=-1)
+    return out
+
+
+def evaluate_jagged(
+    collection: ak.Array,
+    fields: Dict[str, ak.Array],
+    calls: Dict[str, Callable[[Dict[str, np.ndarray]], np.ndarray]],
+    reduce: Optional[str] = None,
+) -> Dict[str, Union[ak.Array, np.ndarray]]:
+    """
+    Evaluates a batch of corrections on the objects of a jagged collection.
+
+    The ``fields`` (jagged arrays with the layout of ``collection``) are flattened once into contiguous numpy arrays,
+    each call gets the dictionary of flat fields and returns the flat values of a correction, and the results are
+    unflattened once together. With ``reduce="prod"``, the per-event products of the values are returned instead
+    (1 for events without objects), as numpy arrays.
+    """
+    counts = ak.to_numpy(ak.num(collection, axis=1))
+    # the dtypes are kept (e.g. float32), correctionlib converts the inputs to double itself
+    flat = {name: np.ascontiguousarray(ak.to_numpy(ak.flatten(value, axis=1))) for name, value in fields.items()}
+
+    if reduce == "prod":
+        return {name: segmented_prod(np.asarray(call(flat)), counts) for name, call in calls.items()}
+    elif reduce is not None:
+        raise ValueError(f"Unknown reduction {reduce}")
+
+    values = {name: np.asarray(call(flat)) for name, call in calls.items()}
+
+    offsets = ak.layout.Index64(np.concatenate([[0], np.cumsum(counts)]))
+    records = ak.layout.RecordArray(
+        [ak.layout.NumpyArray(value) for value in values.values()], [str(name) for name in values]
+    )
+    jagged = ak.Array(ak.layout.ListOffsetArray64(offsets, records))
+    return {name: jagged[str(name)] for name in values}
+
+
 with importlib.resources.path("boostedhiggs.data", "msdcorr.json") as filename:
     msdcorr = correctionlib.CorrectionSet.from_file(str(filename))
 
@@ -74,12 +125,11 @@ def corrected_msoftdrop(fatjets):
     # msoftdrop = fatjets.msoftdrop
     msdfjcorr = msdraw / (1 - fatjets.rawFactor)
 
-    corr = msdcorr["msdfjcorr"].evaluate(
-        np.array(ak.flatten(msdfjcorr / fatjets.pt)),
-        np.array(ak.flatten(np.log(fatjets.pt))),
-        np.array(ak.flatten(fatjets.eta)),
-    )
-    corr = ak.unflatten(corr, ak.num(fatjets))
+    corr = evaluate_jagged(
+        fatjets,
+        {"msd": msdfjcorr, "pt": fatjets.pt, "eta": fatjets.eta},
+        {"msdfjcorr": lambda x: msdcorr["msdfjcorr"].evaluate(x["msd"] / x["pt"], np.log(x["pt"]), x["eta"])},
+    )["msdfjcorr"]
     corrected_mass = msdfjcorr * corr
 
     return corrected_mass
@@ -294,6 +344,19 @@ def get_pog_json(obj, year):
     return f"{pog_correction_path}POG/{pog_json[0]}/{year}/{pog_json[1]}"
 
 
+@functools.lru_cache(maxsize=None)
+def get_correctionset(path: str) -> correctionlib.CorrectionSet:
+    """Loads a correctionlib json once per process, so that the handles of all the years are reused across chunks."""
+    return correctionlib.CorrectionSet.from_file(path)
+
+
+@functools.lru_cache(maxsize=None)
+def get_btag_efficiency(algo: str, wp: str, ul_year: str):
+    """Loads the b-tagging efficiency lookup of a year once per process."""
+    with importlib.resources.path("boostedhiggs.data", f"btageff_{algo}_{wp}_{ul_year}.coffea") as filename:
+        return cutil.load(filename)
+
+
 def get_btag_weights(
     year: str,
     jets: JetArray,
@@ -308,82 +371,69 @@ def get_btag_weights(
     """
 
     try:
-        cset = correctionlib.CorrectionSet.from_file(get_pog_json("btagging", year))
+        cset = get_correctionset(get_pog_json("btagging", year))
     except FileNotFoundError:
-        cset = correctionlib.CorrectionSet.from_file("btagging.json.gz")
+        cset = get_correctionset("btagging.json.gz")
 
     ul_year = get_UL_year(year)
-    with importlib.resources.path("boostedhiggs.data", f"btageff_{algo}_{wp}_{ul_year}.coffea") as filename:
-        efflookup = cutil.load(filename)
-
-    def _btagSF(jets, flavour, syst="central"):
-        j, nj = ak.flatten(jets), ak.num(jets)
-        corrs = cset[f"{algo}_comb"] if flavour == "bc" else cset[f"{algo}_incl"]
-        sf = corrs.evaluate(
-            syst,
-            wp,
-            np.array(j.hadronFlavour),
-            np.array(abs(j.eta)),
-            np.array(j.pt),
-        )
-        return ak.unflatten(sf, nj)
+    efflookup = get_btag_efficiency(algo, wp, ul_year)
+
+    # the light and b/c jets are evaluated with different corrections, and each systematic with a separate call as the
+    # systematic is a string input, but on flat arrays of all the selected jets at once
+    systs = ["central", "up", "down", "up_correlated", "down_correlated"] if systematics else ["central"]
+
+    # the selector is None for the events without a candidate fatjet (dr_jet_fj), these have no selected jets (weight 1)
+    selected = ak.fill_none(jets[jet_selector], [], axis=0)
+    fields = {
+        "flavour": selected.hadronFlavour,
+        "abseta": abs(selected.eta),
+        "pt": selected.pt,
+        "eff": efflookup(selected.pt, abs(selected.eta), selected.hadronFlavour),
+        "passbtag": selected.btagDeepB > btagWPs[algo][year][wp],
+    }
 
-    lightJets = jets[jet_selector & (jets.hadronFlavour == 0)]
-    bcJets = jets[jet_selector & (jets.hadronFlavour > 0)]
+    def _btag_factors(group, syst):
+        corrs = cset[f"{algo}_comb"] if group == "bc" else cset[f"{algo}_incl"]
 
-    lightEff = efflookup(lightJets.pt, abs(lightJets.eta), lightJets.hadronFlavour)
-    bcEff = efflookup(bcJets.pt, abs(bcJets.eta), bcJets.hadronFlavour)
+        def call(flat):
+            mask = flat["flavour"] > 0 if group == "bc" else flat["flavour"] == 0
+            sf = np.ones(len(mask))
+            if np.any(mask):
+                sf[mask] = corrs.evaluate(syst, wp, flat["flavour"][mask], flat["abseta"][mask], flat["pt"][mask])
 
-    lightSF = _btagSF(lightJets, "light")
-    bcSF = _btagSF(bcJets, "bc")
+            # 1a method
+            # https://btv-wiki.docs.cern.ch/PerformanceCalibration/fixedWPSFRecommendations/
+            # tagged SF = SF*eff / eff = SF, untagged SF = (1 - SF*eff) / (1 - eff), 1 for the jets of the other group
+            with np.errstate(divide="ignore", invalid="ignore"):
+                untagged = (1 - sf * flat["eff"]) / (1 - flat["eff"])
+            return np.where(mask, np.where(flat["passbtag"], sf, untagged), 1.0)
 
-    lightPass = lightJets.btagDeepB > btagWPs[algo][year][wp]
-    bcPass = bcJets.btagDeepB > btagWPs[algo][year][wp]
+        return call
 
-    # 1a method
-    # https://btv-wiki.docs.cern.ch/PerformanceCalibration/fixedWPSFRecommendations/
-    def _combine(eff, sf, passbtag):
-        # tagged SF = SF*eff / eff = SF
-        tagged_sf = ak.prod(sf[passbtag], axis=-1)
-        # untagged SF = (1 - SF*eff) / (1 - eff)
-        untagged_sf = ak.prod(((1 - sf * eff) / (1 - eff))[~passbtag], axis=-1)
-        return ak.fill_none(tagged_sf * untagged_sf, 1.0)
+    # per-event products of the SFs of each group and systematic
+    calls = {f"{group}_{syst}": _btag_factors(group, syst) for group in ["bc", "light"] for syst in systs}
+    sfs = evaluate_jagged(selected, fields, calls, reduce="prod")
+    bc = [sfs[f"bc_{syst}"] for syst in systs]
+    light = [sfs[f"light_{syst}"] for syst in systs]
 
     ret_weights = {}
 
     # one common multiplicative SF is to be applied to the nominal prediction
-    """
-    bc_0btag = _get_weight(True, bcEff, bcSF)
-    light_0btag = _get_weight(True, lightEff, lightSF)
-    ret_weights["0btag_1b"] = bc_0btag * light_0btag
-
-    bc_1pbtag = _get_weight(False, bcEff, bcSF)
-    light_1pbtag = _get_weight(False, lightEff, lightSF)
-    ret_weights["1pbtag_1b"] = bc_1pbtag * light_1pbtag
-    """
-    bc = _combine(bcEff, bcSF, bcPass)
-    light = _combine(lightEff, lightSF, lightPass)
-    ret_weights["weight_btag"] = bc * light
+    ret_weights["weight_btag"] = ak.Array(bc[0] * light[0])
 
     # Separate uncertainties are applied for b/c jets and light jets
     if systematics:
-        ret_weights[f"weight_btagSFlight{year}Up"] = _combine(lightEff, _btagSF(lightJets, "light", syst="up"), lightPass)
-        ret_weights[f"weight_btagSFlight{year}Down"] = _combine(
-            lightEff, _btagSF(lightJets, "light", syst="down"), lightPass
-        )
+        ret_weights[f"weight_btagSFlight{year}Up"] = ak.Array(light[1])
+        ret_weights[f"weight_btagSFlight{year}Down"] = ak.Array(light[2])
 
-        ret_weights[f"weight_btagSFbc{year}Up"] = _combine(bcEff, _btagSF(bcJets, "bc", syst="up"), bcPass)
-        ret_weights[f"weight_btagSFbc{year}Down"] = _combine(bcEff, _btagSF(bcJets, "bc", syst="down"), bcPass)
+        ret_weights[f"weight_btagSFbc{year}Up"] = ak.Array(bc[1])
+        ret_weights[f"weight_btagSFbc{year}Down"] = ak.Array(bc[2])
 
-        ret_weights["weight_btagSFlightCorrelatedUp"] = _combine(
-            lightEff, _btagSF(lightJets, "light", syst="up_correlated"), lightPass
-        )
-        ret_weights["weight_btagSFlightCorrelatedDown"] = _combine(
-            lightEff, _btagSF(lightJets, "light", syst="down_correlated"), lightPass
-        )
+        ret_weights["weight_btagSFlightCorrelatedUp"] = ak.Array(light[3])
+        ret_weights["weight_btagSFlightCorrelatedDown"] = ak.Array(light[4])
 
-        ret_weights["weight_btagSFbcCorrelatedUp"] = _combine(bcEff, _btagSF(bcJets, "bc", syst="up_correlated"), bcPass)
-        ret_weights["weight_btagSFbcCorrelatedDown"] = _combine(bcEff, _btagSF(bcJets, "bc", syst="down_correlated"), bcPass)
+        ret_weights["weight_btagSFbcCorrelatedUp"] = ak.Array(bc[3])
+        ret_weights["weight_btagSFbcCorrelatedDown"] = ak.Array(bc[4])
 
     return ret_weights
 
@@ -476,7 +526,7 @@ def add_lepton_weight(weights, lepton, year, lepton_type="muon"):
     if lepton_type == "electron":
         ul_year = ul_year.replace("_UL", "")
 
-    cset = correctionlib.CorrectionSet.from_file(get_pog_json(lepton_type, year))
+    cset = get_correctionset(get_pog_json(lepton_type, year))
 
     def set_isothreshold(corr, value, lepton_pt, lepton_type):
         """
@@ -538,7 +588,7 @@ def add_lepton_weight(weights, lepton, year, lepton_type="muon"):
             values["down"] = cset["UL-Electron-ID-SF"].evaluate(ul_year, "sfdown", json_map_name, lepton_eta, lepton_pt)
 
         for key, val in values.items():
-            values[key] = set_isothreshold(corr, val, np.array(ak.fill_none(lepton.pt, 0.0)), lepton_type)
+            values[key] = set_isothreshold(corr, val, lep_pt, lepton_type)
 
         # add weights (for now only the nominal weight)
         weights.add(f"{corr}_{lepton_type}", values["nominal"], values["up"], values["down"])
@@ -547,7 +597,7 @@ def add_lepton_weight(weights, lepton, year, lepton_type="muon"):
     if lepton_type == "electron":
         corr = "trigger"
         with importlib.resources.path("boostedhiggs.data", f"electron_trigger_{ul_year}_UL.json") as filename:
-            cset = correctionlib.CorrectionSet.from_file(str(filename))
+            cset = get_correctionset(str(filename))
             lepton_pt, lepton_eta = get_clip(lep_pt, lep_eta, lepton_type, corr)
             values["nominal"] = cset["UL-Electron-Trigger-SF"].evaluate(
                 ul_year + "_UL", "sf", "trigger", lepton_eta, lepton_pt
@@ -564,7 +614,7 @@ def get_pileup_weight(year: str, mod: str, nPU: np.ndarray):
     Should be able to do something similar to lepton weight but w pileup
     e.g. see here: https://cms-nanoaod-integration.web.cern.ch/commonJSONSFs/LUMI_puWeights_Run2_UL/
     """
-    cset = correctionlib.CorrectionSet.from_file(get_pog_json("pileup", year + mod))
+    cset = get_correctionset(get_pog_json("pileup", year + mod))
 
     year_to_corr = {
         "2016": "Collisions16_UltraLegacy_goldenJSON",
@@ -601,21 +651,18 @@ def add_pileupid_weights(weights: Weights, year: str, mod: str, jets: JetArray,
     # check that there's a geometrically matched genjet (99.9% are, so not really necessary...)
     jets = jets[ak.any(jets.metric_table(genjets) < 0.4, axis=-1)]
 
-    sf_cset = correctionlib.CorrectionSet.from_file(get_pog_json("jmar", year + mod))["PUJetID_eff"]
+    sf_cset = get_correctionset(get_pog_json("jmar", year + mod))["PUJetID_eff"]
 
-    # save offsets to reconstruct jagged shape
-    offsets = jets.pt.layout.offsets
-
-    sfs_var = []
-    for var in ["nom", "up", "down"]:
-        # correctionlib < 2.3 doesn't accept jagged arrays (but >= 2.3 needs awkard v2)
-        sfs = sf_cset.evaluate(ak.flatten(jets.eta), ak.flatten(jets.pt), var, "L")
-        # reshape flat effs
-        sfs = ak.Array(ak.layout.ListOffsetArray64(offsets, ak.layout.NumpyArray(sfs)))
-        # product of SFs across arrays, automatically defaults empty lists to 1
-        sfs_var.append(ak.prod(sfs, axis=1))
+    # correctionlib < 2.3 doesn't accept jagged arrays (but >= 2.3 needs awkard v2)
+    # product of SFs across the jets of each event, defaults empty lists to 1
+    sfs_var = evaluate_jagged(
+        jets,
+        {"eta": jets.eta, "pt": jets.pt},
+        {var: (lambda x, var=var: sf_cset.evaluate(x["eta"], x["pt"], var, "L")) for var in ["nom", "up", "down"]},
+        reduce="prod",
+    )
 
-    weights.add("pileupIDSF", *sfs_var)
+    weights.add("pileupIDSF", sfs_var["nom"], sfs_var["up"], sfs_var["down"])
 
 
 """
@@ -635,6 +682,9 @@ except KeyError:
     print("Failed loading compiled JECs")
 
 
+JEC_BACKENDS = ["coffea", "correctionlib"]
+
+
 def _add_jec_variables(jets: JetArray, event_rho: ak.Array) -> JetArray:
     """add variables needed for JECs"""
     jets["pt_raw"] = (1 - jets.rawFactor) * jets.pt
@@ -645,7 +695,44 @@ def _add_jec_variables(jets: JetArray, event_rho: ak.Array) -> JetArray:
     return jets
 
 
-def get_jec_jets(events, jets, year: str, isData: bool = False, jecs: Dict[str, str] = None, fatjets: bool = True):
+def _build_jerc_jets(
+    events, jets, year: str, jecs: Optional[Dict[str, str]], fatjets: bool, jerc_json: Optional[str] = None
+) -> JetArray:
+    """
+    Corrects the jets with the correctionlib JEC/JER (see ``boostedhiggs/jerc.py``), with the same fields as the coffea
+    ``CorrectedJetsFactory``: corrected pt/mass, pt_raw/mass_raw (for the MET) and the {shift: {up, down}} variants.
+    """
+    path = None
+    if jerc_json is not None:
+        # e.g. the POG jsons, {pog_correction_path}POG/JME/{year}/{jets}_jerc.json.gz
+        path = jerc_json.format(year=get_UL_year(year), jets="fatJet" if fatjets else "jet")
+    evaluator = get_jerc_evaluator(year, "ak8" if fatjets else "ak4", path=path)
+    shifts = list(dict.fromkeys(jecs.values())) if jecs else []
+    corrected, counts = evaluator.correct(jets, events.fixedGridRhoFastjetAll, shifts)
+
+    def with_pt_mass(jets, key):
+        pt, mass = corrected[key]
+        jets = ak.with_field(jets, ak.unflatten(pt, counts), "pt")
+        return ak.with_field(jets, ak.unflatten(mass, counts), "mass")
+
+    jets = _add_jec_variables(jets, events.fixedGridRhoFastjetAll)
+    out = with_pt_mass(jets, "")
+    for shift in shifts:
+        variant = ak.zip({var: with_pt_mass(jets, f"{shift}_{var}") for var in ["up", "down"]}, with_name="JetSystematic")
+        out = ak.with_field(out, variant, shift)
+    return out
+
+
+def get_jec_jets(
+    events,
+    jets,
+    year: str,
+    isData: bool = False,
+    jecs: Dict[str, str] = None,
+    fatjets: bool = True,
+    backend: str = "coffea",
+    jerc_json: Optional[str] = None,
+):
     """
     Based on https://github.com/nsmith-/boostedhiggs/blob/master/boostedhiggs/hbbprocessor.py
     Eventually update to V5 JECs once I figure out what's going on with the 2017 UL V5 JER scale factors
@@ -653,13 +740,19 @@ def get_jec_jets(events, jets, year: str, isData: bool = False, jecs: Dict[str,
     See https://cms-nanoaod-integration.web.cern.ch/commonJSONSFs/summaries/
 
     If ``jecs`` is not None, returns the shifted values of variables are affected by JECs.
+
+    ``backend`` is ``coffea`` (the pickled ``CorrectedJetsFactory`` of ``build_jec.py``) or ``correctionlib`` (the
+    correctionlib json of ``build_jerc.py``, see ``boostedhiggs/jerc.py``). With ``correctionlib``, ``jerc_json`` is
+    the path of another json with the same correction names (e.g. the POG ``fatJet_jerc.json.gz``), where ``{year}``
+    is replaced by the UL year (e.g. 2017_UL) and ``{jets}`` by ``jet`` or ``fatJet``.
     """
 
+    if backend not in JEC_BACKENDS:
+        raise ValueError(f"Unknown JEC backend {backend}, choose from {JEC_BACKENDS}")
+
     jec_vars = ["pt"]  # variables we are saving that are affected by JECs
-    if fatjets:
-        jet_factory = fatjet_factory
-    else:
-        jet_factory = ak4jet_factory
+    if backend == "coffea":
+        jet_factory = fatjet_factory if fatjets else ak4jet_factory
 
     apply_jecs = not (not ak.any(jets.pt) or isData)
 
@@ -670,7 +763,9 @@ def get_jec_jets(events, jets, year: str, isData: bool = False, jecs: Dict[str,
     corr_key = f"{get_UL_year(year)}mc".replace("_UL", "")
 
     # fatjet_factory.build gives an error if there are no fatjets in event
-    if apply_jecs:
+    if apply_jecs and backend == "correctionlib":
+        jets = _build_jerc_jets(events, jets, year, jecs, fatjets, jerc_json)
+    elif apply_jecs:
         jets = jet_factory[corr_key].build(_add_jec_variables(jets, events.fixedGridRhoFastjetAll), jec_cache)
 
     # return only fatjets if no jecs given
@@ -892,6 +987,7 @@ def getJMSRVariables(fatjetvars, candidatelep_p4, met, mass_shift=None):
 """
 
 
+from .matching import within_cone
 from .utils import (
     ELE_PDGID,
     FILL_NONE_VALUE,
@@ -1056,7 +1152,7 @@ def getLPweights(dataset, events, candidatefj, fj_idx_lep, candidatelep_p4):
     # build any masking you want
     msk_lep = (pid_array == ELE_PDGID) | (pid_array == MU_PDGID) | (pid_array == TAU_PDGID)
     msk_gamma = pid_array == GAMMA_PDGID
-    msk_delta = GenLep.delta_r(jet_pfcands) < 0.1
+    msk_delta = within_cone(jet_pfcands, GenLep, 0.1)
 
     msk = (msk_lep | msk_gamma) & msk_delta
 
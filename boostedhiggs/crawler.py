@@ -0,0 +1,236 @@
+"""
+Parallel, incremental crawler of the PFNano directories, to build the ``fileset/pfnanoindex_{pfnano}_{year}.json``
+indexes (see ``fileset/indexpfnano.py``).
+
+The directories are visited by a pool of threads (a bounded number of concurrent listings), through a listing backend:
+``EOSBackend`` (the ``eos ls -l`` command), ``XRootDBackend`` (the XRootD python bindings) or ``LocalBackend`` (a local or
+mounted directory tree, e.g. for tests). The listing of a directory also gives the modification times of its
+subdirectories, and the listings of a crawl are saved in a state json. The modification time of a directory only changes
+when its own entries change, so in the next crawl the directories with subdirectories are listed again (one call each,
+which also gives the current times of their subdirectories) but the directories of files (e.g. the 0000/ directories)
+are only listed again if their time changed: an unchanged crawl needs no call for them.
+
+The index is built from the listings with the directory layout of the PFNano productions:
+
+    {folder}/{dataset}/{subsample}/{timestamp}/{0000, 0001, ...}/*.root
+"""
+
+import json
+import os
+import posixpath
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+# {"mtime": float or None, "listed": time of the listing, "dirs": [names], "dir_mtimes": {name: float or None},
+#  "files": [names]}
+Listing = Dict
+
+
+class ListingBackend:
+    """Lists the directories of a storage: subclasses implement ``listdir``."""
+
+    # resolution of the modification times [s]: a directory listed within it after its modification time is listed again
+    mtime_resolution = 0
+
+    def listdir(self, path: str) -> Tuple[Dict[str, Optional[float]], List[str]]:
+        """
+        Returns the subdirectories of a directory with their modification times ({name: mtime}, None if unknown: the
+        subdirectory is then always listed), and the names of its files.
+        """
+        raise NotImplementedError
+
+
+class LocalBackend(ListingBackend):
+    def listdir(self, path: str) -> Tuple[Dict[str, Optional[float]], List[str]]:
+        with os.scandir(path) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+            return {e.name: e.stat().st_mtime for e in entries if e.is_dir()}, [e.name for e in entries if not e.is_dir()]
+
+
+class EOSBackend(ListingBackend):
+    # eos ls -l shows the times to the minute
+    mtime_resolution = 60
+
+    def __init__(self, url: str = "root://cmseos.fnal.gov", timeout: int = 300):
+        self.url = url
+        self.timeout = timeout
+
+    def _eos(self, *args: str) -> str:
+        result = subprocess.run(["eos", self.url, *args], capture_output=True, text=True, timeout=self.timeout)
+        if result.returncode != 0:
+            raise OSError(f"eos {' '.join(args)} failed: {result.stderr.strip()}")
+        return result.stdout
+
+    @staticmethod
+    def _mtime(month: str, day: str, time_or_year: str) -> Optional[float]:
+        """Modification time of the ``ls -l`` date: "Mar 14 10:12" in the last months, "Mar 14  2023" before."""
+        try:
+            if ":" not in time_or_year:
+                return time.mktime(time.strptime(f"{time_or_year} {month} {day}", "%Y %b %d"))
+            year = time.localtime().tm_year
+            mtime = time.mktime(time.strptime(f"{year} {month} {day} {time_or_year}", "%Y %b %d %H:%M"))
+            # the dates without a year are within the last months, so a date in the future is from the previous year
+            if mtime > time.time() + 86400:
+                mtime = time.mktime(time.strptime(f"{year - 1} {month} {day} {time_or_year}", "%Y %b %d %H:%M"))
+            return mtime
+        except ValueError:
+            return None
+
+    def listdir(self, path: str) -> Tuple[Dict[str, Optional[float]], List[str]]:
+        dirs, files = {}, []
+        for line in self._eos("ls", "-l", path).split("\n"):
+            # permissions, links, owner, group, size, month, day, time or year, name
+            fields = line.split(None, 8)
+            if len(fields) < 9:
+                continue
+            if fields[0].startswith("d"):
+                dirs[fields[8]] = self._mtime(*fields[5:8])
+            else:
+                files.append(fields[8])
+        return dict(sorted(dirs.items())), sorted(files)
+
+
+class XRootDBackend(ListingBackend):
+    def __init__(self, url: str = "root://cmseos.fnal.gov", timeout: int = 300):
+        from XRootD import client
+
+        self.fs = client.FileSystem(url)
+        self.timeout = timeout
+
+    def listdir(self, path: str) -> Tuple[Dict[str, Optional[float]], List[str]]:
+        from XRootD.client.flags import DirListFlags, StatInfoFlags
+
+        status, listing = self.fs.dirlist(path, DirListFlags.STAT, timeout=self.timeout)
+        if not status.ok:
+            raise OSError(f"dirlist {path} failed: {status.message}")
+        entries = sorted(listing, key=lambda entry: entry.name)
+        isdir = [bool(entry.statinfo.flags & StatInfoFlags.IS_DIR) for entry in entries]
+        return (
+            {entry.name: float(entry.statinfo.modtime) for entry, d in zip(entries, isdir) if d},
+            [entry.name for entry, d in zip(entries, isdir) if not d],
+        )
+
+
+BACKENDS = {"eos": EOSBackend, "xrootd": XRootDBackend, "local": LocalBackend}
+
+
+class Crawler:
+    """Lists the directory trees of the roots with ``workers`` concurrent listings, reusing the unchanged listings."""
+
+    def __init__(self, backend: ListingBackend, state: Optional[Dict[str, Listing]] = None, workers: int = 16):
+        self.backend = backend
+        self.state = state or {}
+        self.workers = workers
+        self.nlisted = 0
+
+    def _unchanged(self, cached: Optional[Listing], mtime: Optional[float]) -> bool:
+        """Whether the cached listing of a directory of files is current, given its time in the listing of its parent."""
+        if cached is None or mtime is None or cached["dirs"] or cached["mtime"] != mtime:
+            return False
+        # a listing made within the time resolution after the modification could miss later changes
+        return cached.get("listed", 0) >= mtime + self.backend.mtime_resolution
+
+    def _visit(self, path: str, mtime: Optional[float] = None) -> Tuple[str, Listing, bool]:
+        cached = self.state.get(path)
+        try:
+            if self._unchanged(cached, mtime):
+                return path, cached, False
+
+            listed = time.time()
+            dirs, files = self.backend.listdir(path)
+            return path, {"mtime": mtime, "listed": listed, "dirs": list(dirs), "dir_mtimes": dirs, "files": files}, True
+
+        except Exception as e:
+            # keep the previous listing of the directory if it cannot be listed now
+            print(f"WARNING : Could not list {path} ({e})")
+            return path, cached or {"mtime": None, "dirs": [], "dir_mtimes": {}, "files": []}, False
+
+    def crawl(self, roots: List[str]) -> Dict[str, Listing]:
+        """Returns the listings of all the directories under the roots, {path: listing}, and keeps them as the state."""
+        listings = {}
+        self.nlisted = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {pool.submit(self._visit, root.rstrip("/")) for root in roots}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, listing, listed = future.result()
+                    listings[path] = listing
+                    self.nlisted += listed
+                    pending |= {
+                        pool.submit(self._visit, posixpath.join(path, d), listing.get("dir_mtimes", {}).get(d))
+                        for d in listing["dirs"]
+                        if posixpath.join(path, d) not in listings
+                    }
+
+        # the listings of the directories outside of the roots are kept for the next crawls
+        roots = tuple(root.rstrip("/") + "/" for root in roots)
+        self.state = {path: listing for path, listing in self.state.items() if not (path + "/").startswith(roots)}
+        self.state.update(listings)
+        return listings
+
+
+def load_state(path: str) -> Dict[str, Listing]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_state(path: str, state: Dict[str, Listing]):
+    with open(path, "w") as f:
+        json.dump(state, f)
+
+
+def build_index(
+    listings: Dict[str, Listing], folders: List[str], years: List[str], samples_to_exclude: Optional[List] = None
+) -> Dict[str, Dict]:
+    """
+    Returns the index of each year, {year: {year: {folder name: {subsample: [files]}}}}, from the listings of the
+    folders ({...}/{year}/{folder name}). The 2016 HIPM subsamples are indexed in 2016APV, and the ``_ext1`` subsamples
+    are merged with their nominal subsample.
+    """
+    samples_to_exclude = samples_to_exclude or []
+
+    def files(path: str) -> List[str]:
+        return [f"{path}/{x}".replace("//", "/") for x in listings[path]["files"] if x.endswith(".root")]
+
+    index = {year: {} for year in years}
+    for f1 in folders:
+        f1 = f1.rstrip("/")
+        version = "v2_3" if "v2_3" in f1 else "v2_2"
+        year, sample_short = f1.split("/")[-2:]
+        if year not in years or f1 not in listings:
+            continue
+        index[year].setdefault(year, {}).setdefault(sample_short, {})
+
+        for f2 in listings[f1]["dirs"]:
+            if (year, version, f2) in [(y, v, s.rstrip("/")) for y, v, s in samples_to_exclude]:
+                print(f"   Excluding {sample_short}, {f2}, {version}, {year}")
+                continue
+
+            # files directly in the dataset directory
+            f2_path = f"{f1}/{f2}"
+            if not listings[f2_path]["dirs"]:
+                index[year][year][sample_short].setdefault(f2, []).extend(files(f2_path))
+
+            for f3 in listings[f2_path]["dirs"]:
+                subsample_short = f3.replace("_ext1", "")
+                index[year][year][sample_short].setdefault(subsample_short, [])
+
+                f3_path = f"{f2_path}/{f3}"
+                if len(listings[f3_path]["dirs"]) >= 2:
+                    print(f"WARNING : Found multiple timestamps for {f3_path}")
+
+                for f4 in listings[f3_path]["dirs"]:  # timestamp
+                    for f5 in listings[f"{f3_path}/{f4}"]["dirs"]:  # 0000, 0001, ...
+                        root_files = files(f"{f3_path}/{f4}/{f5}")
+                        if year == "2016" and "HIPM" in subsample_short and "2016APV" in index:
+                            apv = index["2016APV"].setdefault("2016APV", {}).setdefault(sample_short, {})
+                            apv.setdefault(subsample_short, []).extend(root_files)
+                        else:
+                            index[year][year][sample_short][subsample_short].extend(root_files)
+
+    return index
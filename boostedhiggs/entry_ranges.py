@@ -0,0 +1,95 @@
+"""
+Condor jobs defined as entry ranges of the input files, [(file, entrystart, entrystop), ...], instead of slices of
+whole files: the files of a sample are cut into jobs of a fixed number of events, so that large files (e.g. of the
+signal samples with the inference) are spread over several jobs and small files are packed together.
+
+The jobs are built by ``condor/submit.py --events-per-job`` from the number of entries of the files in the
+preprocessing cache, and written to ``ranges_{key}.json``: {sample: [{"name": name, "ranges": [[file, start, stop],
+...]}, ...]}. ``run.py --ranges`` processes the job ``--starti`` of ``--sample`` and names its outputs by the name of
+the job (its range, e.g. ``f3_0-f3_250000``), which ``check_jobs.py`` uses to find the failed jobs.
+"""
+
+import dataclasses
+import json
+from typing import Dict, Iterable, List, Tuple
+
+from coffea.processor.executor import FileMeta, WorkItem
+
+from .preprocessing_cache import PreprocessingCache
+
+EntryRange = Tuple[str, int, int]
+
+
+def get_numentries(files: List[str], cache_path: str, treename: str = "Events") -> Dict[str, int]:
+    """Returns the number of entries of the files from the preprocessing cache (without checking the mtimes)."""
+    cache = PreprocessingCache(cache_path, check_mtime=False)
+
+    numentries = {}
+    missing = []
+    for filename in files:
+        filemeta = FileMeta(None, filename, treename)
+        if filemeta in cache:
+            numentries[filename] = cache[filemeta]["numentries"]
+        else:
+            missing.append(filename)
+
+    if missing:
+        raise Exception(
+            f"{len(missing)} files are not in the preprocessing cache {cache_path} (e.g. {missing[0]}), "
+            "warm it with fileset/warm_preprocessing_cache.py"
+        )
+    return numentries
+
+
+def job_name(files: List[str], ranges: List[EntryRange]) -> str:
+    """Name of a job from its first and last entries, f{index of the file in the sample}_{entry}."""
+    first, last = ranges[0], ranges[-1]
+    return f"f{files.index(first[0])}_{first[1]}-f{files.index(last[0])}_{last[2]}"
+
+
+def make_jobs(files: List[str], numentries: Dict[str, int], events_per_job: int) -> List[Dict]:
+    """
+    Cuts the files of a sample, in order, into jobs of ``events_per_job`` events (the last one has the remaining
+    events): [{"name": name, "ranges": [(file, start, stop), ...]}, ...].
+    """
+    jobs = []
+    ranges = []
+    nevents = 0
+    for filename in files:
+        start = 0
+        while start < numentries[filename]:
+            stop = min(numentries[filename], start + events_per_job - nevents)
+            ranges.append((filename, start, stop))
+            nevents += stop - start
+            start = stop
+
+            if nevents == events_per_job:
+                jobs.append({"name": job_name(files, ranges), "ranges": ranges})
+                ranges = []
+                nevents = 0
+
+    if ranges:
+        jobs.append({"name": job_name(files, ranges), "ranges": ranges})
+    return jobs
+
+
+def load_job(path: str, sample: str, jobid: int) -> Dict:
+    with open(path, "r") as f:
+        jobs = json.load(f)
+    return jobs[sample][jobid]
+
+
+def entry_range_chunks(chunks: Iterable[WorkItem], ranges: List[EntryRange], chunksize: int) -> List[WorkItem]:
+    """
+    Returns the chunks of the entry ranges, of about ``chunksize`` entries, from the chunks of the preprocessing of
+    their files (which give the file uuids and user metadata).
+    """
+    files = {chunk.filename: chunk for chunk in chunks}
+
+    out = []
+    for filename, start, stop in ranges:
+        nchunks = max(round((stop - start) / chunksize), 1)
+        edges = [start + (stop - start) * i // nchunks for i in range(nchunks + 1)]
+        for entrystart, entrystop in zip(edges[:-1], edges[1:]):
+            out.append(dataclasses.replace(files[filename], entrystart=entrystart, entrystop=entrystop))
+    return out
@@ -1,5 +1,3 @@
-import importlib.resources
-import json
 import logging
 import os
 import warnings
@@ -22,6 +20,9 @@ from boostedhiggs.corrections import (
     add_VJets_kFactors,
     btagWPs,
 )
+from boostedhiggs.matching import nearest
+from boostedhiggs.skimprocessor import get_skim_sums
+from boostedhiggs.utils import get_bit_mask, get_year_config, pack_bits, split_year
 
 warnings.filterwarnings("ignore", message="Found duplicate branch ")
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -52,43 +53,39 @@ class FakesProcessor(processor.ProcessorABC):
         yearmod="",
         channels=["ele", "mu"],
         output_location="./outfiles/",
+        store_trigger_bits=False,
     ):
-        self._year = year
-        self._yearmod = yearmod
         self._channels = channels
 
         self._output_location = output_location
 
-        # trigger paths
-        with importlib.resources.path("boostedhiggs.data", "triggers.json") as path:
-            with open(path, "r") as f:
-                self._HLTs = json.load(f)[self._year]
+        # also store the packed HLT and MET filter bitmasks (see ``get_bitmap``) for trigger studies
+        self._store_trigger_bits = store_trigger_bits
 
-        # https://twiki.cern.ch/twiki/bin/view/CMS/MissingETOptionalFiltersRun2
-        with importlib.resources.path("boostedhiggs.data", "metfilters.json") as path:
-            with open(path, "r") as f:
-                self._metfilters = json.load(f)[self._year]
+        # year-specific configuration, resolved again per chunk for multi-year filesets (see ``make_multiyear_fileset``)
+        self._set_year(year, yearmod)
 
-        if self._year == "2018":
-            self.dataset_per_ch = {
-                "ele": "EGamma",
-                "mu": "SingleMuon",
-            }
-        else:
-            self.dataset_per_ch = {
-                "ele": "SingleElectron",
-                "mu": "SingleMuon",
-            }
+    def _set_year(self, year: str, yearmod: str = ""):
+        """Sets the trigger paths and MET filters of a year (cached per year, see ``get_year_config``)."""
+        self._year = year
+        self._yearmod = yearmod
+
+        config = get_year_config(self._year)
+        self._HLTs = config["HLTs"]
+        self._metfilters = config["metfilters"]
+        self._hlt_bitmap = config["hlt_bitmap"]
+        self._metfilter_bitmap = config["metfilter_bitmap"]
+        self.dataset_per_ch = config["dataset_per_ch"]
 
     @property
     def accumulator(self):
         return self._accumulator
 
-    def save_dfs_parquet(self, fname, dfs_dict, ch):
+    def save_dfs_parquet(self, fname, dfs_dict, ch, subdir=""):
         if self._output_location is not None:
             table = pa.Table.from_pandas(dfs_dict)
             if len(table) != 0:  # skip dataframes with empty entries
-                pq.write_table(table, self._output_location + ch + "/parquet/" + fname + ".parquet")
+                pq.write_table(table, self._output_location + ch + "/parquet/" + subdir + fname + ".parquet")
 
     def ak_to_pandas(self, output_collection: ak.Array) -> pd.DataFrame:
         output = pd.DataFrame()
@@ -118,7 +115,12 @@ class FakesProcessor(processor.ProcessorABC):
     def process(self, events: ak.Array):
         """Returns skimmed events which pass preselection cuts and with the branches listed in self._skimvars"""
 
-        dataset = events.metadata["dataset"]
+        # datasets of multi-year filesets are tagged with their year (see ``make_multiyear_fileset``)
+        dataset = events.metadata.get("sample", events.metadata["dataset"])
+        yeartag = events.metadata.get("year")
+        if yeartag is not None:
+            self._set_year(*split_year(yeartag))
+
         self.isMC = hasattr(events, "genWeight")
 
         nevents = len(events)
@@ -128,6 +130,11 @@ class FakesProcessor(processor.ProcessorABC):
 
         sumgenweight = ak.sum(events.genWeight) if self.isMC else nevents
 
+        # skims keep the normalization of the full input they were made from
+        skim_sums = get_skim_sums(events.metadata)
+        if skim_sums is not None:
+            sumgenweight = skim_sums[0]
+
         # add genweight before filling cutflow
         if self.isMC:
             for ch in self._channels:
@@ -137,12 +144,12 @@ class FakesProcessor(processor.ProcessorABC):
         # Trigger
         ######################
 
+        # all the HLT decisions of the year are packed once into a uint64 bitmask, the channel triggers are ORs of bits
+        hlt_bits = pack_bits(events.HLT, self._hlt_bitmap)
+
         trigger = {}
         for ch in ["ele", "mu_lowpt", "mu_highpt"]:
-            trigger[ch] = np.zeros(nevents, dtype="bool")
-            for t in self._HLTs[ch]:
-                if t in events.HLT.fields:
-                    trigger[ch] = trigger[ch] | events.HLT[t]
+            trigger[ch] = (hlt_bits & get_bit_mask(self._hlt_bitmap, self._HLTs[ch])) != 0
         trigger["ele"] = trigger["ele"] & (~trigger["mu_lowpt"]) & (~trigger["mu_highpt"])
         trigger["mu_highpt"] = trigger["mu_highpt"] & (~trigger["ele"])
         trigger["mu_lowpt"] = trigger["mu_lowpt"] & (~trigger["ele"])
@@ -151,11 +158,12 @@ class FakesProcessor(processor.ProcessorABC):
         # METFLITERS
         ######################
 
-        metfilters = np.ones(nevents, dtype="bool")
+        metfilter_bits = pack_bits(events.Flag, self._metfilter_bitmap)
         metfilterkey = "mc" if self.isMC else "data"
-        for mf in self._metfilters[metfilterkey]:
-            if mf in events.Flag.fields:
-                metfilters = metfilters & events.Flag[mf]
+        metfilter_mask = get_bit_mask(
+            self._metfilter_bitmap, [mf for mf in self._metfilters[metfilterkey] if mf in events.Flag.fields]
+        )
+        metfilters = (metfilter_bits & metfilter_mask) == metfilter_mask
 
         ######################
         # OBJECT DEFINITION
@@ -256,7 +264,7 @@ class FakesProcessor(processor.ProcessorABC):
         candidatelep_p4 = build_p4(loose_lep1)  # build p4 for candidate lepton
         candidatelep_p4_tight = build_p4(tight_lep1)  # build p4 for candidate lepton (tight)
 
-        fj_idx_lep = ak.argmin(good_fatjets.delta_r(candidatelep_p4), axis=1, keepdims=True)
+        fj_idx_lep = nearest(good_fatjets, candidatelep_p4, keepdims=True)
         candidatefj = ak.firsts(good_fatjets[fj_idx_lep])
 
         lep_fj_dr = candidatefj.delta_r(candidatelep_p4)
@@ -270,6 +278,10 @@ class FakesProcessor(processor.ProcessorABC):
         )
 
         variables = {
+            # event key
+            "run": events.run,
+            "luminosityBlock": events.luminosityBlock,
+            "event": events.event,
             "N_tight_lep": N_tight_lep,
             "N_loose_lep": N_loose_lep,
             # tight
@@ -295,6 +307,10 @@ class FakesProcessor(processor.ProcessorABC):
             "mT_loose1": mT_loose1,
         }
 
+        if self._store_trigger_bits:
+            variables["hlt_bits"] = hlt_bits
+            variables["metfilter_bits"] = metfilter_bits
+
         for ch in self._channels:
             # trigger
             if ch == "mu":
@@ -418,12 +434,15 @@ class FakesProcessor(processor.ProcessorABC):
         fname = events.behavior["__events_factory__"]._partition_key.replace("/", "_")
         fname = "condor_" + fname
 
+        # chunks of multi-year filesets are written to one directory per year
+        subdir = "" if yeartag is None else f"{yeartag}/"
+
         for ch in self._channels:  # creating directories for each channel
             if not os.path.exists(self._output_location + ch):
                 os.makedirs(self._output_location + ch)
-            if not os.path.exists(self._output_location + ch + "/parquet"):
-                os.makedirs(self._output_location + ch + "/parquet")
-            self.save_dfs_parquet(fname, output[ch], ch)
+            if not os.path.exists(self._output_location + ch + "/parquet/" + subdir):
+                os.makedirs(self._output_location + ch + "/parquet/" + subdir)
+            self.save_dfs_parquet(fname, output[ch], ch, subdir)
 
         # return dictionary with cutflows
         return {
@@ -1,9 +1,9 @@
-import importlib.resources
-import json
 import logging
 import os
 import pathlib
+import re
 import warnings
+from typing import Dict
 
 import awkward as ak
 import numpy as np
@@ -33,9 +33,25 @@ from boostedhiggs.corrections import (
     getJMSRVariables,
     met_factory,
 )
-from boostedhiggs.utils import VScore, get_pid_mask, match_H, match_Top, match_V, sigs
+from boostedhiggs.matching import delta_r_to, nearest
+from boostedhiggs.sidecars import EVENT_KEY, SIDECAR_FAMILIES
+from boostedhiggs.skimprocessor import get_skim_sums
+from boostedhiggs.templates import fill_templates, load_templates_config, make_templates_hist
+from boostedhiggs.utils import (
+    VScore,
+    get_bit_mask,
+    get_lhe_weights,
+    get_pid_mask,
+    get_year_config,
+    match_H,
+    match_Top,
+    match_V,
+    pack_bits,
+    sigs,
+    split_year,
+)
 
-from .run_tagger_inference import runInferenceTriton
+from .run_tagger_inference import runFinetunedHead, runInferenceTriton
 
 warnings.filterwarnings("ignore", message="Found duplicate branch ")
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -67,41 +83,83 @@ class HwwProcessor(processor.ProcessorABC):
         channels=["ele", "mu"],
         output_location="./outfiles/",
         inference=False,
+        finetuned_heads=None,
+        keep_hidneurons=False,
         systematics=False,
         getLPweights=False,
+        lp_ratio=None,
         uselooselep=False,
         fakevalidation=False,
+        sidecars=None,
+        templates=False,
+        templates_config=None,
+        store_trigger_bits=False,
+        jec_backend="coffea",
+        jerc_json=None,
     ):
-        self._year = year
-        self._yearmod = yearmod
         self._channels = channels
         self._systematics = systematics
         self._getLPweights = getLPweights
+        # Lund-plane data/MC ratios (e.g. ratio_{year}.root) to compute the LP weights in the processor instead of
+        # storing their inputs (see ``boostedhiggs/lundplane.py``)
+        self._lp_ratio = lp_ratio
         self._uselooselep = uselooselep
         self._fakevalidation = fakevalidation
 
+        # column families to write to their own event-keyed sidecar parquets (see ``SIDECAR_FAMILIES``)
+        self._sidecars = sidecars if sidecars is not None else []
+        for family in self._sidecars:
+            if family not in SIDECAR_FAMILIES:
+                raise ValueError(f"Unknown sidecar family {family}, choose from {list(SIDECAR_FAMILIES.keys())}")
+
         self._output_location = output_location
 
-        # trigger paths
-        with importlib.resources.path("boostedhiggs.data", "triggers.json") as path:
-            with open(path, "r") as f:
-                self._HLTs = json.load(f)[self._year]
+        # also store the packed HLT and MET filter bitmasks (see ``get_bitmap``) for trigger studies
+        self._store_trigger_bits = store_trigger_bits
 
-        # https://twiki.cern.ch/twiki/bin/view/CMS/MissingETOptionalFiltersRun2
-        with importlib.resources.path("boostedhiggs.data", "metfilters.json") as path:
-            with open(path, "r") as f:
-                self._metfilters = json.load(f)[self._year]
+        # JEC/JER from the pickled coffea factories or the correctionlib json (see ``get_jec_jets``)
+        self._jec_backend = jec_backend
+        # correctionlib json of the JEC/JER instead of the one of build_jerc.py (e.g. the POG ones)
+        self._jerc_json = jerc_json
+        if self._jerc_json is not None and self._jec_backend != "correctionlib":
+            raise ValueError("A JEC/JER json is only read with the correctionlib JEC backend")
 
-        if self._year == "2018":
-            self.dataset_per_ch = {
-                "ele": "EGamma",
-                "mu": "SingleMuon",
-            }
-        else:
-            self.dataset_per_ch = {
-                "ele": "SingleElectron",
-                "mu": "SingleMuon",
-            }
+        # fill the make_templates histograms directly (see ``boostedhiggs/templates.py``)
+        self._templates = templates
+        if self._templates:
+            self._templates_config = load_templates_config(templates_config)
+
+        # year-specific configuration, resolved again per chunk for multi-year filesets (see ``make_multiyear_fileset``)
+        self._set_year(year, yearmod)
+
+        # for tagger inference
+        self._inference = inference
+
+        # finetuned heads evaluated on the hidden neurons, stored as THWW_{version} (key: version, value: path to model.onnx)
+        self._finetuned_heads = finetuned_heads if finetuned_heads is not None else {}
+        # the 128 hidden neurons are only stored on request (or if there is no head to evaluate them with)
+        self._keep_hidneurons = keep_hidneurons or not self._finetuned_heads
+
+        # the template regions select on the score of the finetuned head of the config (stored as THWW_{version})
+        if self._templates:
+            head = self._templates_config["THWW"]
+            if not self._inference or head not in self._finetuned_heads:
+                raise ValueError(
+                    f"The templates select on THWW_{head}: run with --inference and --finetuned-heads {head}:<path to onnx>"
+                )
+        self.tagger_resources_path = str(pathlib.Path(__file__).parent.resolve()) + "/tagger_resources/"
+
+    def _set_year(self, year: str, yearmod: str = ""):
+        """Sets the trigger paths, MET filters and JEC names of a year (cached per year, see ``get_year_config``)."""
+        self._year = year
+        self._yearmod = yearmod
+
+        config = get_year_config(self._year)
+        self._HLTs = config["HLTs"]
+        self._metfilters = config["metfilters"]
+        self._hlt_bitmap = config["hlt_bitmap"]
+        self._metfilter_bitmap = config["metfilter_bitmap"]
+        self.dataset_per_ch = config["dataset_per_ch"]
 
         self.jecs = {
             "JES": "JES_jes",
@@ -121,24 +179,44 @@ class HwwProcessor(processor.ProcessorABC):
             "JES_Total": "JES_Total",
         }
 
-        # for tagger inference
-        self._inference = inference
-        self.tagger_resources_path = str(pathlib.Path(__file__).parent.resolve()) + "/tagger_resources/"
-
     @property
     def accumulator(self):
         return self._accumulator
 
-    def save_dfs_parquet(self, fname, dfs_dict, ch):
+    def save_dfs_parquet(self, fname, dfs_dict, ch, subdir=""):
         if self._output_location is not None:
             table = pa.Table.from_pandas(dfs_dict)
             if len(table) != 0:  # skip dataframes with empty entries
-                pq.write_table(table, self._output_location + ch + "/parquet/" + fname + ".parquet")
+                # store per-event weight vectors (e.g. weight_pdf) as fixed-size float32 lists
+                for i, field in enumerate(table.schema):
+                    if pa.types.is_list(field.type):
+                        column = table.column(i).combine_chunks()
+                        values = column.flatten().cast(pa.float32())
+                        table = table.set_column(
+                            i, field.name, pa.FixedSizeListArray.from_arrays(values, len(values) // len(column))
+                        )
+                pq.write_table(table, self._output_location + ch + "/parquet/" + subdir + fname + ".parquet")
+
+    def split_sidecars(self, df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """
+        Splits the requested column families off the nominal dataframe into sidecar dataframes
+        that carry the event key. The nominal dataframe is stored under the key "".
+        """
+        dfs = {"": df}
+        for family in self._sidecars:
+            columns = [column for column in df.columns if re.match(SIDECAR_FAMILIES[family], column)]
+            if len(columns) == 0:
+                continue
+            dfs[family] = df[EVENT_KEY + columns]
+            dfs[""] = dfs[""].drop(columns=columns)
+        return dfs
 
     def ak_to_pandas(self, output_collection: ak.Array) -> pd.DataFrame:
         output = pd.DataFrame()
         for field in ak.fields(output_collection):
-            output[field] = ak.to_numpy(output_collection[field])
+            values = ak.to_numpy(output_collection[field])
+            # 2D arrays (e.g. LHE weight vectors) are stored as one list per event
+            output[field] = list(values) if values.ndim > 1 else values
         return output
 
     def add_selection(self, name: str, sel: np.ndarray, channel: str = "all"):
@@ -163,7 +241,11 @@ class HwwProcessor(processor.ProcessorABC):
     def process(self, events: ak.Array):
         """Returns skimmed events which pass preselection cuts and with the branches listed in self._skimvars"""
 
-        dataset = events.metadata["dataset"]
+        # datasets of multi-year filesets are tagged with their year (see ``make_multiyear_fileset``)
+        dataset = events.metadata.get("sample", events.metadata["dataset"])
+        yeartag = events.metadata.get("year")
+        if yeartag is not None:
+            self._set_year(*split_year(yeartag))
 
         self.isMC = hasattr(events, "genWeight")
         self.isSignal = True if ("HToWW" in dataset) or ("ttHToNonbb" in dataset) else False
@@ -175,18 +257,28 @@ class HwwProcessor(processor.ProcessorABC):
 
         sumgenweight = ak.sum(events.genWeight) if self.isMC else nevents
 
-        # sum LHE weight
-        sumlheweight = {}
+        # LHE weight vectors as (nevents, nweights) arrays
+        lhe_scale_weights, lhe_pdf_weights = None, None
         if "LHEScaleWeight" in events.fields and self.isMC:
             if len(events.LHEScaleWeight[0]) == 9:
-                for i in range(len(events.LHEScaleWeight[0])):
-                    sumlheweight[i] = ak.sum(events.LHEScaleWeight[:, i] * events.genWeight)
+                lhe_scale_weights = get_lhe_weights(events, "LHEScaleWeight")
+        if "LHEPdfWeight" in events.fields and self.isMC and self.isSignal:
+            lhe_pdf_weights = get_lhe_weights(events, "LHEPdfWeight")
+
+        # sum LHE weight (one matrix reduction: weights^T . genWeight), empty for the samples without LHE weights
+        sumlheweight = np.zeros(0)
+        if lhe_scale_weights is not None:
+            sumlheweight = lhe_scale_weights.T @ ak.to_numpy(events.genWeight).astype(np.float64)
 
         # sum PDF weight
-        sumpdfweight = {}
-        if "LHEPdfWeight" in events.fields and self.isMC and self.isSignal:
-            for i in range(len(events.LHEPdfWeight[0])):
-                sumpdfweight[i] = ak.sum(events.LHEPdfWeight[:, i] * events.genWeight)
+        sumpdfweight = np.zeros(0)
+        if lhe_pdf_weights is not None:
+            sumpdfweight = lhe_pdf_weights.T @ ak.to_numpy(events.genWeight).astype(np.float64)
+
+        # skims keep the normalization sums of the full input they were made from
+        skim_sums = get_skim_sums(events.metadata)
+        if skim_sums is not None:
+            sumgenweight, sumlheweight, sumpdfweight = skim_sums
 
         # add genweight before filling cutflow
         if self.isMC:
@@ -197,12 +289,12 @@ class HwwProcessor(processor.ProcessorABC):
         # Trigger
         ######################
 
+        # all the HLT decisions of the year are packed once into a uint64 bitmask, the channel triggers are ORs of bits
+        hlt_bits = pack_bits(events.HLT, self._hlt_bitmap)
+
         trigger = {}
         for ch in ["ele", "mu_lowpt", "mu_highpt"]:
-            trigger[ch] = np.zeros(nevents, dtype="bool")
-            for t in self._HLTs[ch]:
-                if t in events.HLT.fields:
-                    trigger[ch] = trigger[ch] | events.HLT[t]
+            trigger[ch] = (hlt_bits & get_bit_mask(self._hlt_bitmap, self._HLTs[ch])) != 0
 
         trigger["ele"] = trigger["ele"] & (~trigger["mu_lowpt"]) & (~trigger["mu_highpt"])
         trigger["mu_highpt"] = trigger["mu_highpt"] & (~trigger["ele"])
@@ -212,11 +304,12 @@ class HwwProcessor(processor.ProcessorABC):
         # METFLITERS
         ######################
 
-        metfilters = np.ones(nevents, dtype="bool")
+        metfilter_bits = pack_bits(events.Flag, self._metfilter_bitmap)
         metfilterkey = "mc" if self.isMC else "data"
-        for mf in self._metfilters[metfilterkey]:
-            if mf in events.Flag.fields:
-                metfilters = metfilters & events.Flag[mf]
+        metfilter_mask = get_bit_mask(
+            self._metfilter_bitmap, [mf for mf in self._metfilters[metfilterkey] if mf in events.Flag.fields]
+        )
+        metfilters = (metfilter_bits & metfilter_mask) == metfilter_mask
 
         ######################
         # OBJECT DEFINITION
@@ -316,17 +409,24 @@ class HwwProcessor(processor.ProcessorABC):
         good_fatjets = good_fatjets[ak.argsort(good_fatjets.pt, ascending=False)]  # sort them by pt
 
         good_fatjets, jec_shifted_fatjetvars = get_jec_jets(
-            events, good_fatjets, self._year, not self.isMC, self.jecs, fatjets=True
+            events,
+            good_fatjets,
+            self._year,
+            not self.isMC,
+            self.jecs,
+            fatjets=True,
+            backend=self._jec_backend,
+            jerc_json=self._jerc_json,
         )
 
         # OBJECT: candidate fatjet
-        fj_idx_lep = ak.argmin(good_fatjets.delta_r(candidatelep_p4), axis=1, keepdims=True)
+        fj_idx_lep = nearest(good_fatjets, candidatelep_p4, keepdims=True)
         candidatefj = ak.firsts(good_fatjets[fj_idx_lep])
 
         jmsr_shifted_fatjetvars = get_jmsr(good_fatjets[fj_idx_lep], num_jets=1, year=self._year, isData=not self.isMC)
 
         # VH jet
-        minDeltaR = ak.argmin(candidatelep_p4.delta_r(good_fatjets), axis=1)  # similar to fj_idx_lep but without keepdims
+        minDeltaR = nearest(good_fatjets, candidatelep_p4)  # similar to fj_idx_lep but without keepdims
         fatJetIndices = ak.local_index(good_fatjets, axis=1)
         mask_candidatefj = fatJetIndices != minDeltaR
 
@@ -335,7 +435,16 @@ class HwwProcessor(processor.ProcessorABC):
         VH_fj = ak.firsts(good_fatjets[allScores == ak.max(masked, axis=1)])
 
         # OBJECT: AK4 jets
-        jets, jec_shifted_jetvars = get_jec_jets(events, events.Jet, self._year, not self.isMC, self.jecs, fatjets=False)
+        jets, jec_shifted_jetvars = get_jec_jets(
+            events,
+            events.Jet,
+            self._year,
+            not self.isMC,
+            self.jecs,
+            fatjets=False,
+            backend=self._jec_backend,
+            jerc_json=self._jerc_json,
+        )
         met = met_factory.build(events.MET, jets, {}) if self.isMC else events.MET
 
         ht = ak.sum(jets.pt, axis=1)
@@ -347,7 +456,8 @@ class HwwProcessor(processor.ProcessorABC):
             & ((jets.pt >= 50) | ((jets.pt < 50) & (jets.puId & 2) == 2))
         )
         goodjets = jets[jet_selector]
-        ak4_outside_ak8_selector = jets.delta_r(candidatefj) > 0.8
+        dr_jet_fj = delta_r_to(jets, candidatefj)
+        ak4_outside_ak8_selector = dr_jet_fj > 0.8
         ak4_outside_ak8 = jets[ak4_outside_ak8_selector]
 
         # OBJECT: VBF variables
@@ -357,7 +467,7 @@ class HwwProcessor(processor.ProcessorABC):
         mjj = (ak.firsts(jet1) + ak.firsts(jet2)).mass
 
         # OBJECT: b-jets (only for jets with abs(eta)<2.5)
-        bjet_selector = (jet_selector) & (jets.delta_r(candidatefj) > 0.8) & (abs(jets.eta) < 2.5)
+        bjet_selector = (jet_selector) & (dr_jet_fj > 0.8) & (abs(jets.eta) < 2.5)
         ak4_bjet_candidate = jets[bjet_selector]
 
         NumFatjets = ak.num(good_fatjets)
@@ -393,6 +503,10 @@ class HwwProcessor(processor.ProcessorABC):
         ######################
 
         variables = {
+            # event key
+            "run": events.run,
+            "luminosityBlock": events.luminosityBlock,
+            "event": events.event,
             # candidatefj
             "fj_lsf3": candidatefj.lsf3,
             "fj_VScore": VScore(candidatefj),
@@ -438,6 +552,10 @@ class HwwProcessor(processor.ProcessorABC):
             "VH_fj_VScore": VScore(VH_fj),
         }
 
+        if self._store_trigger_bits:
+            variables["hlt_bits"] = hlt_bits
+            variables["metfilter_bits"] = metfilter_bits
+
         fatjetvars = {
             "fj_pt": candidatefj.pt,
             "fj_eta": candidatefj.eta,
@@ -646,7 +764,7 @@ class HwwProcessor(processor.ProcessorABC):
                 if self.isSignal or "TT" in dataset or "WJets" in dataset:
                     """
                     For the QCD acceptance uncertainty:
-                    - we save the individual weights [0, 1, 3, 5, 7, 8]
+                    - we save the 9 weights as one fixed-size list column "weight_scale" (we use [0, 1, 3, 5, 7, 8, 4])
                     - postprocessing: we obtain sum_sumlheweight
                     - postprocessing: we obtain LHEScaleSumw: sum_sumlheweight[i] / sum_sumgenweight
                     - postprocessing:
@@ -656,29 +774,20 @@ class HwwProcessor(processor.ProcessorABC):
                     - then, take max/min of h0, h1, h3, h5, h7, h8 w.r.t h4: h_up and h_dn
                     - the uncertainty is the nominal histogram * h_up / h4
                     """
-                    scale_weights = {}
-                    if "LHEScaleWeight" in events.fields:
-                        # save individual weights
-                        if len(events.LHEScaleWeight[0]) == 9:
-                            for i in [0, 1, 3, 5, 7, 8, 4]:
-                                scale_weights[f"weight_scale{i}"] = events.LHEScaleWeight[:, i]
-                    variables = {**variables, **scale_weights}
+                    if lhe_scale_weights is not None:
+                        variables["weight_scale"] = lhe_scale_weights
 
                 if self.isSignal:
                     """
                     For the PDF acceptance uncertainty:
-                    - store 103 variations. 0-100 PDF values
+                    - store 103 variations as a single fixed-size list column "weight_pdf". 0-100 PDF values
                     - The last two values: alpha_s variations.
                     - you just sum the yield difference from the nominal in quadrature to get the total uncertainty.
                     e.g. https://github.com/LPC-HH/HHLooper/blob/master/python/prepare_card_SR_final.py#L258
                     and https://github.com/LPC-HH/HHLooper/blob/master/app/HHLooper.cc#L1488
                     """
-                    pdf_weights = {}
-                    if "LHEPdfWeight" in events.fields:
-                        # save individual weights
-                        for i in range(len(events.LHEPdfWeight[0])):
-                            pdf_weights[f"weight_pdf{i}"] = events.LHEPdfWeight[:, i]
-                    variables = {**variables, **pdf_weights}
+                    if lhe_pdf_weights is not None:
+                        variables["weight_pdf"] = lhe_pdf_weights
 
                 if self.isSignal:
                     add_ps_weight(
@@ -742,21 +851,29 @@ class HwwProcessor(processor.ProcessorABC):
                         candidatelep_p4[selection_ch],
                     )
 
-                    lpvars = {}
-                    for pfcandidx in range(pf_cands.shape[1]):
-                        lpvars[f"LP_pfcand{pfcandidx}_px"] = pf_cands[:, pfcandidx, 0]
-                        lpvars[f"LP_pfcand{pfcandidx}_py"] = pf_cands[:, pfcandidx, 1]
-                        lpvars[f"LP_pfcand{pfcandidx}_pz"] = pf_cands[:, pfcandidx, 2]
-                        lpvars[f"LP_pfcand{pfcandidx}_energy"] = pf_cands[:, pfcandidx, 3]
+                    if self._lp_ratio is not None:
+                        from boostedhiggs.lundplane import get_lund_reweighter
 
-                    for quarkidx in range(gen_parts_eta_phi.shape[1]):
-                        lpvars[f"LP_quark{quarkidx}_eta"] = gen_parts_eta_phi[:, quarkidx, 0]
-                        lpvars[f"LP_quark{quarkidx}_phi"] = gen_parts_eta_phi[:, quarkidx, 1]
+                        # only the weights (and their variations) are stored
+                        reweighter = get_lund_reweighter(self._lp_ratio.format(year=self._year + self._yearmod))
+                        lpvars = reweighter.weights(pf_cands, gen_parts_eta_phi, ak8_jets)
 
-                    lpvars["LP_fj_pt"] = ak8_jets[:, 0]
-                    lpvars["LP_fj_eta"] = ak8_jets[:, 1]
-                    lpvars["LP_fj_phi"] = ak8_jets[:, 2]
-                    lpvars["LP_fj_energy"] = ak8_jets[:, 3]
+                    else:
+                        lpvars = {}
+                        for pfcandidx in range(pf_cands.shape[1]):
+                            lpvars[f"LP_pfcand{pfcandidx}_px"] = pf_cands[:, pfcandidx, 0]
+                            lpvars[f"LP_pfcand{pfcandidx}_py"] = pf_cands[:, pfcandidx, 1]
+                            lpvars[f"LP_pfcand{pfcandidx}_pz"] = pf_cands[:, pfcandidx, 2]
+                            lpvars[f"LP_pfcand{pfcandidx}_energy"] = pf_cands[:, pfcandidx, 3]
+
+                        for quarkidx in range(gen_parts_eta_phi.shape[1]):
+                            lpvars[f"LP_quark{quarkidx}_eta"] = gen_parts_eta_phi[:, quarkidx, 0]
+                            lpvars[f"LP_quark{quarkidx}_phi"] = gen_parts_eta_phi[:, quarkidx, 1]
+
+                        lpvars["LP_fj_pt"] = ak8_jets[:, 0]
+                        lpvars["LP_fj_eta"] = ak8_jets[:, 1]
+                        lpvars["LP_fj_phi"] = ak8_jets[:, 2]
+                        lpvars["LP_fj_energy"] = ak8_jets[:, 3]
 
                     output[ch] = {**output[ch], **lpvars}
 
@@ -778,7 +895,13 @@ class HwwProcessor(processor.ProcessorABC):
                                 hidNeurons[key] = pnet_vars[key]
 
                         reg_mass = {"fj_ParT_mass": pnet_vars["fj_ParT_mass"]}
-                        output[ch] = {**output[ch], **scores, **reg_mass, **hidNeurons}
+                        output[ch] = {**output[ch], **scores, **reg_mass}
+
+                        for version, model_path in self._finetuned_heads.items():
+                            output[ch][f"THWW_{version}"] = runFinetunedHead(model_path, hidNeurons)
+
+                        if self._keep_hidneurons:
+                            output[ch] = {**output[ch], **hidNeurons}
 
             else:
                 output[ch] = {}
@@ -798,28 +921,49 @@ class HwwProcessor(processor.ProcessorABC):
                 if var_ in output[ch].keys():
                     output[ch][var_] = np.nan_to_num(output[ch][var_], nan=-1)
 
+        # fill the templates per channel (normalized when collected, see ``make_templates.py --from-processor``)
+        templates = {}
+        if self._templates:
+            for ch in self._channels:
+                templates[ch] = fill_templates(
+                    make_templates_hist(self._templates_config, dataset),
+                    output[ch],
+                    dataset,
+                    self._year + self._yearmod,
+                    ch,
+                    not self.isMC,
+                    self._templates_config,
+                )
+
         # now save pandas dataframes
         fname = events.behavior["__events_factory__"]._partition_key.replace("/", "_")
         fname = "condor_" + fname
 
-        for ch in self._channels:  # creating directories for each channel
-            if not os.path.exists(self._output_location + ch):
-                os.makedirs(self._output_location + ch)
-            if not os.path.exists(self._output_location + ch + "/parquet"):
-                os.makedirs(self._output_location + ch + "/parquet")
-            self.save_dfs_parquet(fname, output[ch], ch)
+        # chunks of multi-year filesets are written to one directory per year
+        subdir = "" if yeartag is None else f"{yeartag}/"
+
+        if self._output_location is not None:
+            for ch in self._channels:  # creating directories for each channel (and sidecar family)
+                for family, df in self.split_sidecars(output[ch]).items():
+                    label = ch if family == "" else f"{ch}_{family}"
+                    if not os.path.exists(self._output_location + label + "/parquet/" + subdir):
+                        os.makedirs(self._output_location + label + "/parquet/" + subdir)
+                    self.save_dfs_parquet(fname, df, label, subdir)
 
         # return dictionary with cutflows
+        metadata = {
+            "sumgenweight": sumgenweight,
+            "sumlheweight": sumlheweight,
+            "sumpdfweight": sumpdfweight,
+            "cutflows": self.cutflows,
+        }
+        if self._templates:
+            metadata["templates"] = templates
+
         return {
             dataset: {
                 "mc": self.isMC,
-                self._year
-                + self._yearmod: {
-                    "sumgenweight": sumgenweight,
-                    "sumlheweight": sumlheweight,
-                    "sumpdfweight": sumpdfweight,
-                    "cutflows": self.cutflows,
-                },
+                self._year + self._yearmod: metadata,
             }
         }
 
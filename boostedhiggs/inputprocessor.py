@@ -4,6 +4,7 @@ Skimmer for ParticleNet tagger inputs.
 Author(s): Cristina Mantilla Suarez, Raghav Kansal, Farouk Mokhtar.
 """
 
+import json
 import os
 import pathlib
 import warnings
@@ -11,15 +12,15 @@ from typing import Dict
 
 import awkward as ak
 import numpy as np
-import pandas as pd
-import pyarrow as pa
-import pyarrow.parquet as pq
 import uproot
 from coffea.analysis_tools import PackedSelection
 from coffea.nanoevents.methods import candidate
 from coffea.processor import ProcessorABC
 
 from .corrections import btagWPs
+from .get_tagger_inputs import get_pfcands_features, get_svs_features
+from .matching import delta_r_to, nearest
+from .ntuples import event_hash, write_parquet
 from .run_tagger_inference import runInferenceTriton
 from .tagger_gen_matching import match_H, match_QCD, match_Top, match_V
 from .utils import FILL_NONE_VALUE, add_selection_no_cutflow, sigs
@@ -34,11 +35,16 @@ np.seterr(invalid="ignore")
 class InputProcessor(ProcessorABC):
     """
     Produces a flat training ntuple from PFNano.
+
+    The columns are kept as numpy arrays and written to parquet through arrow (see ``boostedhiggs/ntuples.py``). With
+    ``save_pf_features`` the (normalized) PF candidate and SV inputs of the tagger are stored too, one fixed-size list
+    column per feature.
     """
 
-    def __init__(self, year, output_location="./outfiles/"):
+    def __init__(self, year, output_location="./outfiles/", save_pf_features=False):
         self._year = year
         self._output_location = output_location
+        self._save_pf_features = save_pf_features
 
         self.tagger_resources_path = str(pathlib.Path(__file__).parent.resolve()) + "/tagger_resources/"
 
@@ -116,21 +122,29 @@ class InputProcessor(ProcessorABC):
     def accumulator(self):
         return self._accumulator
 
-    def save_dfs_parquet(self, df, fname):
-        if self._output_location is not None:
-            PATH = f"{self._output_location}/parquet/"
-            if not os.path.exists(PATH):
-                os.makedirs(PATH)
+    def save_parquet(self, skimmed_vars: Dict[str, np.ndarray], fname: str) -> int:
+        """Writes the events without NaNs (very few events have a NaN genjetmass) and returns their number."""
+        if self._output_location is None:
+            return 0
+        return write_parquet(skimmed_vars, f"{self._output_location}/parquet/{fname}.parquet")
 
-            table = pa.Table.from_pandas(df)
-            if len(table) != 0:  # skip dataframes with empty entries
-                pq.write_table(table, f"{PATH}/{fname}.parquet")
+    def get_pf_features(self, events: ak.Array, fj_idx_lep, model_name: str) -> Dict[str, np.ndarray]:
+        """Returns the PF candidate and SV input features of the tagger ``model_name``, as (events, candidates) arrays."""
+        with open(f"{self.tagger_resources_path}/triton_config_{model_name}.json") as f:
+            triton_config = json.load(f)
 
-    def ak_to_pandas(self, output_collection: ak.Array) -> pd.DataFrame:
-        output = pd.DataFrame()
-        for field in ak.fields(output_collection):
-            output[field] = ak.to_numpy(output_collection[field])
-        return output
+        with open(f"{self.tagger_resources_path}/{triton_config['model_name']}.json") as f:
+            tagger_vars = json.load(f)
+
+        feature_dict = {
+            **get_pfcands_features(tagger_vars, events, fj_idx_lep, "FatJet", "FatJetPFCands"),
+            **get_svs_features(tagger_vars, events, fj_idx_lep, "FatJet", "FatJetSVs"),
+        }
+        return {
+            key: feature_dict[key]
+            for input_name in tagger_vars["input_names"]
+            for key in tagger_vars[input_name]["var_names"]
+        }
 
     def dump_root(self, skimmed_vars: Dict[str, np.array], fname: str) -> None:
         """
@@ -195,7 +209,7 @@ class InputProcessor(ProcessorABC):
         SecondFatjet = ak.firsts(good_fatjets[:, 1:2])
 
         # candidatefj
-        fj_idx_lep = ak.argmin(good_fatjets.delta_r(candidatelep_p4), axis=1, keepdims=True)
+        fj_idx_lep = nearest(good_fatjets, candidatelep_p4, keepdims=True)
         candidatefj = ak.firsts(good_fatjets[fj_idx_lep])
 
         # ak4 jets
@@ -211,7 +225,7 @@ class InputProcessor(ProcessorABC):
         goodjets = events.Jet[ak4_jet_selector_no_btag]
         ht = ak.sum(goodjets.pt, axis=1)
 
-        dr_jet_lepfj = goodjets.delta_r(candidatefj)
+        dr_jet_lepfj = delta_r_to(goodjets, candidatefj)
         ak4_outside_ak8 = goodjets[dr_jet_lepfj > 0.8]
         NumOtherJets = ak.num(ak4_outside_ak8)
 
@@ -365,31 +379,32 @@ class InputProcessor(ProcessorABC):
             except Exception:
                 continue
 
+        # to split the events of the training datasets (see ``boostedhiggs/training_dataset.py``)
+        EventVars = {"event_hash": event_hash(events.run, events.luminosityBlock, events.event)}
+
         # combine all the input variables
-        skimmed_vars = {**FatJetVars, **GenVars, **METVars, **LepVars, **Others}
+        skimmed_vars = {**EventVars, **FatJetVars, **GenVars, **METVars, **LepVars, **Others}
 
         # apply selections
         selection = PackedSelection()
         add_selection_no_cutflow("fjselection", (candidatefj.pt > 200), selection)
 
-        if np.sum(selection.all(*selection.names)) == 0:
+        sel = selection.all(*selection.names)
+        nsel = np.sum(sel)
+        if nsel == 0:
             return {}
 
-        skimmed_vars = {
-            key: np.squeeze(np.array(value[selection.all(*selection.names)])) for (key, value) in skimmed_vars.items()
-        }
+        # one value per event
+        skimmed_vars = {key: np.asarray(value[sel]).reshape(nsel) for (key, value) in skimmed_vars.items()}
         for model_name in ["ak8_MD_vminclv2ParT_manual_fixwrap_all_nodes"]:
             pnet_vars = runInferenceTriton(
                 self.tagger_resources_path,
-                events[selection.all(*selection.names)],
-                fj_idx_lep[selection.all(*selection.names)],
+                events[sel],
+                fj_idx_lep[sel],
                 model_name=model_name,
             )
 
-            # pnet_df = self.ak_to_pandas(pnet_vars)
-            pnet_df = pd.DataFrame(pnet_vars)
-
-            scores = {"fj_ParT_score": (pnet_df[sigs].sum(axis=1)).values}
+            scores = {"fj_ParT_score": np.sum([pnet_vars[sig] for sig in sigs], axis=0)}
             reg_mass = {"fj_ParT_mass": pnet_vars["fj_ParT_mass"]}
 
             hidNeurons = {}
@@ -399,23 +414,17 @@ class InputProcessor(ProcessorABC):
 
             skimmed_vars = {**skimmed_vars, **scores, **reg_mass, **hidNeurons}
 
-        for key in skimmed_vars:
-            skimmed_vars[key] = skimmed_vars[key].squeeze().tolist()
-
-        # convert output to pandas
-        df = pd.DataFrame(skimmed_vars)
-
-        df = df.dropna()  # very few events would have genjetmass NaN for some reason
+            if self._save_pf_features:
+                skimmed_vars = {**skimmed_vars, **self.get_pf_features(events[sel], fj_idx_lep[sel], model_name)}
 
         print(f"convert: {time.time() - start:.1f}s")
 
-        print(df)
-
         # save the output
         fname = events.behavior["__events_factory__"]._partition_key.replace("/", "_")
         fname = "condor_" + fname
 
-        self.save_dfs_parquet(df, fname)
+        nsaved = self.save_parquet(skimmed_vars, fname)
+        print(f"{nsaved} / {nsel} events saved")
 
         print(f"dump parquet: {time.time() - start:.1f}s")
 
@@ -0,0 +1,170 @@
+"""
+JEC/JER evaluated with correctionlib, as an alternative to the pickled coffea ``CorrectedJetsFactory`` of
+``build_jec.py`` (``jec_compiled.pkl``).
+
+The corrections are read from a correctionlib json with the names of the POG ``jet_jerc.json.gz`` and
+``fatJet_jerc.json.gz``, by default the text files of ``build_jec.py`` converted once by ``build_jerc.py``
+(``boostedhiggs/data/jerc_{year}_UL.json.gz``).
+All the jets of a chunk are corrected at once on flat arrays, following ``CorrectedJetsFactory``:
+
+- ``pt_jec = L1L2L3Res(JetA, JetEta, pt_raw, Rho) * pt_raw`` (and the same for the mass)
+- ``pt_jer = smear * pt_jec``, with the hybrid smearing (scaling if the jet is matched to a generator-level jet, else
+  stochastic) and the same random numbers as coffea (seeded from the first and last jet pT of the chunk)
+- ``JES_{source}``: ``(1 +- unc(JetEta, pt_jer)) * pt_jer``, only for the requested sources
+"""
+
+import functools
+import os
+from typing import Dict, List, Optional
+
+import awkward as ak
+import correctionlib
+import numpy as np
+
+JERC_TAGS = {
+    "2016APV": {"jec": "Summer19UL16APV_V7_MC", "jer": "Summer20UL16APV_JRV3_MC"},
+    "2016": {"jec": "Summer19UL16_V7_MC", "jer": "Summer20UL16_JRV3_MC"},
+    "2017": {"jec": "Summer19UL17_V5_MC", "jer": "Summer19UL17_JRV3_MC"},
+    "2018": {"jec": "Summer19UL18_V5_MC", "jer": "Summer19UL18_JRV2_MC"},
+}
+
+# (jet type, jet type of the regrouped JES sources), as in ``build_jec.py`` the fatjets use the AK4 regrouped sources
+JET_TYPES = {
+    "ak4": ("AK4PFchs", "AK4PFchs"),
+    "ak8": ("AK8PFPuppi", "AK4PFchs"),
+}
+
+# as in coffea's CorrectedJetsFactory
+MIN_JET_ENERGY = np.float32(1e-2)
+
+# index of the jet energy resolution scale factor variations in ``jer_smear`` (as in coffea)
+JERSF_VARIATIONS = ["nom", "up", "down"]
+
+
+def jerc_filename(year: str) -> str:
+    ul_year = "2016preVFP" if year == "2016APV" else ("2016postVFP" if year == "2016" else year)
+    return f"jerc_{ul_year}_UL.json.gz"
+
+
+@functools.lru_cache(maxsize=None)
+def load_jerc(year: str, path: Optional[str] = None) -> correctionlib.CorrectionSet:
+    """Loads the correctionlib JEC/JER json of a year once per process (``boostedhiggs/data`` by default)."""
+    if path is None:
+        path = os.path.join(os.path.dirname(__file__), "data", jerc_filename(year))
+    return correctionlib.CorrectionSet.from_file(path)
+
+
+def _find(cset: correctionlib.CorrectionSet, name: str, suffix: str):
+    """Returns the correction ``name``, or the only one of the set ending with ``suffix`` (e.g. for other JER versions)."""
+    # correctionlib raises an IndexError for missing keys, so look the names up in the lists of keys
+    corrections = {key: cset for key in cset}
+    corrections.update({key: cset.compound for key in cset.compound})
+    if name in corrections:
+        return corrections[name][name]
+
+    candidates = [key for key in corrections if key.endswith(suffix)]
+    if len(candidates) != 1:
+        raise KeyError(f"No correction {name} (or unique *{suffix}) in the JEC/JER json: {candidates}")
+    return corrections[candidates[0]][candidates[0]]
+
+
+def _evaluate(correction, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+    return correction.evaluate(*[inputs[var.name] for var in correction.inputs])
+
+
+def jer_smear(
+    jersf: np.ndarray, pt: np.ndarray, pt_gen: np.ndarray, eta: np.ndarray, resolution: np.ndarray, rand: np.ndarray
+) -> np.ndarray:
+    """The (hybrid) JER smearing factor of coffea's ``jer_smear``."""
+    deltaPtRel = (pt - pt_gen) / pt
+    doHybrid = (pt_gen > 0) & (np.abs(deltaPtRel) < 3 * resolution)
+
+    detSmear = 1 + (jersf - 1) * deltaPtRel
+    stochSmear = 1 + np.sqrt(np.maximum(jersf**2 - 1, 0)) * resolution * rand
+
+    min_jet_pt = MIN_JET_ENERGY / np.cosh(eta)
+    smearfact = np.where(doHybrid, detSmear, stochSmear)
+    return np.where((smearfact * pt) < min_jet_pt, min_jet_pt / pt, smearfact)
+
+
+class JERCEvaluator:
+    """
+    Corrects the jets of one type (``ak4`` or ``ak8``) of a year with the correctionlib JEC/JER json.
+
+    ``shifts`` are the names of the variations to compute, as in ``CorrectedJetsFactory`` (``JER``, ``JES_jes`` for the
+    total uncertainty, ``JES_{source}`` for the regrouped sources).
+    """
+
+    def __init__(self, year: str, jet_type: str = "ak8", path: Optional[str] = None):
+        self.year = year
+        self.jet_type, self.sources_jet_type = JET_TYPES[jet_type]
+        self.cset = load_jerc(year, path)
+
+        jec, jer = JERC_TAGS[year]["jec"], JERC_TAGS[year]["jer"]
+        self.jec = _find(self.cset, f"{jec}_L1L2L3Res_{self.jet_type}", f"_MC_L1L2L3Res_{self.jet_type}")
+        self.resolution = _find(self.cset, f"{jer}_PtResolution_{self.jet_type}", f"_MC_PtResolution_{self.jet_type}")
+        self.scale_factor = _find(self.cset, f"{jer}_ScaleFactor_{self.jet_type}", f"_MC_ScaleFactor_{self.jet_type}")
+        self._jec_tag = jec
+
+    def uncertainty(self, shift: str):
+        if shift == "JES_jes":
+            suffix = f"_MC_Total_{self.jet_type}"
+            return _find(self.cset, f"{self._jec_tag}{suffix}", suffix)
+
+        source = shift[len("JES_") :]
+        suffix = f"_MC_Regrouped_{source}_{self.sources_jet_type}"
+        return _find(self.cset, f"{self._jec_tag}{suffix}", suffix)
+
+    def correct(self, jets, event_rho: ak.Array, shifts: List[str]):
+        """
+        Returns the flat corrected pt and mass of the jets ({"": (pt, mass), "{shift}_{up|down}": (pt, mass)}) and the
+        counts to unflatten them. The jets need ``rawFactor``, ``area`` and ``matched_gen``.
+        """
+        counts = ak.num(jets.pt)
+        pt_orig = ak.to_numpy(ak.flatten(jets.pt))
+        raw = 1 - ak.to_numpy(ak.flatten(jets.rawFactor))
+        pt_raw = raw * pt_orig
+        mass_raw = raw * ak.to_numpy(ak.flatten(jets.mass))
+        eta = ak.to_numpy(ak.flatten(jets.eta))
+        pt_gen = ak.to_numpy(ak.flatten(ak.values_astype(ak.fill_none(jets.matched_gen.pt, 0), np.float32)))
+
+        inputs = {
+            "JetA": ak.to_numpy(ak.flatten(jets.area)),
+            "JetEta": eta,
+            "JetPt": pt_raw,
+            "Rho": np.repeat(ak.to_numpy(event_rho), counts),
+        }
+        jec = _evaluate(self.jec, inputs)
+        pt_jec, mass_jec = jec * pt_raw, jec * mass_raw
+
+        inputs["JetPt"] = pt_jec
+        resolution = _evaluate(self.resolution, inputs)
+        # same random numbers as coffea's CorrectedJetsFactory
+        seeds = pt_orig[[0, -1]].view("i4")
+        rand = np.random.Generator(np.random.PCG64(seeds)).normal(size=len(pt_orig)).astype(np.float32)
+
+        smear = {}
+        for variation in (JERSF_VARIATIONS if "JER" in shifts else ["nom"]):
+            jersf = self.scale_factor.evaluate(eta, variation)
+            smear[variation] = jer_smear(jersf, pt_jec, pt_gen, eta, resolution, rand)
+
+        pt, mass = smear["nom"] * pt_jec, smear["nom"] * mass_jec
+        out = {"": (pt, mass)}
+        for shift in shifts:
+            if shift == "JER":
+                for variation in ["up", "down"]:
+                    out[f"JER_{variation}"] = (smear[variation] * pt_jec, smear[variation] * mass_jec)
+                continue
+
+            unc = _evaluate(self.uncertainty(shift), {"JetEta": eta, "JetPt": pt})
+            out[f"{shift}_up"] = ((1 + unc) * pt, (1 + unc) * mass)
+            out[f"{shift}_down"] = ((1 - unc) * pt, (1 - unc) * mass)
+
+        # same precision as the NanoAOD (and coffea) jets
+        out = {key: (pt.astype(np.float32), mass.astype(np.float32)) for key, (pt, mass) in out.items()}
+        return out, counts
+
+
+@functools.lru_cache(maxsize=None)
+def get_jerc_evaluator(year: str, jet_type: str, path: Optional[str] = None) -> JERCEvaluator:
+    return JERCEvaluator(year, jet_type, path)
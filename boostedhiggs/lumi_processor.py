@@ -1,8 +1,10 @@
 import warnings
+from typing import Dict, List
 
 import awkward as ak
 import numpy as np
 from coffea import processor
+from coffea.lumi_tools import LumiList
 
 warnings.filterwarnings("ignore", message="Found duplicate branch ")
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -11,30 +13,83 @@ warnings.filterwarnings("ignore", message="divide by zero encountered in log")
 np.seterr(invalid="ignore")
 
 
+def pack_runs_lumis(runs, lumis) -> np.ndarray:
+    """Packs (run, lumi section) pairs into int64 keys ``run << 32 | lumi``, ordered by run then lumi section."""
+    return (np.asarray(runs, dtype=np.int64) << 32) | np.asarray(lumis, dtype=np.int64)
+
+
+class LumiSet:
+    """
+    Set of (run, lumi section) pairs, stored as a sorted array of unique packed keys (see ``pack_runs_lumis``).
+
+    Added with ``+`` (a vectorized union), so that the coffea accumulator merges the sets of all the chunks.
+    """
+
+    def __init__(self, packed=None):
+        self.packed = np.unique(np.asarray(packed, dtype=np.int64)) if packed is not None else np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_runs_lumis(cls, runs, lumis) -> "LumiSet":
+        return cls(pack_runs_lumis(runs, lumis))
+
+    @property
+    def runs(self) -> np.ndarray:
+        return (self.packed >> 32).astype(np.uint32)
+
+    @property
+    def lumis(self) -> np.ndarray:
+        return (self.packed & 0xFFFFFFFF).astype(np.uint32)
+
+    def __len__(self) -> int:
+        return len(self.packed)
+
+    def __add__(self, other: "LumiSet") -> "LumiSet":
+        out = LumiSet()
+        out.packed = np.union1d(self.packed, other.packed)
+        return out
+
+    def __iadd__(self, other: "LumiSet") -> "LumiSet":
+        self.packed = np.union1d(self.packed, other.packed)
+        return self
+
+    def to_lumilist(self) -> LumiList:
+        return LumiList(runs=self.runs, lumis=self.lumis)
+
+    def to_json(self) -> Dict[str, List[List[int]]]:
+        """Returns the lumi sections in the format of the CMS lumi masks, {run: [[first, last], ...]}."""
+        runs, lumis = self.runs, self.lumis
+        # a new range starts at each change of run or gap in the lumi sections
+        starts = np.flatnonzero(np.r_[True, (np.diff(runs) != 0) | (np.diff(lumis.astype(np.int64)) != 1)])
+        ends = np.r_[starts[1:], len(runs)] - 1
+
+        out = {}
+        for run, first, last in zip(runs[starts].tolist(), lumis[starts].tolist(), lumis[ends].tolist()):
+            out.setdefault(str(run), []).append([first, last])
+        return out
+
+
 class LumiProcessor(processor.ProcessorABC):
     def __init__(
         self,
         year="2017",
+        yearmod="",
         output_location="./outfiles/",
     ):
         self._year = year
+        self._yearmod = yearmod
 
     @property
     def accumulator(self):
         return self._accumulator
 
     def process(self, events: ak.Array):
-        """Returns skimmed events which pass preselection cuts and with the branches listed in self._skimvars"""
+        """Returns the (run, lumi section) pairs of the events (a ``LumiSet``)."""
         dataset = events.metadata["dataset"]
-        # isMC = hasattr(events, "genWeight")
-        # nevents = len(events)
 
-        # lumilist = coffea.lumi_tools.LumiList(events.run.to_numpy(), events.luminosityBlock.to_numpy())
-        lumilist = set(zip(events.run, events.luminosityBlock))
+        lumilist = LumiSet.from_runs_lumis(events.run, events.luminosityBlock)
 
         # TODO: if possible, get lumi value per file and accumulate
-        # return dictionary with cutflows
-        return {dataset: {self._year: {"lumilist": lumilist}}}
+        return {dataset: {self._year + self._yearmod: {"lumilist": lumilist}}}
 
     def postprocess(self, accumulator):
         return accumulator
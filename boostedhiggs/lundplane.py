@@ -0,0 +1,380 @@
+"""
+Compiled Lund-plane declustering and reweighting of the (lepton-subtracted) HWW jets, without fastjet.
+
+Follows the Lund-plane reweighting method (https://github.com/oamram/LundReweighting) on the inputs of
+``getLPweights`` (the padded PF candidates of the jet, the generator-level quarks and the jet):
+
+- the PF candidates of each jet are reclustered with the exclusive kt algorithm (R = 0.8) into as many subjets as
+  generator-level quarks, each quark is matched to its nearest subjet (a bad match if ΔR > 0.2 or if two quarks match
+  the same subjet)
+- the constituents of each subjet are reclustered with Cambridge/Aachen and declustered along the harder branch: each
+  splitting is a point (ln(0.8/ΔR), ln(kt)) of the primary Lund plane, kt = pT(softer) ΔR
+- the weight of the jet is the product of the data/MC ratios of its splittings, binned in (subjet pT, ln(0.8/ΔR),
+  ln(kt)), with the subjet pT rescaled so that the subjets add up to the jet pT; the jets with a bad match have a
+  weight of 1
+
+The ratios are read from the ``ratio_{year}.root`` files of the LundReweighting package (``ratio_nom``,
+``ratio_sys_tot_up``, ``ratio_sys_tot_down``). The pT extrapolation fits of that package are TF1s that cannot be
+evaluated without ROOT, the subjets above the last pT bin use the last bin instead. The statistical uncertainty is the
+spread of the weights over toys of the ratios smeared within their uncertainties. The weights are not normalized, the
+mean weight of a sample has to be divided out when computing efficiencies.
+
+Run on the LP_ columns of parquets made with ``--getLPweights`` (without ``--lp-ratio``) as:
+    python -m boostedhiggs.lundplane --ratio ratio_2017.root --input outfiles/*_mu.parquet --outdir LP
+"""
+
+import functools
+from typing import Dict, Tuple
+
+import numba
+import numpy as np
+
+# ΔR of the subjets to the generator-level quarks
+MATCH_DR = 0.2
+
+# radius of the exclusive kt reclustering (as for the AK8 jets) and of the Lund-plane coordinates
+JET_R = 0.8
+
+# the rapidity of particles with E <= |pz| (as in fastjet)
+MAX_RAP = 1e5
+
+
+@numba.njit(cache=True)
+def _kinematics(px, py, pz, E):
+    pt2 = px * px + py * py
+    phi = np.arctan2(py, px)
+    if E <= abs(pz):
+        rap = MAX_RAP if pz >= 0 else -MAX_RAP
+    else:
+        rap = 0.5 * np.log((E + pz) / (E - pz))
+    return pt2, rap, phi
+
+
+@numba.njit(cache=True)
+def _delta_r2(rap1, phi1, rap2, phi2):
+    drap = rap1 - rap2
+    dphi = abs(phi1 - phi2)
+    if dphi > np.pi:
+        dphi = 2 * np.pi - dphi
+    return drap * drap + dphi * dphi
+
+
+@numba.njit(cache=True)
+def _cluster(px, py, pz, E, p, R, njets):
+    """
+    Clusters the particles with the generalized kt algorithm of power ``p`` (1: kt, 0: Cambridge/Aachen) and E-scheme
+    recombination, until ``njets`` jets remain (the recombinations with the beam remove a jet, as in fastjet's
+    exclusive jets). Returns the momenta of the nodes (the particles then the merged pseudojets), their children (-1 for
+    the particles) and the remaining jets, ordered by decreasing pT.
+    """
+    n = len(px)
+    size = max(2 * n - 1, 1)
+    npx, npy, npz, nE = np.zeros(size), np.zeros(size), np.zeros(size), np.zeros(size)
+    rap, phi, kt2p = np.zeros(size), np.zeros(size), np.zeros(size)
+    child1, child2 = np.full(size, -1), np.full(size, -1)
+    active = np.zeros(size, dtype=np.bool_)
+    nn, nndist = np.full(size, -1), np.full(size, np.inf)
+    R2 = R * R
+
+    for i in range(n):
+        npx[i], npy[i], npz[i], nE[i] = px[i], py[i], pz[i], E[i]
+        pt2, rap[i], phi[i] = _kinematics(px[i], py[i], pz[i], E[i])
+        kt2p[i] = pt2**p
+        active[i] = True
+
+    for i in range(n):
+        for j in range(n):
+            if j != i:
+                d = min(kt2p[i], kt2p[j]) * _delta_r2(rap[i], phi[i], rap[j], phi[j]) / R2
+                if d < nndist[i]:
+                    nndist[i], nn[i] = d, j
+
+    nactive, nnodes = n, n
+    while nactive > njets:
+        best, bi, beam = np.inf, -1, False
+        for i in range(nnodes):
+            if active[i]:
+                if nndist[i] < best:
+                    best, bi, beam = nndist[i], i, False
+                if kt2p[i] < best:
+                    best, bi, beam = kt2p[i], i, True
+
+        if beam:
+            active[bi] = False
+            nactive -= 1
+            for i in range(nnodes):
+                if active[i] and nn[i] == bi:
+                    nndist[i], nn[i] = np.inf, -1
+                    for j in range(nnodes):
+                        if active[j] and j != i:
+                            d = min(kt2p[i], kt2p[j]) * _delta_r2(rap[i], phi[i], rap[j], phi[j]) / R2
+                            if d < nndist[i]:
+                                nndist[i], nn[i] = d, j
+            continue
+
+        bj = nn[bi]
+        k = nnodes
+        nnodes += 1
+        npx[k], npy[k], npz[k], nE[k] = npx[bi] + npx[bj], npy[bi] + npy[bj], npz[bi] + npz[bj], nE[bi] + nE[bj]
+        pt2, rap[k], phi[k] = _kinematics(npx[k], npy[k], npz[k], nE[k])
+        kt2p[k] = pt2**p
+        child1[k], child2[k] = bi, bj
+        active[bi], active[bj], active[k] = False, False, True
+        nactive -= 1
+
+        # update the nearest neighbours
+        for i in range(nnodes - 1):
+            if not active[i]:
+                continue
+            d = min(kt2p[i], kt2p[k]) * _delta_r2(rap[i], phi[i], rap[k], phi[k]) / R2
+            if d < nndist[k]:
+                nndist[k], nn[k] = d, i
+            if nn[i] == bi or nn[i] == bj:
+                nndist[i], nn[i] = np.inf, -1
+                for j in range(nnodes):
+                    if active[j] and j != i:
+                        dj = min(kt2p[i], kt2p[j]) * _delta_r2(rap[i], phi[i], rap[j], phi[j]) / R2
+                        if dj < nndist[i]:
+                            nndist[i], nn[i] = dj, j
+            elif d < nndist[i]:
+                nndist[i], nn[i] = d, k
+
+    jets = np.flatnonzero(active[:nnodes])
+    jets = jets[np.argsort(-(npx[jets] ** 2 + npy[jets] ** 2))]
+    return npx[:nnodes], npy[:nnodes], npz[:nnodes], nE[:nnodes], child1[:nnodes], child2[:nnodes], jets
+
+
+@numba.njit(cache=True)
+def _leaves(child1, child2, node):
+    """Returns the particles (leaves) of a node of the clustering."""
+    leaves = []
+    stack = [node]
+    while len(stack) > 0:
+        i = stack.pop()
+        if child1[i] < 0:
+            leaves.append(i)
+        else:
+            stack.append(child1[i])
+            stack.append(child2[i])
+    return np.array(leaves, dtype=np.int64)
+
+
+@numba.njit(cache=True)
+def _lund_splittings_kernel(px, py, pz, E, nprongs, max_splittings):
+    nevents = px.shape[0]
+    maxprongs = max(np.max(nprongs), 1) if nevents > 0 else 1
+    subjets = np.zeros((nevents, maxprongs, 3))  # pt, eta, phi
+    splittings = np.zeros((nevents, maxprongs, max_splittings, 2))
+    nsplittings = np.zeros((nevents, maxprongs), dtype=np.int64)
+
+    for ev in range(nevents):
+        cands = np.flatnonzero(E[ev] > 0)
+        if nprongs[ev] == 0 or len(cands) == 0:
+            continue
+
+        cpx, cpy, cpz, cE = px[ev][cands], py[ev][cands], pz[ev][cands], E[ev][cands]
+        spx, spy, spz, sE, schild1, schild2, sub = _cluster(cpx, cpy, cpz, cE, 1.0, JET_R, nprongs[ev])
+        for s in range(len(sub)):
+            node = sub[s]
+            pt = np.sqrt(spx[node] ** 2 + spy[node] ** 2)
+            subjets[ev, s, 0] = pt
+            subjets[ev, s, 1] = np.arcsinh(spz[node] / pt) if pt > 0 else 0.0
+            subjets[ev, s, 2] = np.arctan2(spy[node], spx[node])
+
+            # Cambridge/Aachen reclustering of the subjet constituents into one jet
+            leaves = _leaves(schild1, schild2, node)
+            lpx, lpy, lpz, lE, child1, child2, root = _cluster(
+                cpx[leaves], cpy[leaves], cpz[leaves], cE[leaves], 0.0, 1000.0, 1
+            )
+
+            # primary declustering, following the harder branch
+            i = root[0]
+            while child1[i] >= 0 and nsplittings[ev, s] < max_splittings:
+                a, b = child1[i], child2[i]
+                pt2a, rapa, phia = _kinematics(lpx[a], lpy[a], lpz[a], lE[a])
+                pt2b, rapb, phib = _kinematics(lpx[b], lpy[b], lpz[b], lE[b])
+                if pt2b > pt2a:
+                    a, b, pt2b = b, a, pt2a
+                dr = np.sqrt(_delta_r2(rapa, phia, rapb, phib))
+                splittings[ev, s, nsplittings[ev, s], 0] = np.log(JET_R / dr)
+                splittings[ev, s, nsplittings[ev, s], 1] = np.log(np.sqrt(pt2b) * dr)
+                nsplittings[ev, s] += 1
+                i = a
+
+    return subjets, splittings, nsplittings
+
+
+def lund_splittings(pf_cands: np.ndarray, nprongs: np.ndarray, max_splittings: int = 100):
+    """
+    Returns the subjets (pt, eta, phi) of each jet (exclusive kt into ``nprongs`` subjets, ordered by pt), the
+    primary Lund-plane splittings (ln(0.8/ΔR), ln(kt)) of each subjet and their number. ``pf_cands`` are the
+    (px, py, pz, E) of the PF candidates of each jet, padded with zeros, as returned by ``getLPweights``.
+    """
+    pf_cands = np.asarray(pf_cands, dtype=np.float64)
+    return _lund_splittings_kernel(
+        np.ascontiguousarray(pf_cands[..., 0]),
+        np.ascontiguousarray(pf_cands[..., 1]),
+        np.ascontiguousarray(pf_cands[..., 2]),
+        np.ascontiguousarray(pf_cands[..., 3]),
+        np.asarray(nprongs, dtype=np.int64),
+        max_splittings,
+    )
+
+
+def match_quarks(subjets: np.ndarray, gen_parts_eta_phi: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """
+    Returns the jets with a bad match: a quark without a subjet within ``MATCH_DR``, or two quarks matched to the same
+    subjet.
+    """
+    deta = gen_parts_eta_phi[:, :, None, 0] - subjets[:, None, :, 1]
+    dphi = (gen_parts_eta_phi[:, :, None, 1] - subjets[:, None, :, 2] + np.pi) % (2 * np.pi) - np.pi
+    dr = np.sqrt(deta**2 + dphi**2)
+    # only the subjets of the jet (fewer than the quarks if the jet has fewer PF candidates)
+    dr = np.where(subjets[:, None, :, 0] > 0, dr, np.inf)
+
+    idx = np.argmin(dr, axis=2)
+    bad = valid & (np.take_along_axis(dr, idx[..., None], axis=2)[..., 0] > MATCH_DR)
+    matched = np.where(valid, idx, -1 - np.arange(valid.shape[1])[None, :])
+    shared = np.any(matched[:, :, None] == matched[:, None, :], axis=2).sum(axis=1) > valid.shape[1]
+    return np.any(bad, axis=1) | shared
+
+
+class LundPlaneReweighter:
+    """
+    Data/MC Lund-plane ratios binned in (subjet pt, ln(0.8/ΔR), ln(kt)), with their systematic variations and
+    statistical uncertainties.
+    """
+
+    def __init__(
+        self,
+        edges: Tuple[np.ndarray, np.ndarray, np.ndarray],
+        ratio: np.ndarray,
+        ratio_sys_up: np.ndarray,
+        ratio_sys_down: np.ndarray,
+        ratio_err: np.ndarray,
+    ):
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.ratios = {"": ratio, "_sys_up": ratio_sys_up, "_sys_down": ratio_sys_down}
+        self.ratio_err = ratio_err
+
+    @classmethod
+    def from_root(cls, path: str) -> "LundPlaneReweighter":
+        import uproot
+
+        with uproot.open(path) as f:
+            h_ratio = f["ratio_nom"]
+            return cls(
+                [h_ratio.axis(ax).edges() for ax in ["x", "y", "z"]],
+                h_ratio.values(),
+                f["ratio_sys_tot_up"].values(),
+                f["ratio_sys_tot_down"].values(),
+                h_ratio.errors(),
+            )
+
+    def _bins(self, values: np.ndarray, axis: int) -> np.ndarray:
+        # the values beyond the binning use the first or last bin
+        edges = self.edges[axis]
+        return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+    def weights(
+        self,
+        pf_cands: np.ndarray,
+        gen_parts_eta_phi: np.ndarray,
+        ak8_jets: np.ndarray,
+        ntoys: int = 100,
+        seed: int = 42,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Returns the Lund-plane weights of the jets (``LP_weight``, ``LP_weight_{sys,stat}_{up,down}``) and the jets with a
+        bad match (``LP_bad_match``), from the outputs of ``getLPweights``.
+        """
+        nevents = len(pf_cands)
+        valid = gen_parts_eta_phi[:, :, 0] > -1000  # the missing quarks are filled with FILL_NONE_VALUE
+        nprongs = np.sum(valid, axis=1)
+
+        subjets, splittings, nsplittings = lund_splittings(pf_cands, nprongs)
+        bad_match = (nprongs == 0) | match_quarks(subjets, gen_parts_eta_phi, valid)
+
+        # rescale the subjets pt to the jet pt
+        subjet_pt = subjets[..., 0]
+        subjet_phi = subjets[..., 2]
+        sum_pt = np.hypot(
+            np.sum(subjet_pt * np.cos(subjet_phi), axis=1),
+            np.sum(subjet_pt * np.sin(subjet_phi), axis=1),
+        )
+        scale = np.divide(ak8_jets[:, 0], sum_pt, out=np.ones(nevents), where=sum_pt > 0)
+        subjet_pt = subjet_pt * scale[:, None]
+
+        # flat (event, bin) of all the splittings of the well matched jets
+        msk = (np.arange(splittings.shape[2])[None, None, :] < nsplittings[..., None]) & ~bad_match[:, None, None]
+        event, subjet, split = np.nonzero(msk)
+        bins = np.ravel_multi_index(
+            (
+                self._bins(subjet_pt[event, subjet], 0),
+                self._bins(splittings[event, subjet, split, 0], 1),
+                self._bins(splittings[event, subjet, split, 1], 2),
+            ),
+            self.ratios[""].shape,
+        )
+
+        def product(ratio):
+            # the empty bins of the ratios are not reweighted
+            values = ratio.reshape(-1)[bins]
+            logs = np.log(np.where(values > 0, values, 1))
+            return np.exp(np.bincount(event, weights=logs, minlength=nevents))
+
+        out = {f"LP_weight{key}": product(ratio) for key, ratio in self.ratios.items()}
+
+        rng = np.random.default_rng(seed)
+        noise = rng.normal(size=(ntoys,) + self.ratios[""].shape)
+        toys = np.array([product(np.maximum(self.ratios[""] + noise[i] * self.ratio_err, 0)) for i in range(ntoys)])
+        stat = np.std(toys, axis=0) if ntoys > 0 else np.zeros(nevents)
+        out["LP_weight_stat_up"] = out["LP_weight"] + stat
+        out["LP_weight_stat_down"] = out["LP_weight"] - stat
+
+        out["LP_bad_match"] = bad_match
+        return out
+
+
+@functools.lru_cache(maxsize=None)
+def get_lund_reweighter(path: str) -> LundPlaneReweighter:
+    """Loads the Lund-plane ratios once per worker."""
+    return LundPlaneReweighter.from_root(path)
+
+
+def read_lp_inputs(df) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the inputs of ``LundPlaneReweighter.weights`` from the LP_ columns of the hww parquets."""
+    npf = len([col for col in df.columns if col.startswith("LP_pfcand") and col.endswith("_px")])
+    nquarks = len([col for col in df.columns if col.startswith("LP_quark") and col.endswith("_eta")])
+    pf_cands = np.stack(
+        [df[[f"LP_pfcand{i}_{var}" for i in range(npf)]].to_numpy() for var in ["px", "py", "pz", "energy"]], axis=-1
+    )
+    gen_parts_eta_phi = np.stack(
+        [df[[f"LP_quark{i}_{var}" for i in range(nquarks)]].to_numpy() for var in ["eta", "phi"]], axis=-1
+    )
+    ak8_jets = df[["LP_fj_pt", "LP_fj_eta", "LP_fj_phi", "LP_fj_energy"]].to_numpy()
+    return pf_cands, gen_parts_eta_phi, ak8_jets
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="adds the Lund-plane weights to the hww parquets with the LP_ inputs")
+    parser.add_argument("--ratio", required=True, type=str, help="ratio_{year}.root of the LundReweighting package")
+    parser.add_argument("--input", nargs="+", required=True, help="parquet files")
+    parser.add_argument("--outdir", required=True, type=str, help="output directory (the LP_ inputs are dropped)")
+    parser.add_argument("--ntoys", default=100, type=int, help="number of toys of the statistical uncertainty")
+    args = parser.parse_args()
+
+    reweighter = get_lund_reweighter(args.ratio)
+    os.makedirs(args.outdir, exist_ok=True)
+    for filename in args.input:
+        df = pd.read_parquet(filename)
+        weights = reweighter.weights(*read_lp_inputs(df), ntoys=args.ntoys)
+        df = df.drop(columns=[col for col in df.columns if col.startswith("LP_")])
+        df = df.assign(**weights)
+        df.to_parquet(os.path.join(args.outdir, os.path.basename(filename)))
+        print(f"{filename}: {np.sum(~weights['LP_bad_match'])} / {len(df)} jets reweighted")
@@ -0,0 +1,142 @@
+"""
+Compiled ΔR/Δφ matching kernels.
+
+The kernels run on the flattened (eta, phi) arrays and the offsets of the jagged collections, so that no
+(objects x targets) ``delta_r`` array has to be broadcast. ``target`` is one (optional) object per event
+(e.g. the candidate lepton or fatjet), ``others`` a second jagged collection (e.g. gen leptons).
+The wrappers return the same structure as the awkward expressions they replace (see ``benchmarks/matching.py``).
+"""
+
+from typing import Tuple
+
+import awkward as ak
+import numba
+import numpy as np
+
+
+@numba.njit(cache=True)
+def _delta_phi(a, b):
+    # same convention as coffea's ``delta_phi``: within [-pi, pi), only wrapping when needed
+    dphi = a - b
+    if dphi >= np.pi or dphi < -np.pi:
+        dphi = (dphi + np.pi) % (2 * np.pi) - np.pi
+    return dphi
+
+
+@numba.njit(cache=True)
+def _delta_r2(eta1, phi1, eta2, phi2):
+    # the squared ΔR is enough to compare with a cone or find the nearest object
+    deta = eta1 - eta2
+    dphi = _delta_phi(phi1, phi2)
+    return deta * deta + dphi * dphi
+
+
+@numba.njit(cache=True)
+def _delta_r_to_kernel(offsets, eta, phi, target_eta, target_phi):
+    dr = np.empty(len(eta), dtype=np.float64)
+    for i in range(len(offsets) - 1):
+        for j in range(offsets[i], offsets[i + 1]):
+            dr[j] = np.sqrt(_delta_r2(eta[j], phi[j], target_eta[i], target_phi[i]))
+    return dr
+
+
+@numba.njit(cache=True)
+def _nearest_kernel(offsets, eta, phi, target_eta, target_phi):
+    idx = np.full(len(offsets) - 1, -1, dtype=np.int64)
+    for i in range(len(offsets) - 1):
+        dr2_min = np.inf
+        for j in range(offsets[i], offsets[i + 1]):
+            dr2 = _delta_r2(eta[j], phi[j], target_eta[i], target_phi[i])
+            if dr2 < dr2_min:  # strict to keep the first object on ties (like ``ak.argmin``)
+                dr2_min = dr2
+                idx[i] = j - offsets[i]
+    return idx
+
+
+@numba.njit(cache=True)
+def _count_within_kernel(offsets, eta, phi, target_eta, target_phi, cone):
+    count = np.zeros(len(offsets) - 1, dtype=np.int64)
+    cone2 = cone * cone
+    for i in range(len(offsets) - 1):
+        for j in range(offsets[i], offsets[i + 1]):
+            if _delta_r2(eta[j], phi[j], target_eta[i], target_phi[i]) < cone2:
+                count[i] += 1
+    return count
+
+
+@numba.njit(cache=True)
+def _nearest_match_kernel(offsets, eta, phi, other_offsets, other_eta, other_phi):
+    idx = np.full(len(eta), -1, dtype=np.int64)
+    dr = np.full(len(eta), np.inf, dtype=np.float64)
+    for i in range(len(offsets) - 1):
+        for j in range(offsets[i], offsets[i + 1]):
+            for k in range(other_offsets[i], other_offsets[i + 1]):
+                dr2 = _delta_r2(eta[j], phi[j], other_eta[k], other_phi[k])
+                if dr2 < dr[j]:
+                    dr[j] = dr2
+                    idx[j] = k - other_offsets[i]
+    return idx, np.sqrt(dr)
+
+
+def _flatten(objects: ak.Array) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the offsets and the flattened eta, phi of a jagged collection."""
+    # missing lists count as empty and missing objects get a NaN position, which never matches
+    offsets = np.zeros(len(objects) + 1, dtype=np.int64)
+    np.cumsum(ak.to_numpy(ak.fill_none(ak.num(objects, axis=1), 0)), out=offsets[1:])
+    eta = ak.to_numpy(ak.fill_none(ak.flatten(objects.eta, axis=1), np.nan)).astype(np.float64)
+    phi = ak.to_numpy(ak.fill_none(ak.flatten(objects.phi, axis=1), np.nan)).astype(np.float64)
+    return offsets, eta, phi
+
+
+def _target(target: ak.Array) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the eta, phi of one (optional) object per event and the mask of events that have it."""
+    eta = ak.to_numpy(ak.fill_none(target.eta, np.nan)).astype(np.float64)
+    phi = ak.to_numpy(ak.fill_none(target.phi, np.nan)).astype(np.float64)
+    return eta, phi, ~np.isnan(eta)
+
+
+def delta_r_to(objects: ak.Array, target: ak.Array) -> ak.Array:
+    """ΔR of each object to the target of its event, same as ``objects.delta_r(target)``."""
+    offsets, eta, phi = _flatten(objects)
+    target_eta, target_phi, has_target = _target(target)
+    dr = _delta_r_to_kernel(offsets, eta, phi, target_eta, target_phi)
+    return ak.mask(ak.unflatten(dr, np.diff(offsets)), has_target)
+
+
+def nearest(objects: ak.Array, target: ak.Array, keepdims: bool = False) -> ak.Array:
+    """Index of the object nearest to the target, same as ``ak.argmin(objects.delta_r(target), axis=1, keepdims)``."""
+    offsets, eta, phi = _flatten(objects)
+    target_eta, target_phi, has_target = _target(target)
+    idx = _nearest_kernel(offsets, eta, phi, target_eta, target_phi)
+
+    idx = ak.mask(idx, idx >= 0)
+    if keepdims:
+        return ak.mask(ak.unflatten(idx, np.ones(len(idx), dtype=np.int64)), has_target)
+    return ak.mask(idx, has_target)
+
+
+def count_within(objects: ak.Array, target: ak.Array, cone: float) -> ak.Array:
+    """Number of objects within ``cone`` of the target, same as ``ak.sum(target.delta_r(objects) < cone, axis=1)``."""
+    offsets, eta, phi = _flatten(objects)
+    target_eta, target_phi, has_target = _target(target)
+    return ak.mask(_count_within_kernel(offsets, eta, phi, target_eta, target_phi, cone), has_target)
+
+
+def any_within(objects: ak.Array, target: ak.Array, cone: float) -> ak.Array:
+    """Whether any object is within ``cone`` of the target, same as ``ak.any(target.delta_r(objects) < cone, axis=1)``."""
+    return count_within(objects, target, cone) > 0
+
+
+def nearest_match(objects: ak.Array, others: ak.Array) -> Tuple[ak.Array, ak.Array]:
+    """For each object, the index of (-1 if none) and the ΔR to the nearest object of ``others`` in the same event."""
+    offsets, eta, phi = _flatten(objects)
+    other_offsets, other_eta, other_phi = _flatten(others)
+    idx, dr = _nearest_match_kernel(offsets, eta, phi, other_offsets, other_eta, other_phi)
+    counts = np.diff(offsets)
+    return ak.unflatten(idx, counts), ak.unflatten(dr, counts)
+
+
+def within_cone(objects: ak.Array, others: ak.Array, cone: float) -> ak.Array:
+    """For each object, whether any object of ``others`` in the same event is within ``cone``."""
+    _, dr = nearest_match(objects, others)
+    return dr < cone
@@ -0,0 +1,86 @@
+"""
+Arrow output of the training ntuples (``InputProcessor``), built from numpy arrays without going through python lists
+or pandas: 1D arrays become primitive columns (zero-copy for numeric dtypes) and ND arrays, e.g. the (events, particles)
+PF candidate features, become nested fixed-size list (tensor) columns over the same buffer.
+"""
+
+import os
+from typing import Dict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    # the multiplications are modulo 2^64
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def event_hash(run, lumi, event) -> np.ndarray:
+    """
+    Returns a 64-bit hash of the (run, luminosity block, event) of each event, independent of the file and chunk the
+    event is read in (used e.g. for the train/test split of the training datasets).
+    """
+    run, lumi, event = (np.asarray(x).astype(np.uint64) for x in (run, lumi, event))
+    return _splitmix64(event ^ _splitmix64(lumi ^ _splitmix64(run)))
+
+
+def hash_fraction(hashes: np.ndarray) -> np.ndarray:
+    """Maps the hashes uniformly to [0, 1)."""
+    return (hashes >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def finite_rows(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Returns the mask of the rows without NaN in any of the (floating point) columns, as ``pd.DataFrame.dropna``."""
+    nrows = len(next(iter(columns.values())))
+    mask = np.ones(nrows, dtype=bool)
+    for value in columns.values():
+        if np.issubdtype(value.dtype, np.floating):
+            isnan = np.isnan(value)
+            mask &= ~(isnan.reshape(nrows, -1).any(axis=1) if isnan.ndim > 1 else isnan)
+    return mask
+
+
+def to_arrow_array(value: np.ndarray) -> pa.Array:
+    """Converts a numpy array to an arrow array, with one fixed-size list level per dimension beyond the first."""
+    value = np.ascontiguousarray(value)
+    array = pa.array(value.reshape(-1))
+    for size in reversed(value.shape[1:]):
+        array = pa.FixedSizeListArray.from_arrays(array, size)
+    return array
+
+
+def to_arrow_table(columns: Dict[str, np.ndarray]) -> pa.Table:
+    return pa.table({key: to_arrow_array(value) for key, value in columns.items()})
+
+
+def from_arrow_column(column: pa.ChunkedArray) -> np.ndarray:
+    """Inverse of ``to_arrow_array``: returns the column as a (events, ...) numpy array."""
+    array = column.combine_chunks()
+    shape = [len(array)]
+    while pa.types.is_fixed_size_list(array.type):
+        shape.append(array.type.list_size)
+        array = array.flatten()
+    return array.to_numpy(zero_copy_only=False).reshape(shape)
+
+
+def write_parquet(columns: Dict[str, np.ndarray], path: str, dropnan: bool = True) -> int:
+    """
+    Writes the columns (arrays with the same first dimension) to a parquet file, without the rows with NaNs if
+    ``dropnan``. Returns the number of rows written, nothing is written if there are none.
+    """
+    if dropnan:
+        mask = finite_rows(columns)
+        if not mask.all():
+            columns = {key: value[mask] for key, value in columns.items()}
+
+    table = to_arrow_table(columns)
+    if len(table) != 0:  # skip tables with empty entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        pq.write_table(table, path)
+    return len(table)
@@ -0,0 +1,148 @@
+"""
+Persistent cache of the coffea preprocessing metadata (file uuid, tree name and number of entries), so that
+``processor.Runner`` does not re-open every input file over xrootd on each run to build the chunks.
+
+The entries are stored in a SQLite file and keyed by file path, tree name and modification time: a file that was
+rewritten since it was cached is a miss and is preprocessed again. The entries cached where the modification time
+could not be checked (e.g. without the XRootD bindings) are stored without one and are always valid. The cache is
+passed to the Runner as its ``metadata_cache`` and can be warmed beforehand with ``fileset/warm_preprocessing_cache.py``.
+"""
+
+import json
+import os
+import sqlite3
+from collections.abc import MutableMapping
+from typing import Dict, Optional
+
+from coffea.processor.executor import FileMeta
+
+
+def get_mtime(filename: str) -> Optional[float]:
+    """Returns the modification time of a local or xrootd file, or None if it cannot be checked."""
+    if "://" not in filename:
+        try:
+            return os.stat(filename).st_mtime
+        except OSError:
+            return None
+
+    try:
+        from XRootD import client
+    except ImportError:
+        return None
+
+    # root://host//path
+    host, path = filename.split("://", 1)[1].split("/", 1)
+    status, info = client.FileSystem(f"root://{host}").stat("/" + path.lstrip("/"))
+    if not status.ok:
+        return None
+    return float(info.modtime)
+
+
+class PreprocessingCache(MutableMapping):
+    """
+    Dict-like cache of ``FileMeta`` -> preprocessing metadata (``numentries``, ``uuid`` and, if aligned to the
+    clusters, ``clusters``), backed by a SQLite file. The user metadata of the fileset is not cached, it is
+    taken from the ``FileMeta`` that is looked up.
+
+    If ``check_mtime`` is False, the cached entries are trusted without checking the modification time of the files
+    (e.g. for the immutable PFNano inputs when the xrootd stat is not available).
+    """
+
+    def __init__(self, path: str, check_mtime: bool = True):
+        self._path = path
+        self._check_mtime = check_mtime
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._path, timeout=60)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "filename TEXT, treename TEXT, mtime REAL, uuid BLOB, numentries INTEGER, clusters TEXT, "
+                "PRIMARY KEY (filename, treename))"
+            )
+        return self._conn
+
+    def __getstate__(self):
+        # the connection is re-opened after unpickling
+        return {**self.__dict__, "_conn": None}
+
+    def mtime(self, filename: str) -> Optional[float]:
+        if not self._check_mtime:
+            return None
+        if filename not in self._mtimes:
+            self._mtimes[filename] = get_mtime(filename)
+        return self._mtimes[filename]
+
+    def _lookup(self, key: FileMeta):
+        row = self.conn.execute(
+            "SELECT mtime, uuid, numentries, clusters FROM files WHERE filename = ? AND treename = ?",
+            (key.filename, key.treename),
+        ).fetchone()
+        if row is None:
+            return None
+
+        # the entries stored without a modification time cannot be checked and are kept
+        mtime = self.mtime(key.filename)
+        if mtime is not None and row[0] is not None and row[0] != mtime:  # the file changed since it was cached
+            return None
+        return row
+
+    def __bool__(self) -> bool:
+        # coffea checks ``if cache and filemeta in cache`` per file, avoid counting the entries each time
+        return True
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, FileMeta) and self._lookup(key) is not None
+
+    def __getitem__(self, key: FileMeta) -> Dict:
+        row = self._lookup(key)
+        if row is None:
+            raise KeyError(key)
+
+        metadata = dict(key.metadata) if key.metadata else {}
+        metadata.update({"uuid": bytes(row[1]), "numentries": row[2]})
+        if row[3] is not None:
+            metadata["clusters"] = json.loads(row[3])
+        return metadata
+
+    def __setitem__(self, key: FileMeta, metadata: Dict):
+        clusters = metadata.get("clusters")
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key.filename,
+                    key.treename,
+                    self.mtime(key.filename),
+                    bytes(metadata["uuid"]),
+                    int(metadata["numentries"]),
+                    None if clusters is None else json.dumps([int(c) for c in clusters]),
+                ),
+            )
+
+    def __delitem__(self, key: FileMeta):
+        with self.conn:
+            self.conn.execute("DELETE FROM files WHERE filename = ? AND treename = ?", (key.filename, key.treename))
+
+    def __iter__(self):
+        for filename, treename in self.conn.execute("SELECT filename, treename FROM files").fetchall():
+            yield FileMeta(None, filename, treename)
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+def get_preprocessing_cache(path: Optional[str], check_mtime: bool = True) -> Optional[PreprocessingCache]:
+    """
+    Returns the preprocessing cache of ``path``, or None (no cache) if ``path`` is empty or its directory does not exist,
+    e.g. on the condor workers that do not have the ``fileset/`` directory.
+    """
+    if not path:
+        return None
+    if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+        print(f"WARNING : The directory of the preprocessing cache {path} does not exist, running without the cache")
+        return None
+    return PreprocessingCache(path, check_mtime=check_mtime)
@@ -0,0 +1,100 @@
+"""
+Tuning of the uproot reads of the coffea Runner, with named presets (``boostedhiggs/data/reader_presets.json``):
+
+- ``xrootd_handler``: ``multithreaded`` (one request per basket range, ``num_workers`` in parallel) or ``vector``
+  (``XRootDSource``, the basket ranges of a read are coalesced in vector reads, better for very wide reads like
+  the PFCands).
+- ``num_workers``: number of parallel fetches of the multithreaded sources.
+- ``begin_chunk_size``: bytes read when opening a file (a larger first read saves round trips for the TTree metadata).
+- ``timeout``: xrootd timeout [s].
+- ``mmap``: memory-map local files instead of reading them with threads.
+- ``align_clusters``: align the chunks to the ROOT clusters so that no basket is read (and decompressed) by two chunks.
+- ``cache``: cache of the columns materialized by the chunks (the ``cachestrategy`` of the Runner): 0 for none, a size
+  in MB for an LRU cache shared by the chunks of a worker process, or ``dask-worker`` for the column cache plugin of
+  the dask workers.
+
+coffea 0.7 reads the columns one at a time with single-threaded decompression and interpretation, so those are not
+options here. The ``dynamic_chunksize`` of the Runner is only supported by the WorkQueue executor, which is not used.
+"""
+
+import functools
+import importlib.resources
+import json
+from typing import Callable, Dict, MutableMapping, Optional, Union
+
+import cachetools
+import uproot
+
+XROOTD_HANDLERS = {
+    "multithreaded": "MultithreadedXRootDSource",
+    "vector": "XRootDSource",
+}
+
+
+def load_reader_presets(path=None) -> Dict[str, Dict]:
+    """Loads the reader presets (``boostedhiggs/data/reader_presets.json`` by default)."""
+    if path is None:
+        with importlib.resources.path("boostedhiggs.data", "reader_presets.json") as path:
+            with open(path, "r") as f:
+                return json.load(f)
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def get_reader_options(preset: str = "default", overrides: Optional[Dict] = None, path=None) -> Dict:
+    """Returns the options of a preset, updated with the ``overrides`` that are not None."""
+    presets = load_reader_presets(path)
+    if preset not in presets:
+        raise ValueError(f"Unknown reader preset {preset}, choose from {list(presets)}")
+
+    options = dict(presets[preset])
+    if overrides:
+        options.update({key: value for key, value in overrides.items() if value is not None})
+
+    if options["xrootd_handler"] not in XROOTD_HANDLERS:
+        raise ValueError(f"Unknown xrootd handler {options['xrootd_handler']}, choose from {list(XROOTD_HANDLERS)}")
+
+    if options["cache"] != "dask-worker":
+        try:
+            options["cache"] = float(options["cache"])
+        except ValueError:
+            raise ValueError(f"Unknown column cache {options['cache']}, give a size in MB or dask-worker") from None
+
+    return options
+
+
+def set_uproot_defaults(options: Dict):
+    """
+    Sets the ``uproot.open`` defaults of the process. The coffea Runner opens the files with these defaults, so this has
+    to run in the worker processes too (inherited by the forked futures workers, via ``client.run`` for dask).
+    """
+    uproot.open.defaults["xrootd_handler"] = getattr(uproot.source.xrootd, XROOTD_HANDLERS[options["xrootd_handler"]])
+    uproot.open.defaults["num_workers"] = options["num_workers"]
+    uproot.open.defaults["begin_chunk_size"] = options["begin_chunk_size"]
+
+
+@functools.lru_cache(maxsize=None)
+def get_column_cache(size: float) -> MutableMapping:
+    """Returns the LRU column cache of ``size`` MB of the process, shared by all its chunks."""
+    return cachetools.LRUCache(maxsize=int(size * 1e6), getsizeof=lambda array: getattr(array, "nbytes", 1))
+
+
+def get_cachestrategy(cache: Union[float, str]) -> Optional[Union[str, Callable[[], MutableMapping]]]:
+    """Returns the ``cachestrategy`` of ``processor.Runner`` for the ``cache`` reader option."""
+    if cache == "dask-worker":
+        return cache
+    if not cache:
+        return None
+    # the partial is sent to the worker processes, each one creates its own cache
+    return functools.partial(get_column_cache, cache)
+
+
+def runner_kwargs(options: Dict) -> Dict:
+    """Returns the keyword arguments of ``processor.Runner`` for the reader options."""
+    return {
+        "xrootdtimeout": options["timeout"],
+        "mmap": options["mmap"],
+        "align_clusters": options["align_clusters"],
+        "cachestrategy": get_cachestrategy(options["cache"]),
+    }
@@ -181,3 +181,29 @@ def runInferenceTriton(
         pnet_vars[f"fj_{pversion}_{output_name}"] = tagger_outputs[:, i]
 
     return pnet_vars
+
+
+# onnxruntime sessions of the finetuned heads, created once per worker
+_finetuned_sessions = {}
+
+
+def runFinetunedHead(model_path: str, hidNeurons: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Evaluates a finetuned ONNX head (e.g. THWW) on the hidden neurons of the ParT inference.
+    Returns the softmax score of the first (signal) node.
+    """
+    import onnxruntime as ort
+    import scipy
+
+    if model_path not in _finetuned_sessions:
+        _finetuned_sessions[model_path] = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+
+    # the head expects the 128 hidden neurons in order (hidNeuron000 ... hidNeuron127)
+    highlevel = np.stack([hidNeurons[key] for key in sorted(hidNeurons)], axis=1).astype("float32")
+
+    if len(highlevel) == 0:
+        return np.zeros(0, dtype="float32")
+
+    outputs = _finetuned_sessions[model_path].run(None, {"highlevel": highlevel})
+
+    return scipy.special.softmax(outputs[0], axis=1)[:, 0]
@@ -0,0 +1,165 @@
+"""
+Cost-aware ordering of the chunks of the futures executor: the chunks are submitted to the process pool from the most
+to the least expensive, so that the signal chunks running the inference, the LP weights and the PDF weights do not end
+up last and leave a long single-worker tail.
+
+The cost of a chunk is its number of events times a per-event time, measured for the sample in past runs with the same
+processor options (``--cost-history``), or estimated from the sample type and the processor options otherwise.
+The per-chunk times are measured by wrapping the processor in ``TimedProcessor``, which removes them from the
+accumulator again in ``postprocess``, so that the output is the same as without the scheduler.
+"""
+
+import json
+import os
+import resource
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from coffea import processor
+from coffea.processor.executor import WorkItem
+
+TIMING_KEY = "_chunk_timing"
+
+# rough per-event processing times [s], used for the samples without past measurements
+STATIC_COSTS = {
+    "data": 1e-3,
+    "mc": 2e-3,
+    "signal": 3e-3,
+}
+# additional per-event times [s] of the processor options, by the sample types they apply to
+OPTION_COSTS = {
+    "inference": {"data": 4e-3, "mc": 4e-3, "signal": 4e-3},
+    "systematics": {"mc": 2e-3, "signal": 2e-3},
+    "getLPweights": {"signal": 20e-3},
+}
+
+
+def sample_type(sample: str) -> str:
+    if ("HToWW" in sample) or ("ttHToNonbb" in sample):
+        return "signal"
+    if "_Run20" in sample:
+        return "data"
+    return "mc"
+
+
+def chunk_sample(item: WorkItem) -> str:
+    # datasets of multi-year filesets are tagged with their year (see ``make_multiyear_fileset``)
+    return (item.usermeta or {}).get("sample", item.dataset)
+
+
+class CostModel:
+    """
+    Per-event cost of the samples for one processor configuration (e.g. ``hww`` with ``{"inference": True}``), from
+    the measured times of past runs stored in ``history`` (a json file, {configuration: {sample: [time, nevents]}}).
+    """
+
+    def __init__(self, processor_name: str, options: Dict[str, bool], history: Optional[str] = None):
+        self.options = options
+        self.configuration = ":".join([processor_name] + sorted(key for key, value in options.items() if value))
+        self.history = history
+
+        self.measured: Dict[str, List[float]] = {}
+        if history and os.path.exists(history):
+            with open(history, "r") as f:
+                self.measured = json.load(f).get(self.configuration, {})
+
+    def per_event(self, sample: str) -> float:
+        if sample in self.measured and self.measured[sample][1] > 0:
+            return self.measured[sample][0] / self.measured[sample][1]
+
+        stype = sample_type(sample)
+        cost = STATIC_COSTS[stype]
+        for option, costs in OPTION_COSTS.items():
+            if self.options.get(option):
+                cost += costs.get(stype, 0)
+        return cost
+
+    def cost(self, item: WorkItem) -> float:
+        return (item.entrystop - item.entrystart) * self.per_event(chunk_sample(item))
+
+    def order(self, chunks: List[WorkItem]) -> List[WorkItem]:
+        """Returns the chunks from the most to the least expensive."""
+        return sorted(chunks, key=self.cost, reverse=True)
+
+    def update(self, timings: List[Dict]):
+        """Adds the per-chunk times of a run to the history."""
+        if not self.history:
+            return
+
+        history = {}
+        if os.path.exists(self.history):
+            with open(self.history, "r") as f:
+                history = json.load(f)
+
+        measured = history.setdefault(self.configuration, {})
+        for timing in timings:
+            time_, nevents = measured.get(timing["sample"], [0.0, 0])
+            measured[timing["sample"]] = [time_ + timing["stop"] - timing["start"], nevents + timing["nevents"]]
+
+        with open(self.history, "w") as f:
+            json.dump(history, f, indent=1)
+
+
+class TimedProcessor(processor.ProcessorABC):
+    """
+    Wraps a processor to measure the wall time and the peak memory after each chunk (added to the accumulator under
+    ``TIMING_KEY``).
+    """
+
+    def __init__(self, processor_instance: processor.ProcessorABC):
+        self.processor_instance = processor_instance
+        self.timings: List[Dict] = []
+
+    @property
+    def accumulator(self):
+        return self.processor_instance.accumulator
+
+    def process(self, events):
+        start = time.time()
+        out = self.processor_instance.process(events)
+        stop = time.time()
+
+        if not isinstance(out, dict):
+            return out
+
+        timing = {
+            "sample": events.metadata.get("sample", events.metadata["dataset"]),
+            "nevents": len(events),
+            "start": start,
+            "stop": stop,
+            "pid": os.getpid(),
+            # peak resident memory of the worker so far [MB] (ru_maxrss is in kB on linux)
+            "maxrss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        return {**out, TIMING_KEY: [timing]}
+
+    def postprocess(self, accumulator):
+        if isinstance(accumulator, dict):
+            self.timings = accumulator.pop(TIMING_KEY, [])
+        return self.processor_instance.postprocess(accumulator)
+
+
+def log_estimates(model: CostModel, chunks: List[WorkItem], workers: int, ntop: int = 10):
+    costs = np.array([model.cost(item) for item in chunks])
+    print(f"Cost-ordered {len(chunks)} chunks ({model.configuration}), estimated total {costs.sum():.0f}s")
+    print(f"  estimated makespan with {workers} workers >= {max(costs.sum() / workers, costs.max()):.0f}s")
+    for item, cost in zip(chunks[:ntop], costs[:ntop]):
+        print(f"  {cost:8.1f}s  {chunk_sample(item)} [{item.entrystart}, {item.entrystop})")
+
+
+def log_tail(timings: List[Dict], workers: int):
+    """Logs the tail time of the run: the time between the start of the last chunk and the end of the run."""
+    if not timings:
+        return
+
+    starts = np.array([timing["start"] for timing in timings])
+    stops = np.array([timing["stop"] for timing in timings])
+    busy = np.sum(stops - starts)
+    makespan = stops.max() - starts.min()
+    tail = stops.max() - starts.max()
+    last = timings[int(np.argmax(stops))]
+    print(
+        f"Processing makespan {makespan:.1f}s (ideal {busy / workers:.1f}s with {workers} workers), "
+        f"tail {tail:.1f}s, last chunk: {last['sample']} ({last['stop'] - last['start']:.1f}s)"
+    )
@@ -0,0 +1,48 @@
+"""
+Sidecar parquets: column families of the processor outputs (e.g. the tagger scores) written to their own parquets next
+to the nominal ones, ``{job}_{ch}_{family}.parquet``, keyed by the event, and joined back onto the nominal dataframe by
+the postprocessing (``combine/make_templates.py``, ``python/make_stacked_hists.py``) with ``read_parquets``.
+
+Only pandas is needed, so that the postprocessing environments can import this module without coffea.
+"""
+
+import os
+from typing import List, Optional
+
+import pandas as pd
+
+# event key stored in every output, used to join the sidecar column families back onto the nominal parquets
+EVENT_KEY = ["run", "luminosityBlock", "event"]
+
+# column families (regex on the column name) that can be written to their own event-keyed sidecar parquets
+SIDECAR_FAMILIES = {
+    "tagger": r"^fj_ParT_",
+    "lp": r"^LP_",
+    "jec": r"^((rec_higgs|rec_W_qq|rec_W_lnu)_(m|pt)|fj_pt|fj_mass|mjj)(JES|JER|UES|JMS|JMR)",
+    "lhe": r"^weight_(pdf|scale)$",
+}
+
+
+def join_on_event_key(data: pd.DataFrame, sidecar: pd.DataFrame, keys: List[str] = EVENT_KEY) -> pd.DataFrame:
+    """
+    Left-joins the columns of ``sidecar`` onto ``data`` on the event key.
+    Events of ``data`` that are missing from ``sidecar`` get NaN.
+    """
+    return pd.merge(data.reset_index(drop=True), sidecar, how="left", on=keys, validate="one_to_one")
+
+
+def read_parquets(parquet_files: List[str], sidecars: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Reads the nominal parquets and joins the requested sidecar column families (e.g. ["tagger", "lhe"]) on the event key.
+    The sidecar of ``{job}_{ch}.parquet`` is expected at ``{job}_{ch}_{family}.parquet``.
+    """
+    data = pd.read_parquet(parquet_files).reset_index(drop=True)
+
+    for family in sidecars or []:
+        sidecar_files = [f.replace(".parquet", f"_{family}.parquet") for f in parquet_files]
+        sidecar_files = [f for f in sidecar_files if os.path.exists(f)]
+        if len(sidecar_files) == 0:
+            continue
+        data = join_on_event_key(data, pd.read_parquet(sidecar_files))
+
+    return data
@@ -0,0 +1,245 @@
+"""
+Loose-preselection skims: writes the events of the PFNano inputs that pass a loose one-lepton + fatjet preselection
+(``boostedhiggs/data/skim.json``) to compact local NanoAOD-like ROOT files, so that the analysis can be iterated on
+without re-reading the full inputs over xrootd.
+
+Each skim file is made from one chunk of an input file and stores its provenance (source file, entry range, number of
+events, preselection) and the normalization sums of the full chunk as a json string under ``SkimProvenance``.
+The chunks without any event passing the preselection are not written as skim files, only their provenance is, as a
+``skim_*.json`` next to the skim files. The processors read the sums back with ``get_skim_sums`` so that they run on
+the skims as if on the original dataset.
+"""
+
+import functools
+import glob
+import importlib.resources
+import json
+import os
+import re
+import warnings
+from typing import Dict, List, Optional, Tuple
+
+import awkward as ak
+import numpy as np
+import uproot
+from coffea import processor
+
+from boostedhiggs.utils import get_lhe_weights, split_year
+
+warnings.filterwarnings("ignore", message="Found duplicate branch ")
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+warnings.filterwarnings("ignore", message="Missing cross-reference index ")
+np.seterr(invalid="ignore")
+
+PROVENANCE_KEY = "SkimProvenance"
+
+
+def load_skim_config(path=None):
+    """Loads the skim preselection and branch selection (``boostedhiggs/data/skim.json`` by default)."""
+    if path is None:
+        with importlib.resources.path("boostedhiggs.data", "skim.json") as path:
+            with open(path, "r") as f:
+                return json.load(f)
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=None)
+def read_skim_provenance(filename: str) -> Optional[Dict]:
+    """Returns the provenance stored in a skim file, or None if the file is not a skim."""
+    with uproot.open(filename) as f:
+        if PROVENANCE_KEY not in f:
+            return None
+        return json.loads(str(f[PROVENANCE_KEY]))
+
+
+@functools.lru_cache(maxsize=None)
+def read_skim_directory(directory: str) -> Tuple[Optional[str], List[Dict]]:
+    """
+    Returns the first skim file of a directory and the provenance of the chunks without passing events (which are not
+    written as skim files).
+    """
+    skims = sorted(glob.glob(os.path.join(directory, "*.root")))
+    empty = []
+    for filename in sorted(glob.glob(os.path.join(directory, "skim_*.json"))):
+        with open(filename, "r") as f:
+            empty.append(json.load(f))
+    return (skims[0] if skims else None), empty
+
+
+def get_skim_sums(metadata):
+    """
+    For chunks of skim files, returns the (sumgenweight, sumlheweight, sumpdfweight) of the full input chunk the skim
+    was made from, or None if the chunk does not come from a skim. The sums are counted with the first chunk of each skim
+    file only (zeros otherwise), and the sums of the chunks without skim file with the first skim file of the directory,
+    so that summed over the skim they are the sums of the original dataset.
+    """
+    # the skims are local files, remote inputs are not opened again
+    if "://" in metadata["filename"]:
+        return None
+
+    provenance = read_skim_provenance(metadata["filename"])
+    if provenance is None:
+        return None
+
+    scale = 1 if metadata["entrystart"] == 0 else 0
+
+    provenances = [provenance]
+    filename = os.path.abspath(metadata["filename"])
+    first, empty = read_skim_directory(os.path.dirname(filename))
+    if filename == first:
+        provenances += empty
+
+    sumgenweight = scale * sum(p["sumgenweight"] for p in provenances)
+
+    sumlheweight, sumpdfweight = np.zeros(0), np.zeros(0)
+    if provenance["sumlheweight"] is not None:
+        sumlheweight = scale * sum(np.array(p["sumlheweight"]) for p in provenances if p["sumlheweight"] is not None)
+    if provenance["sumpdfweight"] is not None:
+        sumpdfweight = scale * sum(np.array(p["sumpdfweight"]) for p in provenances if p["sumpdfweight"] is not None)
+
+    return sumgenweight, sumlheweight, sumpdfweight
+
+
+class SkimProcessor(processor.ProcessorABC):
+    def __init__(
+        self,
+        year="2017",
+        yearmod="",
+        skim_config=None,
+        output_location="./skims/",
+    ):
+        self._year = year
+        self._yearmod = yearmod
+        self._config = load_skim_config(skim_config)
+        self._output_location = output_location
+
+    @property
+    def accumulator(self):
+        return self._accumulator
+
+    def preselection(self, events: ak.Array) -> np.ndarray:
+        """Loose one-lepton + fatjet preselection, looser than the selections of all the analysis processors."""
+        presel = self._config["preselection"]
+
+        muons = events.Muon
+        n_muons = ak.sum(
+            (muons.pt > presel["muon"]["pt"]) & (np.abs(muons.eta) < presel["muon"]["eta"]) & muons.looseId, axis=1
+        )
+
+        electrons = events.Electron
+        n_electrons = ak.sum(
+            (electrons.pt > presel["electron"]["pt"]) & (np.abs(electrons.eta) < presel["electron"]["eta"]), axis=1
+        )
+
+        fatjets = events.FatJet
+        n_fatjets = ak.sum((fatjets.pt > presel["fatjet"]["pt"]) & (np.abs(fatjets.eta) < presel["fatjet"]["eta"]), axis=1)
+
+        return ak.to_numpy((n_muons + n_electrons >= 1) & (n_fatjets >= 1))
+
+    def keep_branch(self, branch: str) -> bool:
+        return any(re.match(pattern, branch) for pattern in self._config["keep"]) and not any(
+            re.match(pattern, branch) for pattern in self._config["drop"]
+        )
+
+    def read_branches(self, tree, entrystart: int, entrystop: int, selection: np.ndarray) -> Dict[str, ak.Array]:
+        """
+        Reads the kept branches of the chunk and groups them into collections by their counter branch (e.g. nJet),
+        so that uproot writes them back with the NanoAOD layout (nJet, Jet_pt, ...).
+        """
+        branches = [branch for branch in dict.fromkeys(tree.keys()) if self.keep_branch(branch)]
+        arrays = tree.arrays(branches, entry_start=entrystart, entry_stop=entrystop, how=dict)
+
+        # NanoAOD collection names have no underscore, their branches are {name}_{field}
+        prefixes = {branch.split("_")[0] for branch in branches if "_" in branch}
+        collections = {branch[1:] for branch in branches if branch.startswith("n") and branch[1:] in prefixes}
+
+        out = {}
+        for name in sorted(collections):
+            fields = {b[len(name) + 1 :]: arrays.pop(b)[selection] for b in list(arrays) if b.startswith(name + "_")}
+            arrays.pop("n" + name, None)  # the counters are written by uproot
+            if len(fields):
+                out[name] = ak.zip(fields)
+
+        for branch, array in arrays.items():
+            out[branch] = array[selection]
+
+        return out
+
+    def process(self, events: ak.Array):
+        """Writes the events passing the loose preselection to a local skim file, with the normalization of the chunk."""
+
+        # datasets of multi-year filesets are tagged with their year (see ``make_multiyear_fileset``)
+        dataset = events.metadata.get("sample", events.metadata["dataset"])
+        yeartag = events.metadata.get("year", self._year + self._yearmod)
+        year, yearmod = split_year(yeartag)
+
+        isMC = hasattr(events, "genWeight")
+        isSignal = ("HToWW" in dataset) or ("ttHToNonbb" in dataset)
+        nevents = len(events)
+
+        # normalization sums over the full input chunk
+        sumgenweight = float(ak.sum(events.genWeight)) if isMC else nevents
+        sumlheweight, sumpdfweight = None, None
+        if "LHEScaleWeight" in events.fields and isMC:
+            if len(events.LHEScaleWeight[0]) == 9:
+                genweight = ak.to_numpy(events.genWeight).astype(np.float64)
+                sumlheweight = get_lhe_weights(events, "LHEScaleWeight").T @ genweight
+        if "LHEPdfWeight" in events.fields and isMC and isSignal:
+            genweight = ak.to_numpy(events.genWeight).astype(np.float64)
+            sumpdfweight = get_lhe_weights(events, "LHEPdfWeight").T @ genweight
+
+        selection = self.preselection(events)
+        npass = int(np.sum(selection))
+
+        filename = events.metadata["filename"]
+        entrystart, entrystop = events.metadata["entrystart"], events.metadata["entrystop"]
+
+        provenance = {
+            "source": filename,
+            "fileuuid": events.metadata["fileuuid"],
+            "treename": events.metadata["treename"],
+            "entrystart": entrystart,
+            "entrystop": entrystop,
+            "dataset": dataset,
+            "year": yeartag,
+            "nevents": nevents,
+            "npass": npass,
+            "preselection": self._config["preselection"],
+            "sumgenweight": sumgenweight,
+            "sumlheweight": None if sumlheweight is None else sumlheweight.tolist(),
+            "sumpdfweight": None if sumpdfweight is None else sumpdfweight.tolist(),
+        }
+
+        outdir = f"{self._output_location}{yeartag}/{dataset}/"
+        if not os.path.exists(outdir):
+            os.makedirs(outdir, exist_ok=True)
+
+        fname = events.behavior["__events_factory__"]._partition_key.replace("/", "_")
+        if npass == 0:
+            # only the normalization of the chunk is kept, no (failing) event is written to leak into the cutflows
+            with open(outdir + f"skim_{fname}.json", "w") as f:
+                json.dump(provenance, f)
+        else:
+            with uproot.open(filename) as f:
+                skimmed = self.read_branches(f[events.metadata["treename"]], entrystart, entrystop, selection)
+            with uproot.recreate(outdir + f"skim_{fname}.root") as f:
+                f["Events"] = skimmed
+                f[PROVENANCE_KEY] = json.dumps(provenance)
+
+        return {
+            dataset: {
+                "mc": isMC,
+                year
+                + yearmod: {
+                    "sumgenweight": sumgenweight,
+                    "sumlheweight": np.zeros(0) if sumlheweight is None else sumlheweight,
+                    "sumpdfweight": np.zeros(0) if sumpdfweight is None else sumpdfweight,
+                    "cutflows": {"skim": {"all": nevents, "preselection": npass}},
+                },
+            }
+        }
+
+    def postprocess(self, accumulator):
+        return accumulator
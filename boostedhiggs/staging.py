@@ -0,0 +1,174 @@
+"""
+Local staging cache of the remote ROOT inputs: the files are copied once (e.g. from ``root://cmseos.fnal.gov/``) to a
+local directory with a size budget, and later runs read them from local disk. The least recently used files are
+evicted when the budget is exceeded.
+
+A copy is only kept if its size and adler32 checksum match the ones of the source (the checksum is queried from the
+xrootd server, or computed for local sources), and it is only moved into the cache after the check, so a file in the
+cache is always complete. Plain local paths (or ``file://`` urls) are staged the same way, so that the cache can be
+tested with a local directory standing in for the remote store.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+INDEX = "index.json"
+
+
+def adler32(path: str, blocksize: int = 1 << 22) -> str:
+    """Returns the adler32 checksum of a local file as 8 hex digits (the format of xrdadler32)."""
+    checksum = 1
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            checksum = zlib.adler32(block, checksum)
+    return f"{checksum & 0xFFFFFFFF:08x}"
+
+
+def is_remote(url: str) -> bool:
+    return "://" in url and not url.startswith("file://")
+
+
+def local_path(url: str) -> str:
+    return url[len("file://") :] if url.startswith("file://") else url
+
+
+def split_xrootd_url(url: str) -> Tuple[str, str]:
+    """root://host//path -> (root://host, /path)"""
+    scheme, rest = url.split("://", 1)
+    host, path = rest.split("/", 1)
+    return f"{scheme}://{host}", "/" + path.lstrip("/")
+
+
+def source_info(url: str) -> Tuple[int, Optional[str]]:
+    """Returns the size and the adler32 checksum (None if the server does not provide it) of the source file."""
+    if not is_remote(url):
+        path = local_path(url)
+        return os.stat(path).st_size, adler32(path)
+
+    from XRootD import client
+    from XRootD.client.flags import QueryCode
+
+    server, path = split_xrootd_url(url)
+    fs = client.FileSystem(server)
+    status, info = fs.stat(path)
+    if not status.ok:
+        raise OSError(f"Could not stat {url}: {status.message}")
+
+    status, response = fs.query(QueryCode.CHECKSUM, path)
+    checksum = None
+    if status.ok and response:
+        # e.g. b"adler32 0a1b2c3d\x00"
+        algo, _, value = response.decode().strip("\x00\n ").partition(" ")
+        if algo == "adler32":
+            checksum = value.zfill(8)
+
+    return int(info.size), checksum
+
+
+def copy(url: str, dest: str):
+    if not is_remote(url):
+        shutil.copyfile(local_path(url), dest)
+    else:
+        subprocess.run(["xrdcp", "-f", "-s", url, dest], check=True)
+
+
+class StagingCache:
+    """
+    Copies input files to ``directory`` and returns their local paths, keeping at most ``max_size`` bytes of staged
+    files (least recently used first out). The staged files are listed with their source url, size, checksum and last
+    use in ``{directory}/index.json``.
+    """
+
+    def __init__(self, directory: str, max_size: float):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+        self._index_path = os.path.join(directory, INDEX)
+        self._index: Dict[str, Dict] = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r") as f:
+                self._index = json.load(f)
+
+        # files staged or used in this run are not evicted to make room for the others
+        self._pinned = set()
+
+        # drop the entries whose files were removed by hand
+        for url in list(self._index):
+            entry = self._index[url]
+            path = self._path(entry["name"])
+            if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+                self._remove(url)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _save(self):
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp, self._index_path)
+
+    def _remove(self, url: str):
+        entry = self._index.pop(url)
+        if os.path.exists(self._path(entry["name"])):
+            os.remove(self._path(entry["name"]))
+
+    @property
+    def size(self) -> int:
+        return sum(entry["size"] for entry in self._index.values())
+
+    def _make_room(self, size: int) -> bool:
+        """Evicts the least recently used files (not used in this run) until ``size`` more bytes fit in the budget."""
+        for url in sorted(self._index, key=lambda url: self._index[url]["last_used"]):
+            if self.size + size <= self.max_size:
+                break
+            if url not in self._pinned:
+                self._remove(url)
+        return self.size + size <= self.max_size
+
+    def stage(self, url: str) -> str:
+        """Returns the local path of the staged copy of ``url``, or ``url`` itself if it does not fit in the budget."""
+        if url in self._index:
+            self._index[url]["last_used"] = time.time()
+            self._pinned.add(url)
+            self._save()
+            return self._path(self._index[url]["name"])
+
+        size, checksum = source_info(url)
+        if not self._make_room(size):
+            print(f"Not staging {url} ({size / 1e9:.2f} GB), the staging budget is full")
+            return url
+
+        # keep the file name for readability, prefixed with a hash of the url to avoid collisions
+        name = f"{zlib.crc32(url.encode()):08x}_{os.path.basename(local_path(url))}"
+        tmp = self._path(name + ".part")
+        copy(url, tmp)
+
+        staged_size, staged_checksum = os.path.getsize(tmp), adler32(tmp)
+        if staged_size != size or (checksum is not None and staged_checksum != checksum):
+            os.remove(tmp)
+            raise OSError(
+                f"Staged copy of {url} does not match the source: size {staged_size} (expected {size}), "
+                f"adler32 {staged_checksum} (expected {checksum})"
+            )
+
+        os.replace(tmp, self._path(name))
+        self._index[url] = {"name": name, "size": size, "adler32": staged_checksum, "last_used": time.time()}
+        self._pinned.add(url)
+        self._save()
+        return self._path(name)
+
+    def stage_files(self, files: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Stages the files of a {sample: [files]} dictionary, returns the same dictionary with the local paths."""
+        staged = {sample: [self.stage(url) for url in flist] for sample, flist in files.items()}
+        print(f"Staging cache {self.directory}: {len(self._index)} files, {self.size / 1e9:.2f} GB")
+        return staged
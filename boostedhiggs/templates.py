@@ -0,0 +1,197 @@
+"""
+Direct template filling: fills the ``combine/make_templates.py`` histogram layout
+(Sample x Systematic x Region x mass_observable) inside the processor, so that the standard
+templates can be made in one pass without writing and re-reading the parquets.
+
+The histograms are filled per dataset and channel with the un-normalized event weights and are merged by coffea.
+The xsec * lumi / sumgenweight normalization needs the full dataset, so it is applied when the templates
+are collected (``python make_templates.py --from-processor``). For the same reason the PDF and QCD scale
+variations are stored one template per weight (``weight_pdf_{i}``, ``weight_scale_{i}``) and are reduced to
+up/down templates bin by bin at that stage.
+"""
+
+import importlib.resources
+import json
+
+import hist as hist2
+import numpy as np
+import pandas as pd
+
+
+def load_templates_config(path=None):
+    """Loads the regions/systematics config (``boostedhiggs/data/templates.json`` by default)."""
+    if path is None:
+        with importlib.resources.path("boostedhiggs.data", "templates.json") as path:
+            with open(path, "r") as f:
+                return json.load(f)
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def get_sample_label(dataset, config):
+    """Returns the label used to combine datasets of the same process (e.g. ggF, TTbar, Data)."""
+    for key, label in config["sample_labels"].items():
+        if key in dataset:
+            return label
+    return dataset
+
+
+def expand_systematics(config, group):
+    """
+    Returns a dict of the systematics of a group with the per-year (uncorrelated) ones expanded,
+        key [str] --> name of systematic to store in the histogram
+        value [tuple] --> (years to apply the systematic for, samples to apply it for, {channel: variable})
+    """
+    systematics = {}
+    for name, syst in config["systematics"][group].items():
+        years = syst.get("years", config["years"])
+        if "{year}" not in name:
+            systematics[name] = (years, syst["samples"], syst["variables"])
+            continue
+
+        for year in years:
+            yearlabel = year.replace("APV", "")  # all APV outputs don't have APV explicitly in the systematics
+            variables = {ch: var.format(yearlabel=yearlabel) for ch, var in syst["variables"].items()}
+            systematics[name.format(year=year)] = ([year], syst["samples"], variables)
+
+    return systematics
+
+
+def get_systematic_names(config):
+    """Returns the categories of the Systematic axis of the templates filled by the processor."""
+    names = ["nominal", "top_reweighting_up", "top_reweighting_down"]
+    for group in ["weight", "btag"]:
+        for syst in expand_systematics(config, group):
+            names += [f"{syst}_up", f"{syst}_down"]
+
+    names += [f"weight_pdf_{i}" for i in range(config["systematics"]["pdf"]["nweights"])]
+    names += [f"weight_scale_{i}" for i in range(config["systematics"]["qcd_scale"]["nweights"])]
+
+    for group in ["mass_shift", "jes"]:
+        for syst in expand_systematics(config, group):
+            names += [f"{syst}_up", f"{syst}_down"]
+
+    return names
+
+
+def make_templates_hist(config, dataset):
+    mass = config["mass_observable"]
+    return hist2.Hist(
+        hist2.axis.StrCategory([dataset], name="Sample", overflow=False),
+        hist2.axis.StrCategory(get_systematic_names(config), name="Systematic", overflow=False),
+        hist2.axis.StrCategory(list(config["regions_sel"]), name="Region", overflow=False),
+        hist2.axis.Variable(
+            list(range(mass["start"], mass["stop"], mass["step"])),
+            name="mass_observable",
+            label=r"Higgs reconstructed mass [GeV]",
+            overflow=True,
+        ),
+        storage=hist2.storage.Weight(),
+    )
+
+
+def fill_templates(h, data: pd.DataFrame, dataset: str, year: str, ch: str, is_data: bool, config):
+    """
+    Fills the templates ``h`` of one dataset with the output dataframe of a chunk, following ``get_templates()``
+    of ``combine/make_templates.py``. Variations whose columns are not in the dataframe (e.g. when running without
+    systematics) are filled with the nominal.
+
+    The EWKvjets cut on the normalized event weight is not applied here, since the normalization is not known yet.
+    """
+    if len(data) == 0:
+        return h
+
+    sample = get_sample_label(dataset, config)
+
+    def applies(yrs, smpls, var):
+        return (sample in smpls) and (year in yrs) and (ch in var)
+
+    def get_nominal(df, region_sel):
+        if is_data:
+            return np.ones(len(df))  # for data (nominal is 1)
+
+        nominal = df[f"weight_{ch}"].values
+        if "bjets" in region_sel:  # if there's a bjet selection, add btag SF to the nominal weight
+            nominal = nominal * df["weight_btag"].values
+        if sample == "TTbar":
+            nominal = nominal * df["top_reweighting"].values
+        return nominal
+
+    def fill(systematic, region, mass, weight):
+        h.fill(Sample=dataset, Systematic=systematic, Region=region, mass_observable=mass, weight=weight)
+
+    # the regions use the score of the finetuned head evaluated in the processor (``THWW_{version}``)
+    if "THWW" not in data and f"THWW_{config['THWW']}" in data:
+        data = data.assign(THWW=data[f"THWW_{config['THWW']}"])
+
+    # apply preselection
+    for selection in config["presel"][ch].values():
+        data = data.query(selection)
+
+    for region, region_sel in config["regions_sel"].items():
+        df = data.query(region_sel)
+        if len(df) == 0:
+            continue
+
+        mass = df["rec_higgs_m"].values
+        nominal = get_nominal(df, region_sel)
+
+        fill("nominal", region, mass, nominal)
+
+        # top pt reweighting: "up" is twice the correction, "down" is no correction
+        if sample in config["systematics"]["top_reweighting"]["samples"]:
+            nominal_noreweighting = nominal / df["top_reweighting"].values
+            fill("top_reweighting_up", region, mass, nominal_noreweighting * df["top_reweighting"].values ** 2)
+            fill("top_reweighting_down", region, mass, nominal_noreweighting)
+        else:
+            fill("top_reweighting_up", region, mass, nominal)
+            fill("top_reweighting_down", region, mass, nominal)
+
+        # weight systematics are stored as the full event weight, btag ones as a factor on top of the nominal
+        for group in ["weight", "btag"]:
+            for syst, (yrs, smpls, var) in expand_systematics(config, group).items():
+                for variation, suffix in [("up", "Up"), ("down", "Down")]:
+                    shape = nominal
+                    if applies(yrs, smpls, var) and (var[ch] + suffix) in df:
+                        shape = df[var[ch] + suffix].values
+                        if group == "btag":
+                            shape = shape * nominal
+                    fill(f"{syst}_{variation}", region, mass, shape)
+
+        # one template per PDF and QCD scale weight
+        for group, column in [("pdf", "weight_pdf"), ("qcd_scale", "weight_scale")]:
+            nweights = config["systematics"][group]["nweights"]
+            name = column + "_{}"
+            if (sample in config["systematics"][group]["samples"]) and (column in df):
+                weights = np.stack(df[column].values) * nominal.reshape(-1, 1)
+                for i in range(nweights):
+                    fill(name.format(i), region, mass, weights[:, i])
+            else:
+                for i in range(nweights):
+                    fill(name.format(i), region, mass, nominal)
+
+        # JER, JMS, JMR and UES shift the mass observable
+        for syst, (yrs, smpls, var) in expand_systematics(config, "mass_shift").items():
+            for variation in ["up", "down"]:
+                shape = mass
+                if applies(yrs, smpls, var) and f"rec_higgs_m{var[ch]}_{variation}" in df:
+                    shape = df[f"rec_higgs_m{var[ch]}_{variation}"].values
+                fill(f"{syst}_{variation}", region, shape, nominal)
+
+    # the individual JES sources also shift the pt used in the region selection
+    for syst, (yrs, smpls, var) in expand_systematics(config, "jes").items():
+        for variation in ["up", "down"]:
+            for region, region_sel in config["regions_sel"].items():
+                shifted = applies(yrs, smpls, var) and f"rec_higgs_m{var[ch]}_{variation}" in data
+                if shifted:
+                    region_sel = region_sel.replace("rec_higgs_pt", f"rec_higgs_pt{var[ch]}_{variation}")
+
+                df = data.query(region_sel)
+                if len(df) == 0:
+                    continue
+
+                mass = df[f"rec_higgs_m{var[ch]}_{variation}"].values if shifted else df["rec_higgs_m"].values
+                fill(f"{syst}_{variation}", region, mass, get_nominal(df, region_sel))
+
+    return h
@@ -0,0 +1,220 @@
+"""
+Builds the training datasets of the tagger finetuning from the parquet ntuples of ``run.py --processor input``.
+
+The events of all the samples are split into train and test by their ``event_hash`` (deterministic, independent of the
+files and jobs), mixed with the relative number of events of each sample of the config, shuffled globally across the
+samples and written to fixed-size shards, as uncompressed Arrow IPC files that can be memory-mapped:
+
+    {outdir}/{split}/shard_{i:05d}.arrow
+    {outdir}/{split}/index.json  (columns, samples, number of rows and first global row of each shard)
+
+Each shard has the columns of the ntuples and ``sample`` (index of the sample in the index). The shuffle needs only the
+event hashes in memory: the rows of each input file are first appended to temporary buckets of their target shard,
+then each bucket is ordered and written as its shard.
+
+The config (e.g. ``training_dataset.yaml``) lists the parquet files (globs) of each sample and its ``ratio``; without
+ratios all the events are kept.
+
+Run e.g. as:
+    python -m boostedhiggs.training_dataset --config training_dataset.yaml --outdir datasets/finetuning
+"""
+
+import glob
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import yaml
+
+from .ntuples import from_arrow_column, hash_fraction
+
+SPLITS = ["train", "test"]
+
+INDEX_FILE = "index.json"
+
+HASH_COLUMN = "event_hash"
+SAMPLE_COLUMN = "sample"
+POSITION_COLUMN = "_position"
+
+
+def load_dataset_config(path: str) -> Dict[str, Dict]:
+    """Returns {sample: {"files": [parquet files], "ratio": ratio or None}} from the yaml config."""
+    with open(path, "r") as f:
+        config = yaml.safe_load(f)
+
+    samples = {}
+    for sample, sample_config in config.items():
+        files = sorted({f for pattern in sample_config["files"] for f in glob.glob(pattern)})
+        if not files:
+            raise FileNotFoundError(f"No parquet files for {sample}: {sample_config['files']}")
+        samples[sample] = {"files": files, "ratio": sample_config.get("ratio")}
+    return samples
+
+
+def split_mask(hashes: np.ndarray, split: str, test_fraction: float) -> np.ndarray:
+    is_test = hash_fraction(hashes) < test_fraction
+    return is_test if split == "test" else ~is_test
+
+
+def mixed_counts(available: Dict[str, int], ratios: Dict[str, Optional[float]]) -> Dict[str, int]:
+    """
+    Returns the number of events of each sample: the largest dataset with the relative numbers of events of ``ratios``
+    (all the events if no ratio is given).
+    """
+    if all(ratio is None for ratio in ratios.values()):
+        return dict(available)
+    if any(ratio is None for ratio in ratios.values()):
+        raise ValueError(f"Either all or none of the samples need a ratio: {ratios}")
+
+    scale = min(available[sample] / ratio for sample, ratio in ratios.items() if ratio > 0)
+    return {sample: min(int(scale * ratio), available[sample]) for sample, ratio in ratios.items()}
+
+
+def plan_split(samples: Dict[str, Dict], split: str, test_fraction: float, rng: np.random.Generator) -> List[Dict]:
+    """
+    Selects the events of a split and returns, per input file, the selected rows and their global positions in the
+    shuffled dataset: [{"file", "sample", "rows", "positions"}].
+    """
+    selected = {}
+    for sample, sample_config in samples.items():
+        selected[sample] = []
+        for f in sample_config["files"]:
+            hashes = pq.read_table(f, columns=[HASH_COLUMN])[HASH_COLUMN].to_numpy()
+            selected[sample].append(np.flatnonzero(split_mask(hashes, split, test_fraction)))
+
+    counts = mixed_counts(
+        {sample: sum(len(rows) for rows in selected[sample]) for sample in samples},
+        {sample: sample_config["ratio"] for sample, sample_config in samples.items()},
+    )
+
+    plan = []
+    for sample, sample_config in samples.items():
+        nrows = np.cumsum([0] + [len(rows) for rows in selected[sample]])
+        # subsample uniformly over the files of the sample
+        keep = np.sort(rng.choice(nrows[-1], counts[sample], replace=False))
+        for i, f in enumerate(sample_config["files"]):
+            rows = selected[sample][i][keep[(keep >= nrows[i]) & (keep < nrows[i + 1])] - nrows[i]]
+            plan.append({"file": f, "sample": sample, "rows": rows})
+
+    # global shuffle of all the selected events
+    positions = rng.permutation(sum(len(entry["rows"]) for entry in plan))
+    start = 0
+    for entry in plan:
+        entry["positions"] = positions[start : start + len(entry["rows"])]
+        start += len(entry["rows"])
+
+    return plan
+
+
+def write_split(
+    plan: List[Dict], samples: List[str], outdir: str, shard_size: int, columns: Optional[List[str]] = None
+) -> Dict:
+    """Writes the shards of a split and returns its index."""
+    os.makedirs(outdir, exist_ok=True)
+    bucket_dir = os.path.join(outdir, ".buckets")
+    os.makedirs(bucket_dir, exist_ok=True)
+
+    # 1) append the rows of each file to the buckets of their shards
+    schema = None
+    buckets = {}
+    for entry in plan:
+        if len(entry["rows"]) == 0:
+            continue
+        table = pq.read_table(entry["file"], columns=columns).take(entry["rows"])
+        table = table.append_column(SAMPLE_COLUMN, pa.array(np.full(len(table), samples.index(entry["sample"]), np.int16)))
+        table = table.append_column(POSITION_COLUMN, pa.array(entry["positions"]))
+        if schema is None:
+            schema = table.schema
+        elif set(table.schema.names) != set(schema.names):
+            raise ValueError(f"{entry['file']} does not have the columns of the other ntuples")
+        table = table.select(schema.names).cast(schema)
+
+        shards = entry["positions"] // shard_size
+        for shard in np.unique(shards):
+            if shard not in buckets:
+                buckets[shard] = pa.ipc.new_stream(os.path.join(bucket_dir, f"{shard}.arrow"), schema)
+            buckets[shard].write_table(table.filter(pa.array(shards == shard)))
+
+    for writer in buckets.values():
+        writer.close()
+
+    # 2) order the rows of each bucket and write it as a shard (in one record batch, to be memory-mapped as is)
+    shards = []
+    offset = 0
+    for shard in sorted(buckets):
+        bucket = os.path.join(bucket_dir, f"{shard}.arrow")
+        with pa.memory_map(bucket) as source:
+            table = pa.ipc.open_stream(source).read_all()
+        table = table.take(np.argsort(from_arrow_column(table[POSITION_COLUMN]))).drop([POSITION_COLUMN])
+        table = table.combine_chunks()
+
+        filename = f"shard_{shard:05d}.arrow"
+        with pa.ipc.new_file(os.path.join(outdir, filename), table.schema) as writer:
+            writer.write_table(table, max_chunksize=len(table))
+        os.remove(bucket)
+
+        shards.append({"file": filename, "nrows": len(table), "offset": offset})
+        offset += len(table)
+
+    os.rmdir(bucket_dir)
+
+    return {
+        "columns": [name for name in schema.names if name != POSITION_COLUMN] if schema is not None else [],
+        "samples": samples,
+        "nrows": offset,
+        "shards": shards,
+    }
+
+
+def write_dataset(
+    samples: Dict[str, Dict],
+    outdir: str,
+    shard_size: int = 100000,
+    test_fraction: float = 0.4,
+    seed: int = 42,
+    columns: Optional[List[str]] = None,
+):
+    rng = np.random.default_rng(seed)
+    for split in SPLITS:
+        plan = plan_split(samples, split, test_fraction, rng)
+        index = write_split(plan, list(samples), os.path.join(outdir, split), shard_size, columns)
+        index.update({"test_fraction": test_fraction, "seed": seed, "shard_size": shard_size})
+        with open(os.path.join(outdir, split, INDEX_FILE), "w") as f:
+            json.dump(index, f, indent=4)
+        print(f"{split}: {index['nrows']} events in {len(index['shards'])} shards")
+
+
+def load_index(outdir: str, split: str) -> Dict:
+    with open(os.path.join(outdir, split, INDEX_FILE), "r") as f:
+        return json.load(f)
+
+
+def open_shard(outdir: str, split: str, shard: Dict) -> pa.Table:
+    """Returns the table of a shard (an entry of the index), memory-mapped (the columns are not read until used)."""
+    source = pa.memory_map(os.path.join(outdir, split, shard["file"]))
+    return pa.ipc.open_file(source).read_all()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config", required=True, type=str, help="yaml with the parquet files and ratio of each sample")
+    parser.add_argument("--outdir", required=True, type=str, help="output directory of the train and test shards")
+    parser.add_argument("--shard-size", dest="shard_size", default=100000, type=int, help="number of events per shard")
+    parser.add_argument("--test-fraction", dest="test_fraction", default=0.4, type=float, help="fraction of test events")
+    parser.add_argument("--seed", default=42, type=int, help="seed of the sample mixing and the shuffle")
+    parser.add_argument("--columns", default=None, type=str, help="columns to keep, separated by commas (default: all)")
+    args = parser.parse_args()
+
+    write_dataset(
+        load_dataset_config(args.config),
+        args.outdir,
+        shard_size=args.shard_size,
+        test_fraction=args.test_fraction,
+        seed=args.seed,
+        columns=args.columns.split(",") if args.columns else None,
+    )
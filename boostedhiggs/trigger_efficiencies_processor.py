@@ -1,8 +1,10 @@
 import importlib.resources
 import json
 import warnings
+from typing import Dict
 
 import awkward as ak
+import hist
 import numpy as np
 from coffea.analysis_tools import PackedSelection, Weights
 from coffea.nanoevents.methods import candidate
@@ -14,12 +16,46 @@ from boostedhiggs.corrections import (
     add_VJets_kFactors,
     corrected_msoftdrop,
 )
-from boostedhiggs.utils import match_H
+from boostedhiggs.matching import nearest
+from boostedhiggs.utils import get_bit_mask, get_bitmap, match_H, pack_bits
 
 # we suppress ROOT warnings where our input ROOT tree has duplicate branches - these are handled correctly.
 warnings.filterwarnings("ignore", message="Found duplicate branch ")
 
 
+def load_trigger_hist_config(path=None):
+    """
+    Loads the variables, histograms and trigger groups of the histogram mode
+    (``boostedhiggs/data/trigger_histograms.json`` by default).
+    """
+    if path is None:
+        with importlib.resources.path("boostedhiggs.data", "trigger_histograms.json") as path:
+            with open(path, "r") as f:
+                return json.load(f)
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def make_trigger_hists(config: Dict, channel: str) -> Dict[str, hist.Hist]:
+    """
+    Returns the histograms of a channel, with a trigger group axis and a pass axis: the denominator of a trigger group
+    is ``h[{"trigger": group, "pass": sum}]`` and its numerator ``h[{"trigger": group, "pass": True}]``.
+    """
+    hists = {}
+    for name, variables in config["histograms"].items():
+        hists[name] = hist.Hist(
+            hist.axis.StrCategory(list(config["trigger_groups"][channel]), name="trigger"),
+            hist.axis.Boolean(name="pass"),
+            *[
+                hist.axis.Variable(config["variables"][var]["edges"], name=var, label=config["variables"][var]["label"])
+                for var in variables
+            ],
+            storage=hist.storage.Weight(),
+        )
+    return hists
+
+
 def build_p4(cand):
     return ak.zip(
         {
@@ -35,9 +71,15 @@ def build_p4(cand):
 
 
 class TriggerEfficienciesProcessor(ProcessorABC):
-    """Accumulates yields from all input events: 1) before triggers, and 2) after triggers"""
+    """
+    Accumulates yields from all input events: 1) before triggers, and 2) after triggers
+
+    By default the variables, trigger bits and weights of the selected events are returned as columns. With
+    ``histograms=True`` the denominator and numerator histograms of ``hist_config`` (see ``make_trigger_hists``) are
+    filled instead, so that the output size does not depend on the number of events.
+    """
 
-    def __init__(self, year="2017"):
+    def __init__(self, year="2017", histograms=False, hist_config=None):
         super(TriggerEfficienciesProcessor, self).__init__()
         self._year = year
         self._trigger_dict = {
@@ -58,11 +100,24 @@ class TriggerEfficienciesProcessor(ProcessorABC):
 
         self._channels = ["ele", "mu"]
 
+        self._histograms = histograms
+        if self._histograms:
+            self._hist_config = load_trigger_hist_config(hist_config)
+            for channel in self._channels:
+                for group, triggers in self._hist_config["trigger_groups"][channel].items():
+                    unknown = [t for t in triggers if t not in self._trigger_dict]
+                    if unknown:
+                        raise ValueError(f"Unknown triggers {unknown} in trigger group {group} ({channel})")
+
         # https://twiki.cern.ch/twiki/bin/view/CMS/MissingETOptionalFiltersRun2
         with importlib.resources.path("boostedhiggs.data", "metfilters.json") as path:
             with open(path, "r") as f:
                 self._metfilters = json.load(f)[self._year]
 
+        # bit positions of the HLT paths and MET filters in the packed uint64 bitmasks
+        self._hlt_bitmap = get_bitmap([t for paths in self._trigger_dict.values() for t in paths])
+        self._metfilter_bitmap = get_bitmap([mf for filters in self._metfilters.values() for mf in filters])
+
     def pad_val(
         self,
         arr: ak.Array,
@@ -95,24 +150,23 @@ class TriggerEfficienciesProcessor(ProcessorABC):
             out[channel]["triggers"] = {}
 
         """ Save OR of triggers as booleans """
+        hlt_bits = pack_bits(events.HLT, self._hlt_bitmap)
         for channel in self._channels:
             HLT_triggers = {}
             for t in self._triggers[channel]:
-                HLT_triggers["HLT_" + t] = np.any(
-                    np.array([events.HLT[trigger] for trigger in self._trigger_dict[t] if trigger in events.HLT.fields]),
-                    axis=0,
-                )
+                HLT_triggers["HLT_" + t] = (hlt_bits & get_bit_mask(self._hlt_bitmap, self._trigger_dict[t])) != 0
             out[channel]["triggers"] = {**out[channel]["triggers"], **HLT_triggers}
 
         ######################
         # METFLITERS
         ######################
 
-        metfilters = np.ones(nevents, dtype="bool")
+        metfilter_bits = pack_bits(events.Flag, self._metfilter_bitmap)
         metfilterkey = "mc" if self.isMC else "data"
-        for mf in self._metfilters[metfilterkey]:
-            if mf in events.Flag.fields:
-                metfilters = metfilters & events.Flag[mf]
+        metfilter_mask = get_bit_mask(
+            self._metfilter_bitmap, [mf for mf in self._metfilters[metfilterkey] if mf in events.Flag.fields]
+        )
+        metfilters = (metfilter_bits & metfilter_mask) == metfilter_mask
 
         ######################
         # OBJECT DEFINITION
@@ -197,7 +251,7 @@ class TriggerEfficienciesProcessor(ProcessorABC):
         good_fatjets = good_fatjets[ak.argsort(good_fatjets.pt, ascending=False)]  # sort them by pt
 
         # OBJECT: candidate fatjet
-        fj_idx_lep = ak.argmin(good_fatjets.delta_r(candidatelep_p4), axis=1, keepdims=True)
+        fj_idx_lep = nearest(good_fatjets, candidatelep_p4, keepdims=True)
         candidatefj = ak.firsts(good_fatjets[fj_idx_lep])
 
         met = events.MET
@@ -214,15 +268,19 @@ class TriggerEfficienciesProcessor(ProcessorABC):
         # Baseline weight
         ######################
 
-        self.weights.add("genweight", events.genWeight)
-        self.weights.add(
-            "L1Prefiring",
-            events.L1PreFiringWeight.Nom,
-            events.L1PreFiringWeight.Up,
-            events.L1PreFiringWeight.Dn,
-        )
-        add_pileup_weight(self.weights, self._year, "", nPU=ak.to_numpy(events.Pileup.nPU))
-        add_VJets_kFactors(self.weights, events.GenPart, dataset, events)
+        if self.isMC:
+            self.weights.add("genweight", events.genWeight)
+            self.weights.add(
+                "L1Prefiring",
+                events.L1PreFiringWeight.Nom,
+                events.L1PreFiringWeight.Up,
+                events.L1PreFiringWeight.Dn,
+            )
+            add_pileup_weight(self.weights, self._year, "", nPU=ak.to_numpy(events.Pileup.nPU))
+            add_VJets_kFactors(self.weights, events.GenPart, dataset, events)
+
+        # the event-level weights, the lepton SFs are added per channel
+        event_weights = list(self.weights._weights.keys())
 
         ######################
         # Baseline selection
@@ -230,8 +288,10 @@ class TriggerEfficienciesProcessor(ProcessorABC):
 
         for channel in self._channels:
             selection = PackedSelection()
+            previous_weights = list(self.weights._weights.keys())
             if channel == "mu":
-                add_lepton_weight(self.weights, candidatelep, self._year, "muon")
+                if self.isMC:
+                    add_lepton_weight(self.weights, candidatelep, self._year, "muon")
                 selection.add(
                     "OneLep",
                     ((n_good_muons == 1) & (n_loose_electrons == 0)),
@@ -239,7 +299,8 @@ class TriggerEfficienciesProcessor(ProcessorABC):
                 selection.add("NoTaus", (n_loose_taus_mu == 0))
 
             elif channel == "ele":
-                add_lepton_weight(self.weights, candidatelep, self._year, "electron")
+                if self.isMC:
+                    add_lepton_weight(self.weights, candidatelep, self._year, "electron")
                 selection.add(
                     "OneLep",
                     ((n_loose_muons == 0) & (n_good_electrons == 1)),
@@ -273,6 +334,19 @@ class TriggerEfficienciesProcessor(ProcessorABC):
                 matchedH_pt = ak.zeros_like(candidatefj.pt)
             out[channel]["vars"]["fj_genH_pt"] = pad_val_nevents(matchedH_pt).data
 
+            if self._histograms:
+                # only the lepton SFs of this channel, and not the trigger SFs (circular for a trigger efficiency)
+                lepton_weights = [
+                    key for key in self.weights._weights if key not in previous_weights and not key.startswith("trigger")
+                ]
+                weight = np.ones(nevents)
+                if self.isMC:
+                    weight = self.weights.partial_weight(include=event_weights + lepton_weights)
+                out[channel] = self.fill_histograms(
+                    channel, hlt_bits, out[channel]["vars"], weight, selection.all(*selection.names)
+                )
+                continue
+
             out[channel]["weights"] = {}
             for key in self.weights._weights.keys():
                 # store the individual weights (ONLY for now until we debug)
@@ -287,11 +361,38 @@ class TriggerEfficienciesProcessor(ProcessorABC):
                     for (key, value) in out[channel][key_].items()
                 }
 
+        if self._histograms:
+            return {self._year: {dataset: {"nevents": nevents, "histograms": out}}}
+
         return {self._year: {dataset: {"nevents": nevents, "skimmed_events": out}}}
 
+    def fill_histograms(
+        self, channel: str, hlt_bits: np.ndarray, variables: Dict[str, np.ndarray], weight: np.ndarray, selection: np.ndarray
+    ) -> Dict[str, hist.Hist]:
+        """Fills the histograms of a channel with the selected events, once per trigger group (pass: OR of its triggers)."""
+        hists = make_trigger_hists(self._hist_config, channel)
+        variables = {var: np.asarray(value)[selection] for var, value in variables.items()}
+        weight = weight[selection]
+
+        for group, triggers in self._hist_config["trigger_groups"][channel].items():
+            paths = [path for t in triggers for path in self._trigger_dict[t]]
+            passed = ((hlt_bits & get_bit_mask(self._hlt_bitmap, paths)) != 0)[selection]
+            for name, h in hists.items():
+                h.fill(
+                    trigger=group,
+                    **{"pass": passed},
+                    **{var: variables[var] for var in self._hist_config["histograms"][name]},
+                    weight=weight,
+                )
+
+        return hists
+
     def postprocess(self, accumulator):
         for year, datasets in accumulator.items():
             for dataset, output in datasets.items():
+                # the histograms are merged by the accumulator as they are
+                if "skimmed_events" not in output:
+                    continue
                 for channel in output["skimmed_events"].keys():
                     for key_ in output["skimmed_events"][channel].keys():
                         output["skimmed_events"][channel][key_] = {
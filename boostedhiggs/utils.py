@@ -1,3 +1,6 @@
+import functools
+import importlib.resources
+import json
 from typing import Dict, List, Tuple, Union
 
 import awkward as ak
@@ -6,6 +9,8 @@ from coffea.analysis_tools import PackedSelection
 from coffea.nanoevents.methods.base import NanoEventsArray
 from coffea.nanoevents.methods.nanoaod import FatJetArray, GenParticleArray
 
+from .matching import any_within, count_within, delta_r_to, nearest
+
 d_PDGID = 1
 c_PDGID = 4
 b_PDGID = 5
@@ -35,6 +40,83 @@ FILL_NONE_VALUE = -99999
 JET_DR = 0.8
 
 
+def split_year(year: str) -> Tuple[str, str]:
+    """Splits a year tag into the year and the year modifier, e.g. "2016APV" -> ("2016", "APV")."""
+    if "APV" in year:
+        return year.replace("APV", ""), "APV"
+    return year, ""
+
+
+def make_multiyear_fileset(files: Dict[str, Dict[str, List[str]]]) -> Dict[str, Dict]:
+    """
+    Builds one coffea fileset out of the files of several years, ``{year: {sample: [files]}}``.
+    The datasets are tagged with their year ("{sample}_{year}") and carry the year and the sample name as metadata
+    (``events.metadata["year"]``, ``events.metadata["sample"]``), so that the processors can resolve the
+    year-specific configuration per chunk.
+    """
+    fileset = {}
+    for year, samples in files.items():
+        for sample, flist in samples.items():
+            fileset[f"{sample}_{year}"] = {"files": flist, "metadata": {"year": year, "sample": sample}}
+    return fileset
+
+
+@functools.lru_cache(maxsize=None)
+def get_year_config(year: str) -> Dict:
+    """
+    Returns the trigger paths and MET filters of a year (without the APV modifier) and their bitmaps,
+    loaded once per year and process.
+    """
+    with importlib.resources.path("boostedhiggs.data", "triggers.json") as path:
+        with open(path, "r") as f:
+            hlts = json.load(f)[year]
+
+    # https://twiki.cern.ch/twiki/bin/view/CMS/MissingETOptionalFiltersRun2
+    with importlib.resources.path("boostedhiggs.data", "metfilters.json") as path:
+        with open(path, "r") as f:
+            metfilters = json.load(f)[year]
+
+    return {
+        "HLTs": hlts,
+        "metfilters": metfilters,
+        # bit positions of the HLT paths and MET filters in the packed uint64 bitmasks
+        "hlt_bitmap": get_bitmap([t for paths in hlts.values() for t in paths]),
+        "metfilter_bitmap": get_bitmap([mf for filters in metfilters.values() for mf in filters]),
+        "dataset_per_ch": {
+            "ele": "EGamma" if year == "2018" else "SingleElectron",
+            "mu": "SingleMuon",
+        },
+    }
+
+
+def get_bitmap(names: List[str]) -> Dict[str, int]:
+    """
+    Assigns a bit to each (unique) name in order of appearance, e.g. to all the HLT paths of a year in ``triggers.json``
+    or all the MET filters in ``metfilters.json``, so that the decisions can be packed into one uint64 per event.
+    """
+    bitmap = {name: bit for bit, name in enumerate(dict.fromkeys(names))}
+    if len(bitmap) > 64:
+        raise ValueError(f"Cannot pack {len(bitmap)} decisions into a uint64 bitmask")
+    return bitmap
+
+
+def pack_bits(branch: ak.Array, bitmap: Dict[str, int]) -> np.ndarray:
+    """Packs the decisions of ``branch`` (e.g. events.HLT) into a uint64 bitmask per event, missing fields stay 0."""
+    bits = np.zeros(len(branch), dtype=np.uint64)
+    for name, bit in bitmap.items():
+        if name in branch.fields:
+            bits |= ak.to_numpy(branch[name]).astype(np.uint64) << np.uint64(bit)
+    return bits
+
+
+def get_bit_mask(bitmap: Dict[str, int], names: List[str]) -> np.uint64:
+    """Returns the mask selecting the bits of ``names``."""
+    mask = np.uint64(0)
+    for name in names:
+        mask |= np.uint64(1) << np.uint64(bitmap[name])
+    return mask
+
+
 def get_pid_mask(
     genparts: GenParticleArray,
     pdgids: Union[int, list],
@@ -57,6 +139,14 @@ def get_pid_mask(
     return ak.all(mask, axis=ax) if byall else mask
 
 
+def get_lhe_weights(events: NanoEventsArray, branch: str) -> np.ndarray:
+    """
+    Returns the LHE weight vectors stored in ``branch`` (e.g. LHEPdfWeight, LHEScaleWeight)
+    as a dense (nevents, nweights) float32 array.
+    """
+    return ak.to_numpy(ak.to_regular(events[branch], axis=1)).astype(np.float32)
+
+
 def to_label(array: ak.Array) -> ak.Array:
     return ak.values_astype(array, np.int32)
 
@@ -72,9 +162,9 @@ def match_H(
     higgs = genparts[get_pid_mask(genparts, HIGGS_PDGID, byall=False) * genparts.hasFlags(GEN_FLAGS)]
 
     # pick higgs closest to jet (no requirement of matching yet)
-    matched_higgs = higgs[ak.argmin(fatjet.delta_r(higgs), axis=1, keepdims=True)]
+    matched_higgs = higgs[nearest(higgs, fatjet, keepdims=True)]
     # make a mask
-    matched_higgs_mask = ak.any(fatjet.delta_r(matched_higgs) < 0.8, axis=1)
+    matched_higgs_mask = any_within(matched_higgs, fatjet, 0.8)
 
     # get the higgs closest to jet
     matched_higgs = ak.firsts(matched_higgs)
@@ -128,12 +218,9 @@ def match_H(
 
         # num_m: number of matched leptons
         # number of quarks excludes neutrino and leptons
-        num_m_quarks = ak.sum(fatjet.delta_r(all_daus_flat[all_daus_flat_pdgId <= b_PDGID]) < JET_DR, axis=1)
-        num_m_leptons = ak.sum(fatjet.delta_r(all_daus_flat[leptons]) < JET_DR, axis=1)
-        num_m_bquarks = ak.sum(
-            fatjet.delta_r(all_daus_flat[all_daus_flat.pdgId == b_PDGID]) < JET_DR,
-            axis=1,
-        )
+        num_m_quarks = count_within(all_daus_flat[all_daus_flat_pdgId <= b_PDGID], fatjet, JET_DR)
+        num_m_leptons = count_within(all_daus_flat[leptons], fatjet, JET_DR)
+        num_m_bquarks = count_within(all_daus_flat[all_daus_flat.pdgId == b_PDGID], fatjet, JET_DR)
 
         lep_daughters = all_daus_flat[leptons]
         # parent = ak.firsts(lep_daughters[fatjet.delta_r(lep_daughters) < JET_DR].distinctParent)
@@ -235,8 +322,8 @@ def match_H(
 
 def match_V(genparts: GenParticleArray, fatjet: FatJetArray):
     vs = genparts[get_pid_mask(genparts, [W_PDGID, Z_PDGID], byall=False) * genparts.hasFlags(GEN_FLAGS)]
-    matched_vs = vs[ak.argmin(fatjet.delta_r(vs), axis=1, keepdims=True)]
-    matched_vs_mask = ak.any(fatjet.delta_r(matched_vs) < JET_DR, axis=1)
+    matched_vs = vs[nearest(vs, fatjet, keepdims=True)]
+    matched_vs_mask = any_within(matched_vs, fatjet, JET_DR)
 
     daughters = ak.flatten(matched_vs.distinctChildren, axis=2)
     daughters = daughters[daughters.hasFlags(["fromHardProcess", "isLastCopy"])]
@@ -255,20 +342,20 @@ def match_V(genparts: GenParticleArray, fatjet: FatJetArray):
     daughters_nov = daughters[
         ((daughters_pdgId != vELE_PDGID) & (daughters_pdgId != vMU_PDGID) & (daughters_pdgId != vTAU_PDGID))
     ]
-    nprongs = ak.sum(fatjet.delta_r(daughters_nov) < JET_DR, axis=1)
+    nprongs = count_within(daughters_nov, fatjet, JET_DR)
 
     lepdaughters = daughters[
         ((daughters_pdgId == ELE_PDGID) | (daughters_pdgId == MU_PDGID) | (daughters_pdgId == TAU_PDGID))
     ]
     lepinprongs = 0
     if len(lepdaughters) > 0:
-        lepinprongs = ak.sum(fatjet.delta_r(lepdaughters) < JET_DR, axis=1)  # should be 0 or 1
+        lepinprongs = count_within(lepdaughters, fatjet, JET_DR)  # should be 0 or 1
 
     # number of c quarks
     cquarks = daughters_nov[abs(daughters_nov.pdgId) == c_PDGID]
-    ncquarks = ak.sum(fatjet.delta_r(cquarks) < JET_DR, axis=1)
+    ncquarks = count_within(cquarks, fatjet, JET_DR)
 
-    matched_vdaus_mask = ak.any(fatjet.delta_r(daughters) < 0.8, axis=1)
+    matched_vdaus_mask = any_within(daughters, fatjet, 0.8)
     matched_mask = matched_vs_mask & matched_vdaus_mask
     genVars = {
         "gen_V_pt": ak.firsts(vs.pt),
@@ -291,8 +378,8 @@ def match_V(genparts: GenParticleArray, fatjet: FatJetArray):
 
 def match_Top(genparts: GenParticleArray, fatjet: FatJetArray):
     tops = genparts[get_pid_mask(genparts, TOP_PDGID, byall=False) * genparts.hasFlags(GEN_FLAGS)]
-    matched_tops = tops[fatjet.delta_r(tops) < JET_DR]
-    num_matched_tops = ak.sum(fatjet.delta_r(matched_tops) < JET_DR, axis=1)
+    matched_tops = tops[delta_r_to(tops, fatjet) < JET_DR]
+    num_matched_tops = count_within(matched_tops, fatjet, JET_DR)
 
     # take all possible daughters!
     daughters = ak.flatten(tops.distinctChildren, axis=2)
@@ -343,16 +430,16 @@ def match_Top(genparts: GenParticleArray, fatjet: FatJetArray):
     taudecay = ak.sum(taudecay, axis=-1)
 
     # get number of matched daughters
-    num_m_quarks_nob = ak.sum(fatjet.delta_r(wboson_daughters[quarks]) < JET_DR, axis=1)
-    num_m_bquarks = ak.sum(fatjet.delta_r(bquark) < JET_DR, axis=1)
-    num_m_cquarks = ak.sum(fatjet.delta_r(wboson_daughters[cquarks]) < JET_DR, axis=1)
-    num_m_leptons = ak.sum(fatjet.delta_r(wboson_daughters[leptons]) < JET_DR, axis=1)
-    num_m_electrons = ak.sum(fatjet.delta_r(wboson_daughters[electrons]) < JET_DR, axis=1)
-    num_m_muons = ak.sum(fatjet.delta_r(wboson_daughters[muons]) < JET_DR, axis=1)
-    num_m_taus = ak.sum(fatjet.delta_r(wboson_daughters[taus]) < JET_DR, axis=1)
-
-    matched_tops_mask = ak.any(fatjet.delta_r(tops) < JET_DR, axis=1)
-    matched_topdaus_mask = ak.any(fatjet.delta_r(daughters) < JET_DR, axis=1)
+    num_m_quarks_nob = count_within(wboson_daughters[quarks], fatjet, JET_DR)
+    num_m_bquarks = count_within(bquark, fatjet, JET_DR)
+    num_m_cquarks = count_within(wboson_daughters[cquarks], fatjet, JET_DR)
+    num_m_leptons = count_within(wboson_daughters[leptons], fatjet, JET_DR)
+    num_m_electrons = count_within(wboson_daughters[electrons], fatjet, JET_DR)
+    num_m_muons = count_within(wboson_daughters[muons], fatjet, JET_DR)
+    num_m_taus = count_within(wboson_daughters[taus], fatjet, JET_DR)
+
+    matched_tops_mask = any_within(tops, fatjet, JET_DR)
+    matched_topdaus_mask = any_within(daughters, fatjet, JET_DR)
     matched_mask = matched_tops_mask & matched_topdaus_mask
 
     genVars = {
@@ -385,7 +472,7 @@ def match_QCD(genparts: GenParticleArray, fatjets: FatJetArray) -> Tuple[np.arra
     """Gen matching for QCD samples, arguments as defined in `tagger_gen_matching`."""
 
     partons = genparts[get_pid_mask(genparts, [g_PDGID] + list(range(1, b_PDGID + 1)), ax=1, byall=False)]
-    matched_mask = ak.any(fatjets.delta_r(partons) < JET_DR, axis=1)
+    matched_mask = any_within(partons, fatjets, JET_DR)
 
     genVars = {
         "fj_isQCD": np.ones(len(genparts), dtype="bool"),
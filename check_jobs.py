@@ -40,24 +40,36 @@ def main(args):
     print(f"Loading files from {splitname}")
     _, nfiles_per_job = loadFiles(config, args.configkey, args.year, args.pfnano, slist, splitname)
 
+    # jobs defined as entry ranges (condor/submit.py --events-per-job) are named by their range
+    ranges = {}
+    ranges_file = f"{condordir}/{args.tag}_{args.year}/ranges_{args.configkey}.json"
+    if os.path.exists(ranges_file):
+        with open(ranges_file, "r") as f:
+            ranges = json.load(f)
+
     samples = slist if args.slist is not None else files.keys()
     nfailed = 0
     # submit a cluster of jobs per sample
     for sample in samples:
-        tot_files = len(files[sample])
-
-        if sample not in nfiles_per_job.keys():
+        if sample in ranges:
+            job_names = [job["name"] for job in ranges[sample]]
+        elif sample in nfiles_per_job.keys():
+            tot_files = len(files[sample])
+            njobs = ceil(tot_files / nfiles_per_job[sample])
+            job_names = [
+                f"{x}-{x+nfiles_per_job[sample]}" for x in range(0, njobs * nfiles_per_job[sample], nfiles_per_job[sample])
+            ]
+        else:
             continue
 
-        njobs = ceil(tot_files / nfiles_per_job[sample])
+        njobs = len(job_names)
 
         njobs_produced = len(glob.glob1(f"{outdir}/{sample}/outfiles", "*.pkl"))
 
         id_failed = []
         if njobs_produced != njobs:  # debug which pkl file wasn't produced
             print(f"-----> SAMPLE {sample} HAS RAN INTO ERROR, #jobs produced: {njobs_produced}, # jobs {njobs}")
-            for i, x in enumerate(range(0, njobs * nfiles_per_job[sample], nfiles_per_job[sample])):
-                fname = f"{x}-{x+nfiles_per_job[sample]}"
+            for i, fname in enumerate(job_names):
                 print(f"{outdir}/{sample}/outfiles/{fname}.pkl")
                 if not os.path.exists(f"{outdir}/{sample}/outfiles/{fname}.pkl"):
                     print(f"file {fname}.pkl wasn't produced which means job_idx {i} failed..")
@@ -22,7 +22,9 @@ from utils import (
     combine_samples,
     combine_samples_by_name,
     get_finetuned_score,
+    get_weight_vectors,
     get_xsecweight,
+    read_parquets,
     sigs,
 )
 
@@ -51,7 +53,7 @@ def get_common_sample_name(sample):
     return sample_to_use
 
 
-def get_templates(years, channels, samples, samples_dir, regions_sel, model_path, add_fake=False):
+def get_templates(years, channels, samples, samples_dir, regions_sel, model_path, add_fake=False, sidecars=[]):
     """
     Postprocesses the parquets by applying preselections, and fills templates for different regions.
 
@@ -63,6 +65,7 @@ def get_templates(years, channels, samples, samples_dir, regions_sel, model_path
         regions_sel [dict]: key is the name of the region; value is the selection (e.g. `{"pass": (THWW>0.90)}`)
         model_path [str]: path to the ParT finetuned model.onnx
         add_fake [Bool]: if True will include Fake as an additional sample in the output hists
+        sidecars [list]: sidecar column families to join onto the nominal parquets (e.g. ["lhe", "jec"])
 
     Returns
         a dict() object hists[region] that contains histograms with 4 axes (Sample, Systematic, Region, mass_observable)
@@ -406,14 +409,14 @@ def get_templates(years, channels, samples, samples_dir, regions_sel, model_path
                     continue
 
                 try:
-                    data = pd.read_parquet(parquet_files)
+                    data = read_parquets(parquet_files, sidecars)
                 except pyarrow.lib.ArrowInvalid:  # empty parquet because no event passed selection
                     continue
 
                 if len(data) == 0:
                     continue
 
-                # use hidNeurons to get the finetuned scores
+                # use hidNeurons to get the finetuned scores (or the THWW_{version} scores evaluated in the processor)
                 data["THWW"] = get_finetuned_score(data, model_path)
 
                 # drop hidNeurons which are not needed anymore
@@ -563,17 +566,11 @@ def get_templates(years, channels, samples, samples_dir, regions_sel, model_path
                     and https://github.com/LPC-HH/HHLooper/blob/master/app/HHLooper.cc#L1488
                     """
                     if sample_to_use in ["ggF", "VBF", "WH", "ZH", "ttH"]:
-                        pdfweights = []
+                        # noqa: get the normalization factor per variation i (ratio of sumpdfweights_i/sumgenweights)
+                        R = sumpdfweights / sumgenweights
 
-                        for weight_i in sumpdfweights:
-
-                            # noqa: get the normalization factor per variation i (ratio of sumpdfweights_i/sumgenweights)
-                            R_i = sumpdfweights[weight_i] / sumgenweights
-
-                            pdfweight = df[f"weight_pdf{weight_i}"].values * nominal / R_i
-                            pdfweights.append(pdfweight)
-
-                        pdfweights = np.swapaxes(np.array(pdfweights), 0, 1)  # so that the shape is (# events, variation)
+                        # shape is (# events, variation)
+                        pdfweights = get_weight_vectors(df, "weight_pdf", len(R)) * nominal.values.reshape(-1, 1) / R
 
                         abs_unc = np.linalg.norm((pdfweights - nominal.values.reshape(-1, 1)), axis=1)
                         # cap at 100% uncertainty
@@ -605,7 +602,7 @@ def get_templates(years, channels, samples, samples_dir, regions_sel, model_path
 
                     """
                     For the QCD acceptance uncertainty:
-                    - we save the individual weights [0, 1, 3, 5, 7, 8]
+                    - we save the 9 weights as a fixed-size list column "weight_scale" and use [0, 1, 3, 5, 7, 8]
                     - postprocessing: we obtain sum_sumlheweight
                     - postprocessing: we obtain LHEScaleSumw: sum_sumlheweight[i] / sum_sumgenweight
                     - postprocessing:
@@ -617,25 +614,14 @@ def get_templates(years, channels, samples, samples_dir, regions_sel, model_path
                     """
                     if sample_to_use in ["ggF", "VBF", "WH", "ZH", "ttH", "WJetsLNu", "TTbar"]:
 
-                        R_4 = sumscaleweights[4] / sumgenweights
-                        scaleweight_4 = df["weight_scale4"].values * nominal / R_4
-
-                        scaleweights = []
-                        for weight_i in sumscaleweights:
-                            if weight_i == 4:
-                                continue
+                        # noqa: get the normalization factor per variation i (ratio of sumscaleweights_i/sumgenweights)
+                        R = sumscaleweights / sumgenweights
 
-                            # noqa: get the normalization factor per variation i (ratio of sumscaleweights_i/sumgenweights)
-                            R_i = sumscaleweights[weight_i] / sumgenweights
-                            scaleweight_i = df[f"weight_scale{weight_i}"].values * nominal / R_i
+                        # shape is (# events, variation)
+                        scaleweights = get_weight_vectors(df, "weight_scale", len(R)) * nominal.values.reshape(-1, 1) / R
 
-                            scaleweights.append(scaleweight_i)
-
-                        scaleweights = np.array(scaleweights)
-
-                        scaleweights = np.swapaxes(
-                            np.array(scaleweights), 0, 1
-                        )  # so that the shape is (# events, variation)
+                        scaleweight_4 = scaleweights[:, 4]
+                        scaleweights = scaleweights[:, [0, 1, 3, 5, 7, 8]]
 
                         # TODO: debug
                         shape_up = nominal * np.max(scaleweights, axis=1) / scaleweight_4
@@ -763,6 +749,131 @@ def get_templates(years, channels, samples, samples_dir, regions_sel, model_path
     return hists
 
 
+def reduce_processor_templates(h, xsecweight, sumgenweights, sumpdfweights, sumscaleweights):
+    """
+    Normalizes the templates of one dataset filled by the processor (``run.py --templates``) and reduces the
+    per-weight PDF and QCD scale templates to up/down templates, bin by bin.
+
+    Returns
+        a dict() object templates[systematic] = (values, variances) with the (Region, mass_observable) arrays
+    """
+
+    systs = list(h.axes["Systematic"])
+    values = h.view(flow=True).value[0] * xsecweight
+    variances = h.view(flow=True).variance[0] * xsecweight**2
+
+    nominal, nominal_variance = values[systs.index("nominal")], variances[systs.index("nominal")]
+
+    pdf_idx = [i for i, syst in enumerate(systs) if syst.startswith("weight_pdf_")]
+    scale_idx = [i for i, syst in enumerate(systs) if syst.startswith("weight_scale_")]
+
+    # only the signal samples carry the PDF (and the signal, WJetsLNu and TTbar the scale) weight sums, the other
+    # samples get sums of 1 (or empty arrays without LHE weights) and nominal up/down templates, like in get_templates()
+    pdf_up, pdf_down = nominal, nominal
+    scale_up, scale_down = nominal, nominal
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if np.size(sumpdfweights) > 1:
+            # PDF acceptance: sum the yield differences from the nominal in quadrature, cap at 100% uncertainty
+            R = np.reshape(sumpdfweights / sumgenweights, (-1, 1, 1))
+            pdfs = values[pdf_idx] / R
+            rel_unc = np.nan_to_num(np.clip(np.linalg.norm(pdfs - nominal, axis=0) / nominal, 0, 1))
+            pdf_up, pdf_down = nominal * (1 + rel_unc), nominal * (1 - rel_unc)
+
+        if np.size(sumscaleweights) > 1:
+            # QCD scale: envelope of [0, 1, 3, 5, 7, 8] w.r.t. 4
+            R = np.reshape(sumscaleweights / sumgenweights, (-1, 1, 1))
+            scales = values[scale_idx] / R
+            scale_up = np.nan_to_num(nominal * np.max(scales[[0, 1, 3, 5, 7, 8]], axis=0) / scales[4])
+            scale_down = np.nan_to_num(nominal * np.min(scales[[0, 1, 3, 5, 7, 8]], axis=0) / scales[4])
+
+    templates = {}
+    for i, syst in enumerate(systs):
+        if pdf_idx and i == pdf_idx[0]:
+            templates["weight_pdf_acceptance_up"] = (pdf_up, nominal_variance)
+            templates["weight_pdf_acceptance_down"] = (pdf_down, nominal_variance)
+        elif scale_idx and i == scale_idx[0]:
+            templates["weight_qcd_scale_up"] = (scale_up, nominal_variance)
+            templates["weight_qcd_scale_down"] = (scale_down, nominal_variance)
+        elif (i not in pdf_idx) and (i not in scale_idx):
+            templates[syst] = (values[i], variances[i])
+
+    return templates
+
+
+def get_templates_from_processor(years, channels, samples, samples_dir):
+    """
+    Collects the templates filled by the processor (``run.py --templates``) from the pkl files, instead of
+    postprocessing the parquets.
+
+    Args
+        years [list]: years to postprocess (e.g. ["2016APV", "2016"])
+        channels [list]: channels to postprocess (e.g. ["ele", "mu"])
+        samples [list]: samples to postprocess (e.g. ["ggF", "TTbar", "Data"])
+        samples_dir [dict]: points to the path of the pkl files for each year
+
+    Returns
+        a hist.Hist object with 4 axes (Sample, Systematic, Region, mass_observable), like ``get_templates()``
+
+    """
+
+    hists = None
+    for year in years:  # e.g. 2018, 2017, 2016APV, 2016
+        for ch in channels:  # e.g. mu, ele
+            logging.info(f"Processing year {year} and {ch} channel")
+
+            with open("../fileset/luminosity.json") as f:
+                luminosity = json.load(f)[ch][year]
+
+            for sample in os.listdir(samples_dir[year]):
+
+                sample_to_use = get_common_sample_name(sample)
+
+                if sample_to_use not in samples:
+                    continue
+
+                is_data = sample_to_use == "Data"
+
+                pkl_files = glob.glob(f"{samples_dir[year]}/{sample}/outfiles/*.pkl")
+
+                # sum the templates of all jobs
+                h = None
+                for ifile in pkl_files:
+                    with open(ifile, "rb") as f:
+                        metadata = pkl.load(f)
+                    h = metadata[sample][year]["templates"][ch] if h is None else h + metadata[sample][year]["templates"][ch]
+
+                if h is None:
+                    logging.info(f"No templates for {sample}")
+                    continue
+
+                # get the xsecweight
+                xsecweight, sumgenweights, sumpdfweights, sumscaleweights = get_xsecweight(
+                    pkl_files, year, sample, sample_to_use, is_data, luminosity
+                )
+
+                templates = reduce_processor_templates(h, xsecweight, sumgenweights, sumpdfweights, sumscaleweights)
+
+                if hists is None:
+                    hists = hist2.Hist(
+                        hist2.axis.StrCategory(samples, name="Sample", growth=True),
+                        hist2.axis.StrCategory(list(templates), name="Systematic", growth=True),
+                        hist2.axis.StrCategory(list(h.axes["Region"]), name="Region", growth=True),
+                        h.axes["mass_observable"],
+                        storage=hist2.storage.Weight(),
+                    )
+
+                sample_index = hists.axes["Sample"].index(sample_to_use)
+                for syst, (values, variances) in templates.items():
+                    syst_index = hists.axes["Systematic"].index(syst)
+                    hists.view(flow=True).value[sample_index, syst_index] += values
+                    hists.view(flow=True).variance[sample_index, syst_index] += variances
+
+    logging.info(hists)
+
+    return hists
+
+
 def fix_neg_yields(h):
     """
     Will set the bin yields of a process to 0 if the nominal yield is negative, and will
@@ -799,15 +910,19 @@ def main(args):
 
     os.system(f"mkdir -p {args.outdir}")
 
-    hists = get_templates(
-        years,
-        channels,
-        config["samples"],
-        config["samples_dir"],
-        config["regions_sel"],
-        config["model_path"],
-        args.add_fake,
-    )
+    if args.from_processor:
+        hists = get_templates_from_processor(years, channels, config["samples"], config["samples_dir"])
+    else:
+        hists = get_templates(
+            years,
+            channels,
+            config["samples"],
+            config["samples_dir"],
+            config["regions_sel"],
+            config["model_path"],
+            args.add_fake,
+            config.get("sidecars", []),
+        )
 
     fix_neg_yields(hists)
 
@@ -818,12 +933,19 @@ def main(args):
 if __name__ == "__main__":
     # e.g.
     # python make_templates.py --years 2016,2016APV,2017,2018 --channels mu,ele --outdir templates/v1 --add-fake
+    # python make_templates.py --years 2017 --channels mu,ele --outdir templates/v1 --from-processor
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--years", dest="years", default="2017", help="years separated by commas")
     parser.add_argument("--channels", dest="channels", default="mu", help="channels separated by commas (e.g. mu,ele)")
     parser.add_argument("--outdir", dest="outdir", default="templates/test", type=str, help="path of the output")
     parser.add_argument("--add-fake", dest="add_fake", action="store_true")
+    parser.add_argument(
+        "--from-processor",
+        dest="from_processor",
+        action="store_true",
+        help="collect the templates filled by the processor (run.py --templates) instead of reading the parquets",
+    )
 
     args = parser.parse_args()
 
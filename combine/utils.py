@@ -2,7 +2,9 @@
 
 
 import json
+import os
 import pickle as pkl
+import sys
 import warnings
 from typing import List
 
@@ -10,6 +12,11 @@ import numpy as np
 import scipy
 from hist import Hist
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# the sidecar parquets are read with the helper of the processor package
+from boostedhiggs.sidecars import read_parquets  # noqa: E402, F401
+
 warnings.filterwarnings("ignore", message="Found duplicate branch ")
 
 combine_samples_by_name = {
@@ -80,20 +87,17 @@ def get_sum_sumgenweight(pkl_files, year, sample):
 
 
 def get_sum_sumpdfweight(pkl_files, year, sample, sample_to_use):
+    """Returns the sum over chunks of the per-chunk PDF weight sums as an array of shape (# variations,)."""
 
     if sample_to_use in ["ggF", "VBF", "WH", "ZH", "ttH"]:
 
-        sum_sumpdfweight = {}
-        for key in range(103):
-            sum_sumpdfweight[key] = 0
-
+        sum_sumpdfweight = 0
         for ifile in pkl_files:
-            # load and sum the sumgenweight of each
+            # load and sum the sumpdfweight of each
             with open(ifile, "rb") as f:
                 metadata = pkl.load(f)
 
-            for key in range(103):
-                sum_sumpdfweight[key] = sum_sumpdfweight[key] + metadata[sample][year]["sumpdfweight"][key]
+            sum_sumpdfweight = sum_sumpdfweight + np.asarray(metadata[sample][year]["sumpdfweight"])
         return sum_sumpdfweight
 
     else:
@@ -101,25 +105,32 @@ def get_sum_sumpdfweight(pkl_files, year, sample, sample_to_use):
 
 
 def get_sum_sumscsaleweight(pkl_files, year, sample, sample_to_use):
+    """Returns the sum over chunks of the per-chunk LHE scale weight sums as an array of shape (9,)."""
 
     if sample_to_use in ["ggF", "VBF", "WH", "ZH", "ttH", "WJetsLNu", "TTbar"]:
 
-        sum_sumlheweight = {}
-        for key in [0, 1, 3, 5, 7, 8, 4]:
-            sum_sumlheweight[key] = 0
-
+        sum_sumlheweight = 0
         for ifile in pkl_files:
-            # load and sum the sumgenweight of each
+            # load and sum the sumlheweight of each
             with open(ifile, "rb") as f:
                 metadata = pkl.load(f)
 
-            for key in [0, 1, 3, 5, 7, 8, 4]:
-                sum_sumlheweight[key] = sum_sumlheweight[key] + metadata[sample][year]["sumlheweight"][key]
+            sum_sumlheweight = sum_sumlheweight + np.asarray(metadata[sample][year]["sumlheweight"])
         return sum_sumlheweight
     else:
         return 1
 
 
+def get_weight_vectors(df, column, nweights):
+    """
+    Unpacks a fixed-size list column of the parquets (e.g. ``weight_pdf`` or ``weight_scale``)
+    into a (# events, nweights) array.
+    """
+    if len(df) == 0:
+        return np.empty((0, nweights))
+    return np.stack(df[column].values)
+
+
 def get_xsecweight(pkl_files, year, sample, sample_to_use, is_data, luminosity):
     """
     Returns the xsec*lumi / [sumgenweight, sumlheweight, or sumpdfweight]
@@ -232,6 +243,11 @@ def blindBins(h: Hist, blind_region: List = [90, 160], blind_samples: List[str]
 
 
 def get_finetuned_score(data, model_path):
+    # use the score evaluated in the processor if stored (the version is the name of the model directory)
+    version = os.path.basename(os.path.dirname(model_path))
+    if f"THWW_{version}" in data:
+        return data[f"THWW_{version}"].values
+
     import onnx
     import onnxruntime as ort
 
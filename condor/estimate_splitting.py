@@ -0,0 +1,323 @@
+#!/usr/bin/python
+
+"""
+Estimates the number of files per condor job of each sample (the splitting of ``pfnano_splitting.yaml``) for a target
+walltime and memory per job, from a dry run of the processor with the options of the jobs.
+
+For each sample, a few chunks of a few random files are processed in a fresh process (with the ``run.py`` options,
+e.g. --processor hww --inference), which measures the processing time per event, the fixed time of a job (setup,
+preprocessing and the corrections and models loaded with the first chunk) and the peak memory. The measured times are
+combined with the times of earlier runs with the same processor options: the per-sample times of ``--cost-history``
+(see ``boostedhiggs/scheduling.py``, the dry-run times are added to it) and the job outputs of earlier submissions
+(``--logs``, e.g. condor/{tag}_{year}), which also give their memory usage. The memory of a job is bounded by these
+peaks, a growth with the number of events is only modelled when measured over ``--min-growth-chunks`` chunks or more.
+
+The splitting of the measured samples is updated in the splitting of ``--splitting`` and written to ``--output``.
+
+Usage:
+    python condor/estimate_splitting.py --year 2017 --processor hww --config samples_inclusive.yaml --key mc \
+        --inference --walltime 4 --memory 2048 --logs condor/test_2017 --output pfnano_splitting.yaml
+"""
+
+import glob
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from coffea import nanoevents, processor  # noqa: E402
+from file_utils import loadFiles  # noqa: E402
+
+from boostedhiggs.preprocessing_cache import get_preprocessing_cache  # noqa: E402
+from boostedhiggs.reader import runner_kwargs, set_uproot_defaults  # noqa: E402
+from boostedhiggs.scheduling import CostModel, TimedProcessor  # noqa: E402
+from boostedhiggs.utils import split_year  # noqa: E402
+from run import get_parser, get_processor, reader_options_from_args  # noqa: E402
+
+SPLITTING_HEADER = """# Splitting of PFNano
+#  determines the number of files per job
+#  the smaller number, the less memory that a job will consume
+"""
+
+
+def cost_options(args) -> Dict[str, bool]:
+    """Processor options of the ``CostModel`` configuration, as in run.py."""
+    return {"inference": args.inference, "systematics": args.systematics, "getLPweights": args.getLPweights}
+
+
+def select_chunks(chunks, nchunks: int) -> List:
+    """Returns the first ``nchunks`` chunks, alternating between the files."""
+    return sorted(chunks, key=lambda chunk: (chunk.entrystart, chunk.filename))[:nchunks]
+
+
+def measure_sample(args, sample: str, files: List[str]) -> Dict:
+    """
+    Dry run of ``args.max_chunks`` chunks of the files of a sample. Returns the chunk timings (see ``TimedProcessor``),
+    the number of events per file, the wall time and the peak memory [MB] of the process.
+    """
+    tic = time.time()
+    try:
+        year, yearmod = split_year(args.year)
+        channels = args.channels.split(",") if args.channels else ["ele", "mu"]
+        sidecars = args.sidecars.split(",") if args.sidecars else []
+
+        reader_options = reader_options_from_args(args)
+        set_uproot_defaults(reader_options)
+        nanoevents.PFNanoAODSchema.mixins["SV"] = "PFCand"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # the outputs of the dry run are discarded
+            args.skim_dir = tmpdir
+            p = TimedProcessor(get_processor(args, year, yearmod, channels, sidecars, "/dryrun", outdir=tmpdir))
+
+            run = processor.Runner(
+                executor=processor.IterativeExecutor(),
+                schema=nanoevents.PFNanoAODSchema,
+                chunksize=args.chunksize,
+                **runner_kwargs(reader_options),
+                metadata_cache=get_preprocessing_cache(args.preprocessing_cache, check_mtime=not args.no_mtime),
+            )
+            chunks = list(run.preprocess({sample: files}, "Events"))
+            run(select_chunks(chunks, args.max_chunks), "Events", processor_instance=p)
+
+    except Exception as e:
+        # only the first line of the message (e.g. of the uproot errors)
+        message = str(e).strip().splitlines() or [""]
+        return {"sample": sample, "error": f"{type(e).__name__}: {message[0]}"}
+
+    nevents = {}
+    for chunk in chunks:
+        nevents[chunk.filename] = nevents.get(chunk.filename, 0) + chunk.entrystop - chunk.entrystart
+
+    return {
+        "sample": sample,
+        "timings": sorted(p.timings, key=lambda timing: timing["start"]),
+        "events_per_file": float(np.mean(list(nevents.values()))),
+        "walltime": time.time() - tic,
+        "maxrss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def read_job_logs(locdirs: List[str], configuration: str) -> Dict[str, Dict]:
+    """
+    Returns the processing time, number of events and peak memory [MB] of the finished jobs of earlier submissions
+    (made by condor/submit.py in ``locdirs``) with the processor configuration of ``CostModel``, summed per sample:
+    {sample: {"time", "nevents", "memory"}}. The times are the "Finished in" of run.py (including the preprocessing) and
+    the memory usage is read from the condor logs.
+    """
+    parser = get_parser()
+    jobs = {}
+    for locdir in locdirs:
+        for script in sorted(glob.glob(f"{locdir}/*.sh")):
+            sample = os.path.basename(script)[: -len(".sh")]
+            with open(script, "r") as f:
+                command = [line.split() for line in f if re.match(r"python\S* \S+\.py ", line)]
+            if not command:
+                continue
+
+            # the options of the job (e.g. --starti ${jobid}) as parsed by run.py
+            job_args, _ = parser.parse_known_args([token.replace("${jobid}", "0") for token in command[0][2:]])
+            if CostModel(job_args.processor, cost_options(job_args)).configuration != configuration:
+                continue
+
+            for out in glob.glob(f"{locdir}/logs/{glob.escape(sample)}_*.out"):
+                if not re.fullmatch(rf"{re.escape(sample)}_\d+\.out", os.path.basename(out)):
+                    continue
+                with open(out, "r") as f:
+                    text = f.read()
+                finished = re.search(r"Finished in ([\d.]+)s", text)
+                entries = re.search(r"'entries': (\d+)", text)
+                if finished is None or entries is None:
+                    continue
+
+                memory = 0.0
+                if os.path.exists(out[: -len(".out")] + ".log"):
+                    with open(out[: -len(".out")] + ".log", "r") as f:
+                        memory = max([float(m) for m in re.findall(r"Memory \(MB\)\s*:\s*(\d+)", f.read())] + [0.0])
+
+                job = jobs.setdefault(sample, {"time": 0.0, "nevents": 0, "memory": 0.0})
+                job["time"] += float(finished.group(1))
+                job["nevents"] += int(entries.group(1))
+                job["memory"] = max(job["memory"], memory)
+
+    return jobs
+
+
+def estimate_splitting(measurement: Dict, cost_model: CostModel, jobs: Dict[str, Dict], args) -> Dict:
+    """
+    Returns the estimated cost of a sample and its number of files per job: as many files as fit in the target walltime
+    and memory (times ``args.margin``), between 1 and ``args.max_files_per_job``.
+    """
+    sample = measurement["sample"]
+    timings = measurement["timings"]
+    events_per_file = measurement["events_per_file"]
+
+    # the first chunk also loads the corrections and models, it is counted in the fixed time of the job
+    steady = timings[1:] if len(timings) > 1 else timings
+    steady_time = sum(timing["stop"] - timing["start"] for timing in steady)
+    steady_events = sum(timing["nevents"] for timing in steady)
+    dryrun_events = sum(timing["nevents"] for timing in timings)
+    dryrun_per_event = steady_time / max(steady_events, 1)
+    overhead = max(measurement["walltime"] - dryrun_events * dryrun_per_event, 0.0)
+
+    # per-event time of the dry run, the cost history and the earlier jobs, weighted by their number of events
+    history_time, history_events = cost_model.measured.get(sample, [0.0, 0])
+    job = jobs.get(sample, {"time": 0.0, "nevents": 0, "memory": 0.0})
+    per_event = (steady_time + history_time + job["time"]) / max(steady_events + history_events + job["nevents"], 1)
+
+    # peak memory of the dry run and of the earlier jobs. The rise of the peak over the first chunks of a fresh process
+    # is mostly warm-up (allocator, caches, imports), so a growth with the number of events (e.g. for the accumulated
+    # outputs) is only modelled when measured over many chunks, after the first half of them
+    base_memory = max(measurement["maxrss"], job["memory"])
+    growth = 0.0
+    if len(timings) >= args.min_growth_chunks:
+        warm = timings[len(timings) // 2 :]
+        growth = max(warm[-1]["maxrss"] - warm[0]["maxrss"], 0.0) / max(sum(t["nevents"] for t in warm[1:]), 1)
+    if base_memory > args.memory:
+        print(f"WARNING : {sample} peaks at {base_memory:.0f}MB, above the target memory of {args.memory:.0f}MB")
+
+    walltime = args.walltime * 3600 * args.margin
+    memory = args.memory * args.margin
+    nfiles_time = (walltime - overhead) / max(per_event * events_per_file, 1e-9)
+    nfiles_memory = np.inf
+    if growth > 0:
+        nfiles_memory = (memory - base_memory) / (growth * events_per_file) + dryrun_events / events_per_file
+    nfiles = int(max(1, min(nfiles_time, nfiles_memory, args.max_files_per_job)))
+
+    return {
+        "sample": sample,
+        "files_per_job": nfiles,
+        "events_per_file": events_per_file,
+        "per_event": per_event,
+        "overhead": overhead,
+        "job_time": overhead + nfiles * events_per_file * per_event,
+        "job_memory": base_memory + growth * max(nfiles * events_per_file - dryrun_events, 0),
+        "events": {"dryrun": steady_events, "history": history_events, "jobs": job["nevents"]},
+    }
+
+
+def write_splitting(path: str, splitting: Dict[str, Dict[str, int]]):
+    with open(path, "w") as f:
+        f.write(SPLITTING_HEADER)
+        for pfnano, nfiles in splitting.items():
+            f.write(f"{pfnano}:\n")
+            for sample, n in (nfiles or {}).items():
+                f.write(f"    {sample}: {n}\n")
+
+
+def main(args):
+    if "," in args.year:
+        raise Exception("The splitting is estimated for one year at a time")
+
+    slist = args.sample.split(",") if args.sample else None
+    files, _ = loadFiles(args.config, args.configkey, args.year, args.pfnano, slist, splitname=None)
+
+    cost_model = CostModel(args.processor, cost_options(args), history=args.cost_history)
+    jobs = read_job_logs(args.logs.split(",") if args.logs else [], cost_model.configuration)
+    print(f"Configuration {cost_model.configuration}, earlier jobs of {len(jobs)} samples")
+
+    rng = np.random.default_rng(args.seed)
+    tasks = [
+        (args, sample, sorted(rng.choice(flist, min(args.dryrun_files, len(flist)), replace=False).tolist()))
+        for sample, flist in files.items()
+        if flist
+    ]
+
+    # one process per sample, for the peak memory and the fixed time of a job
+    estimates = {}
+    timings = []
+    with multiprocessing.get_context("fork").Pool(1, maxtasksperchild=1) as pool:
+        for measurement in pool.starmap(measure_sample, tasks, chunksize=1):
+            sample = measurement["sample"]
+            if "error" in measurement:
+                print(f"{sample}: dry run failed ({measurement['error']}), the splitting is not updated")
+                continue
+            if not measurement["timings"]:
+                print(f"{sample}: no events processed, the splitting is not updated")
+                continue
+
+            estimate = estimate_splitting(measurement, cost_model, jobs, args)
+            estimates[sample] = estimate
+            timings += measurement["timings"]
+            print(
+                f"{sample}: {estimate['files_per_job']} files/job, {estimate['events_per_file']:.0f} events/file, "
+                f"{1 / estimate['per_event']:.0f} events/s, job {estimate['job_time'] / 3600:.2f}h "
+                f"{estimate['job_memory']:.0f}MB"
+            )
+
+    cost_model.update(timings)
+
+    splitting = {}
+    if args.splitting and os.path.exists(args.splitting):
+        with open(args.splitting, "r") as f:
+            splitting = yaml.safe_load(f) or {}
+    splitting[args.pfnano] = splitting.get(args.pfnano) or {}
+    for sample, estimate in estimates.items():
+        splitting[args.pfnano][sample] = estimate["files_per_job"]
+
+    write_splitting(args.output, splitting)
+    print(f"Splitting of {len(estimates)} samples written to {args.output}")
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python condor/estimate_splitting.py --year 2017 --processor hww --config samples_inclusive.yaml --key mc \
+    #     --inference --systematics --channels ele,mu --walltime 4 --memory 2048 --logs condor/test_2017
+
+    # the processor options are the ones of run.py
+    parser = get_parser()
+    parser.add_argument("--walltime", dest="walltime", default=4, help="target walltime per job [h]", type=float)
+    parser.add_argument("--memory", dest="memory", default=2048, help="target memory per job [MB]", type=float)
+    parser.add_argument(
+        "--margin", dest="margin", default=0.8, help="fraction of the walltime and memory to fill", type=float
+    )
+    parser.add_argument(
+        "--max-files-per-job", dest="max_files_per_job", default=50, help="maximum number of files per job", type=int
+    )
+    parser.add_argument(
+        "--dryrun-files", dest="dryrun_files", default=2, help="number of random files per sample to run on", type=int
+    )
+    parser.add_argument(
+        "--max-chunks",
+        dest="max_chunks",
+        default=3,
+        help="number of chunks per sample to run on (the first one is counted in the fixed time of a job)",
+        type=int,
+    )
+    parser.add_argument(
+        "--min-growth-chunks",
+        dest="min_growth_chunks",
+        default=10,
+        help="minimum number of chunks to model the memory growth with the number of events (the peak is used otherwise)",
+        type=int,
+    )
+    parser.add_argument("--seed", dest="seed", default=42, help="seed of the random files", type=int)
+    parser.add_argument(
+        "--logs",
+        dest="logs",
+        default=None,
+        help="directories of earlier submissions (condor/{tag}_{year}) to read the job times from, separated by commas",
+        type=str,
+    )
+    parser.add_argument(
+        "--splitting",
+        dest="splitting",
+        default="pfnano_splitting.yaml",
+        help="splitting of the samples that are not estimated",
+        type=str,
+    )
+    parser.add_argument(
+        "--output", dest="output", default="pfnano_splitting_estimated.yaml", help="output splitting", type=str
+    )
+    args = parser.parse_args()
+
+    main(args)
@@ -10,15 +10,21 @@ def loadFiles(
     pfnano="v2_2",
     sampleslist=None,
     splitname="pfnano_splitting.yaml",
+    catalog="fileset/catalog.sqlite",
 ):
+    from boostedhiggs.catalog import FilesetCatalog
+
     samples = []
     values = {}
 
-    with open(splitname, "r") as f:
-        try:
-            splitting = yaml.safe_load(f)[pfnano]
-        except KeyError:
-            raise Exception(f"Unable to load splitting with pfnano {pfnano}")
+    # without splitting file (splitname=None) only the files are returned, e.g. to estimate the splitting of new samples
+    splitting = None
+    if splitname is not None:
+        with open(splitname, "r") as f:
+            try:
+                splitting = yaml.safe_load(f)[pfnano]
+            except KeyError:
+                raise Exception(f"Unable to load splitting with pfnano {pfnano}")
 
     with open(samples_yaml, "r") as f:
         all_samples = yaml.safe_load(f)[config]
@@ -39,19 +45,15 @@ def loadFiles(
             else:
                 samples.append(sample)
 
+            if splitting is None:
+                continue
             try:
                 values[sample] = splitting[sample]
             except KeyError:
                 raise Exception(f"Splitting for sample {sample} not found")
 
-    fname = f"fileset/pfnanoindex_{pfnano}_{year}.json"
-    fileset = {}
-    with open(fname, "r") as f:
-        files = json.load(f)
-        for subdir in files[year]:
-            for key, flist in files[year][subdir].items():
-                if key in samples:
-                    fileset[key] = ["root://cmseos.fnal.gov/" + f for f in flist]
+    # files of fileset/pfnanoindex_{pfnano}_{year}.json, looked up in the catalog
+    fileset = FilesetCatalog(catalog).files(pfnano, year, samples)
 
     return fileset, values
 
@@ -7,10 +7,13 @@ Author(s): Cristina Mantilla, Raghav Kansal, Farouk Mokhtar
 import argparse
 import json
 import os
+import sys
 from math import ceil
 
 from file_utils import loadFiles
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
 
 def main(args):
     try:
@@ -28,22 +31,53 @@ def main(args):
     logdir = locdir + "/logs"
     os.system(f"mkdir -p {logdir}")
 
-    # copy the splitting file to the locdir
-    os.system(f"cp pfnano_splitting.yaml {locdir}")
+    # copy the splitting file to the locdir (as pfnano_splitting.yaml, read by check_jobs.py)
+    os.system(f"cp {args.splitting} {locdir}/pfnano_splitting.yaml")
     os.system(f"cp {args.config} {locdir}")
 
     # and condor directory
     print("CONDOR work dir: " + outdir)
     os.system(f"mkdir -p /eos/uscms/{outdir}")
 
+    # finetuned heads as version:path, the models are transferred with the job and read from its directory
+    finetuned_heads = {}
+    if args.finetuned_heads:
+        for head in args.finetuned_heads.split(","):
+            version, model_path = head.split(":")
+            if not os.path.exists(model_path):
+                raise Exception(f"Finetuned head {version}: {model_path} not found")
+            finetuned_heads[version] = model_path
+    if args.templates and (not args.inference or not finetuned_heads):
+        raise Exception("--templates selects on the THWW score: submit with --inference and --finetuned-heads")
+
     # build metadata.json with samples
     slist = args.slist.split(",") if args.slist is not None else None
-    files, nfiles_per_job = loadFiles(args.config, args.configkey, args.year, args.pfnano, slist)
+    files, nfiles_per_job = loadFiles(
+        args.config, args.configkey, args.year, args.pfnano, slist, args.splitting, catalog=args.catalog
+    )
     metadata_file = f"metadata_{args.configkey}.json"
     with open(f"{locdir}/{metadata_file}", "w") as f:
         json.dump(files, f, sort_keys=True, indent=2)
     print(files.keys())
 
+    # jobs of --events-per-job events, as entry ranges of the files (see ``boostedhiggs/entry_ranges.py``)
+    ranges = {}
+    ranges_file = f"ranges_{args.configkey}.json"
+    if args.events_per_job:
+        from boostedhiggs.catalog import FilesetCatalog
+        from boostedhiggs.entry_ranges import get_numentries, make_jobs
+
+        # number of entries from the catalog, or the preprocessing cache for the files without catalog metadata
+        catalog = FilesetCatalog(args.catalog)
+        for sample, flist in files.items():
+            if (args.maxfiles != -1) & (args.maxfiles < len(flist)):
+                flist = flist[: args.maxfiles]
+            numentries = catalog.numentries(flist)
+            numentries.update(get_numentries([f for f in flist if f not in numentries], args.preprocessing_cache))
+            ranges[sample] = make_jobs(flist, numentries, args.events_per_job)
+        with open(f"{locdir}/{ranges_file}", "w") as f:
+            json.dump(ranges, f, indent=1)
+
     # submit a cluster of jobs per sample
     for sample in files.keys():
         print(f"Making directory /eos/uscms/{outdir}/{sample}")
@@ -62,7 +96,10 @@ def main(args):
         if (args.maxfiles != -1) & (args.maxfiles < tot_files):
             tot_files = args.maxfiles
 
-        if args.files_per_job:
+        if args.events_per_job:
+            njobs = len(ranges[sample])
+            files_per_job = "-1"
+        elif args.files_per_job:
             njobs = ceil(tot_files / args.files_per_job)
             files_per_job = str(args.files_per_job)
         else:
@@ -84,7 +121,14 @@ def main(args):
             line = line.replace("DIRECTORY", locdir)
             line = line.replace("PREFIX", sample)
             line = line.replace("JOBIDS_FILE", jobids_file)
-            line = line.replace("METADATAFILE", metadata_file)
+            line = line.replace(
+                "INPUTFILES",
+                ",".join(
+                    [f"{locdir}/{metadata_file}"]
+                    + ([f"{locdir}/{ranges_file}"] if ranges else [])
+                    + list(finetuned_heads.values())
+                ),
+            )
             line = line.replace("PROXY", proxy)
             condor_file.write(line)
         condor_file.close()
@@ -101,6 +145,7 @@ def main(args):
             line = line.replace("PROCESSOR", args.processor)
             line = line.replace("METADATAFILE", metadata_file)
             line = line.replace("NUMJOBS", files_per_job)
+            line = line.replace("RANGES", f"--ranges {ranges_file}" if ranges else "")
             line = line.replace("SAMPLE", sample)
             line = line.replace("CHANNELS", args.channels)
             line = line.replace("EOSOUTPKL", eosoutput_pkl)
@@ -109,6 +154,11 @@ def main(args):
                 line = line.replace("INFERENCE", "--inference")
             else:
                 line = line.replace("INFERENCE", "--no-inference")
+            if finetuned_heads:
+                heads = ",".join(f"{version}:{os.path.basename(path)}" for version, path in finetuned_heads.items())
+                line = line.replace("FINETUNEDHEADS", f"--finetuned-heads {heads}")
+            else:
+                line = line.replace("FINETUNEDHEADS", "")
             if args.systematics:
                 line = line.replace("SYSTEMATICS", "--systematics")
             else:
@@ -123,6 +173,11 @@ def main(args):
             else:
                 line = line.replace("LOOSELEP", "--no-uselooselep")
 
+            if args.templates:
+                line = line.replace("TEMPLATES", "--templates")
+            else:
+                line = line.replace("TEMPLATES", "")
+
             line = line.replace("LABEL", args.label)
             line = line.replace("REGION", args.region)
 
@@ -163,10 +218,46 @@ if __name__ == "__main__":
     parser.add_argument("--test", dest="test", action="store_true", help="only 2 jobs per sample will be created")
     parser.add_argument("--submit", dest="submit", action="store_true", help="submit jobs when created")
     parser.add_argument("--files-per-job", default=None, help="# files per condor job", type=int)
+    parser.add_argument(
+        "--events-per-job",
+        dest="events_per_job",
+        default=None,
+        help="split the files into jobs of this number of events (entry ranges) instead of whole files",
+        type=int,
+    )
+    parser.add_argument(
+        "--catalog",
+        dest="catalog",
+        default="fileset/catalog.sqlite",
+        help="fileset catalog (see fileset/build_catalog.py)",
+        type=str,
+    )
+    parser.add_argument(
+        "--preprocessing-cache",
+        dest="preprocessing_cache",
+        default="fileset/preprocessing_cache.sqlite",
+        help="number of entries of the files without catalog metadata for --events-per-job",
+        type=str,
+    )
+    parser.add_argument(
+        "--splitting",
+        dest="splitting",
+        default="pfnano_splitting.yaml",
+        help="# files per job of each sample (e.g. made with condor/estimate_splitting.py)",
+        type=str,
+    )
     parser.add_argument("--channels", dest="channels", required=True, help="channels separated by commas")
     parser.add_argument("--pfnano", dest="pfnano", type=str, default="v2_2", help="pfnano version")
     parser.add_argument("--inference", dest="inference", action="store_true")
     parser.add_argument("--no-inference", dest="inference", action="store_false")
+    parser.add_argument(
+        "--finetuned-heads",
+        dest="finetuned_heads",
+        default=None,
+        help="finetuned heads as version:path to the onnx model, separated by commas (e.g. v35_30:model.onnx), "
+        + "the models are transferred with the jobs",
+        type=str,
+    )
     parser.add_argument("--systematics", dest="systematics", action="store_true")
     parser.add_argument("--no-systematics", dest="systematics", action="store_false")
     parser.add_argument("--getLPweights", dest="getLPweights", action="store_true")
@@ -176,6 +267,7 @@ if __name__ == "__main__":
     parser.add_argument("--maxfiles", default=-1, help="max number of files to run on", type=int)
     parser.add_argument("--uselooselep", dest="uselooselep", action="store_true")
     parser.add_argument("--no-uselooselep", dest="uselooselep", action="store_false")
+    parser.add_argument("--templates", dest="templates", action="store_true", help="fill the templates in the processor")
 
     parser.set_defaults(inference=True)
     args = parser.parse_args()
@@ -11,7 +11,7 @@ mkdir outfiles
 
 # run code
 # pip install --user onnxruntime
-python SCRIPTNAME --year YEAR --processor PROCESSOR PFNANO INFERENCE SYSTEMATICS GETLPWEIGHTS LOOSELEP --n NUMJOBS --starti ${jobid} --sample SAMPLE --config METADATAFILE --channels CHANNELS
+python SCRIPTNAME --year YEAR --processor PROCESSOR PFNANO INFERENCE FINETUNEDHEADS SYSTEMATICS GETLPWEIGHTS LOOSELEP TEMPLATES --n NUMJOBS RANGES --starti ${jobid} --sample SAMPLE --config METADATAFILE --channels CHANNELS --preprocessing-cache ''
 
 # remove incomplete jobs
 rm -rf outfiles/*mu
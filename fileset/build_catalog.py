@@ -0,0 +1,59 @@
+#!/usr/bin/python
+
+"""
+Builds the fileset catalog (see ``boostedhiggs/catalog.py``) from ``fileset/pfnanoindex_{pfnano}_{year}.json``, and
+with --metadata fills the size, number of entries and sum of generator weights of the files by opening them.
+
+Usage:
+    python fileset/build_catalog.py --pfnano v2_2 --years 2016APV,2016,2017,2018
+    python fileset/build_catalog.py --pfnano v2_2 --years 2017 --metadata --samples GluGluHToWW_Pt-200ToInf_M-125
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from boostedhiggs.catalog import FilesetCatalog  # noqa: E402
+
+
+def main(args):
+    catalog = FilesetCatalog(args.catalog)
+    samples = args.samples.split(",") if args.samples else None
+
+    for year in args.years.split(","):
+        nfiles = catalog.add_index(args.pfnano, year)
+        print(f"{args.pfnano} {year}: {nfiles} files of {len(catalog.samples(args.pfnano, year))} samples")
+
+        if args.metadata:
+            failed = catalog.fill_metadata(
+                args.pfnano, year, samples, redirector=args.redirector, workers=args.workers, timeout=args.timeout
+            )
+            print(f"{args.pfnano} {year}: {len(failed)} files failed")
+
+        for sample, files in catalog.file_metadata(args.pfnano, year, samples).items():
+            numentries = [f["numentries"] for f in files if f["numentries"] is not None]
+            size = sum(f["size"] for f in files if f["size"] is not None)
+            print(f"  {sample}: {len(files)} files, {sum(numentries)} events ({len(numentries)} files), {size / 1e9:.1f} GB")
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python fileset/build_catalog.py --pfnano v2_2 --years 2016APV,2016,2017,2018 --metadata
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pfnano", dest="pfnano", default="v2_2", help="pfnano version", type=str)
+    parser.add_argument("--years", dest="years", default="2017", help="years separated by commas", type=str)
+    parser.add_argument("--samples", dest="samples", default=None, help="samples separated by commas (default: all)")
+    parser.add_argument("--catalog", dest="catalog", default="fileset/catalog.sqlite", help="path to the catalog", type=str)
+    parser.add_argument(
+        "--metadata", dest="metadata", action="store_true", help="open the files to fill their size, entries and sumw"
+    )
+    parser.add_argument("--redirector", dest="redirector", default="root://cmseos.fnal.gov/", type=str)
+    parser.add_argument("--workers", dest="workers", default=16, help="number of files opened in parallel", type=int)
+    parser.add_argument("--timeout", dest="timeout", default=60, help="xrootd timeout [s]", type=int)
+
+    args = parser.parse_args()
+
+    main(args)
@@ -1,25 +1,23 @@
-import json
-import subprocess
+#!/usr/bin/python
 
+"""
+Indexes the PFNano files of ``folders_to_index`` into pfnanoindex_{pfnano}_{year}.json, with the parallel incremental
+crawler of ``boostedhiggs/crawler.py``: of the directories of files, only those that changed since the previous crawl
+(saved in --state) are listed again.
 
-def get_children(parent):
-    # print(f"DEBUG : Call to get_children({parent})")
-    command = f"eos root://cmseos.fnal.gov ls -F {parent}"
-    # print(command)
-    result = subprocess.getoutput(command)  # , stdout=subprocess.PIPE)
-    # print(result)
-    return result.split("\n")
+Usage:
+    python fileset/indexpfnano.py --pfnano v2_2 --years 2016,2016APV,2017,2018 --outdir fileset
+    python fileset/indexpfnano.py --backend local --years 2017 --outdir /tmp/index  # e.g. on a mounted /eos
+"""
 
+import argparse
+import json
+import os
+import sys
 
-def get_subfolders(parent):
-    subfolders = []
-    for x in get_children(parent):
-        if len(x) == 0:
-            continue
-        if x[-1] == "/":
-            subfolders.append(x)
-    return subfolders
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
+from boostedhiggs.crawler import BACKENDS, Crawler, build_index, load_state, save_state  # noqa: E402
 
 folders_to_index = {
     "v2_2": [
@@ -123,9 +121,8 @@ folders_to_index = {
     ],
 }
 
-# samples to exclude (needs / at the end)
+# samples to exclude, (year, version, dataset)
 samples_to_exclude = []
-index_APV = {}
 
 # Data path:
 # .......................f1........................|...f2.....|..........f3.......|.....f4......|.f5.|....
@@ -135,98 +132,56 @@ index_APV = {}
 # .......................f1........................|.......................f2..............................|..........f3.........|.....f4......|.f5.|....
 # /store/user/lpcpfnano/jekrupa/v2_2/2017/WJetsToQQ/WJetsToQQ_HT-800toInf_TuneCP5_13TeV-madgraphMLM-pythia8/WJetsToQQ_HT-800toInf/211108_171840/0000/*root
 
-pfnano_version = "v2_2"
-folders_to_index = folders_to_index[pfnano_version]
-
-for pyear in ["2016", "2016APV", "2017", "2018"]:
-    # if pyear != "2017": continue
-    print(pyear)
-
-    index = {}
-    for f1 in folders_to_index:
-        f1 = f1.rstrip("/")
-
-        version = "v2_2"
-        if "v2_3" in f1:
-            version = "v2_3"
-
-        year = f1.split("/")[-2]
-        sample_short = f1.split("/")[-1]
-        if year != pyear:
-            continue
-
-        sample_short = f1.split("/")[-1]
-        print(f" {sample_short}")
-
-        if year not in index:
-            index[year] = {}
-        if sample_short not in index[year]:
-            index[year][sample_short] = {}
-
-        f1_subfolders = get_subfolders(f"{f1}")
-        for f2 in f1_subfolders:
-            print(f"\t/{f2}")
-
-            exclude = False
-            for exclude_year, exclude_version, exclude_sample in samples_to_exclude:
-                if f2 == exclude_sample and pyear == exclude_year and version == exclude_version:
-                    print(f"   Excluding {sample_short}, {f2}, {version}, {pyear}")
-                    exclude = True
-            if exclude:
-                continue
-
-            subsample_long = f2.replace("/", "")  # This should be the actual dataset name
-            f2_subfolders = get_subfolders(f"{f1}/{f2}")
-            if len(f2_subfolders) == 0:
-                root_files = [f"{f1}/{f2}/{x}".replace("//", "/") for x in get_children((f"{f1}/{f2}")) if x[-5:] == ".root"]
-                if subsample_long not in index[year][sample_short]:
-                    index[year][sample_short][subsample_long] = []
-                index[year][sample_short][subsample_long].extend(root_files)
-
-            for f3 in f2_subfolders:
-                # print(f"\t\t/{f3}")
-                subsample_short = f3.replace("/", "")
-                if "ext1" in subsample_short:
-                    print("   Ext1")
-
-                subsample_short = subsample_short.replace("_ext1", "")
-                # print(f"  {subsample_short}")
-
-                if subsample_short not in index[year][sample_short]:
-                    index[year][sample_short][subsample_short] = []
-
-                f3_subfolders = get_subfolders(f"{f1}/{f2}/{f3}")
-                if len(f3_subfolders) >= 2:
-                    print(f"WARNING : Found multiple timestamps for {f1}/{f2}/{f3}")
-
-                for f4 in f3_subfolders:  # Timestamp
-                    f4_subfolders = get_subfolders(f"{f1}/{f2}/{f3}/{f4}")
-
-                    for f5 in f4_subfolders:  # 0000, 0001, ...
-                        f5_children = get_children((f"{f1}/{f2}/{f3}/{f4}/{f5}"))
-                        root_files = [
-                            f"{f1}/{f2}/{f3}/{f4}/{f5}/{x}".replace("//", "/") for x in f5_children if x[-5:] == ".root"
-                        ]
-                        if year == "2016" and "HIPM" in subsample_short:
-                            if sample_short not in index_APV:
-                                index_APV[sample_short] = {}
-                            if subsample_short not in index_APV[sample_short]:
-                                index_APV[sample_short][subsample_short] = []
-                                index_APV[sample_short][subsample_short].extend(root_files)
-                        else:
-                            if subsample_short not in index[year][sample_short]:
-                                index[year][sample_short][subsample_short] = []
-                            index[year][sample_short][subsample_short].extend(root_files)
-                        # print(index[year][sample_short].keys())
-
-    if pyear == "2016APV":
-        for sample_short in index_APV.keys():
-            for subsample_short in index_APV[sample_short].keys():
-                if sample_short not in index[pyear]:
-                    index[pyear][sample_short] = {}
-                if subsample_short not in index[pyear][sample_short]:
-                    index[pyear][sample_short][subsample_short] = []
-                index[pyear][sample_short][subsample_short] = index_APV[sample_short][subsample_short]
-
-    with open(f"pfnanoindex_{pfnano_version}_{pyear}.json", "w") as f:
-        json.dump(index, f, sort_keys=True, indent=2)
+
+def main(args, folders_to_index=folders_to_index, samples_to_exclude=samples_to_exclude):
+    folders = folders_to_index[args.pfnano]
+    years = args.years.split(",")
+    state = args.state or os.path.join(args.outdir, f"crawl_state_{args.pfnano}.json")
+    crawler = Crawler(BACKENDS[args.backend](), state={} if args.full else load_state(state), workers=args.workers)
+    listings = crawler.crawl([f for f in folders if f.rstrip("/").split("/")[-2] in years])
+    print(f"Crawled {len(listings)} directories, {crawler.nlisted} listed ({len(listings) - crawler.nlisted} unchanged)")
+
+    os.makedirs(args.outdir, exist_ok=True)
+    save_state(state, crawler.state)
+    for year, index in build_index(listings, folders, years, samples_to_exclude).items():
+        with open(os.path.join(args.outdir, f"pfnanoindex_{args.pfnano}_{year}.json"), "w") as f:
+            json.dump(index, f, sort_keys=True, indent=2)
+        nfiles = sum(len(flist) for samples in index.get(year, {}).values() for flist in samples.values())
+        print(f"{year}: {nfiles} files")
+
+        if args.catalog:
+            from boostedhiggs.catalog import FilesetCatalog
+
+            FilesetCatalog(args.catalog).add_index(
+                args.pfnano, year, os.path.join(args.outdir, f"pfnanoindex_{args.pfnano}_{year}.json")
+            )
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pfnano", dest="pfnano", default="v2_2", help="pfnano version (key of the folders)", type=str)
+    parser.add_argument("--years", dest="years", default="2016,2016APV,2017,2018", help="years separated by commas")
+    parser.add_argument("--outdir", dest="outdir", default=".", help="directory of the index jsons", type=str)
+    parser.add_argument("--backend", dest="backend", default="eos", choices=list(BACKENDS), help="listing backend")
+    parser.add_argument("--workers", dest="workers", default=16, help="number of concurrent listings", type=int)
+    parser.add_argument(
+        "--state",
+        dest="state",
+        default=None,
+        help="listings of the previous crawl (default: {outdir}/crawl_state_{pfnano}.json)",
+        type=str,
+    )
+    parser.add_argument("--full", dest="full", action="store_true", help="list all the directories again")
+    parser.add_argument(
+        "--catalog", dest="catalog", default=None, help="also import the indexes in this fileset catalog", type=str
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python fileset/indexpfnano.py --pfnano v2_2 --years 2016,2016APV,2017,2018 --outdir fileset
+
+    args = get_parser().parse_args()
+
+    main(args)
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+"""
+Warms the persistent cache of the coffea preprocessing metadata (see ``boostedhiggs/preprocessing_cache.py``)
+with the files of ``fileset/pfnanoindex_{pfnano}_{year}.json``, so that run.py can build its chunks without
+opening the input files.
+
+Usage:
+    python fileset/warm_preprocessing_cache.py --pfnano v2_2 --years 2016APV,2016,2017,2018
+    python fileset/warm_preprocessing_cache.py --pfnano v2_2 --years 2017 --samples GluGluHToWW_Pt-200ToInf_M-125
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import uproot
+from coffea.processor.executor import FileMeta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from boostedhiggs.preprocessing_cache import PreprocessingCache  # noqa: E402
+
+
+def get_metadata(filename, treename, timeout):
+    with uproot.open({filename: None}, timeout=timeout) as f:
+        return {"numentries": f[treename].num_entries, "uuid": f.file.fUUID}
+
+
+def main(args):
+    cache = PreprocessingCache(args.cache, check_mtime=not args.no_mtime)
+
+    filemetas = []
+    for year in args.years.split(","):
+        with open(f"fileset/pfnanoindex_{args.pfnano}_{year}.json", "r") as f:
+            files = json.load(f)
+        for subdir in files[year]:
+            for key, flist in files[year][subdir].items():
+                if args.samples and key not in args.samples.split(","):
+                    continue
+                filemetas += [FileMeta(key, args.redirector + f, args.treename) for f in flist]
+
+    to_get = [filemeta for filemeta in filemetas if filemeta not in cache]
+    print(f"{len(filemetas)} files, {len(filemetas) - len(to_get)} already cached")
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(get_metadata, fm.filename, fm.treename, args.timeout): fm for fm in to_get}
+        for i, future in enumerate(as_completed(futures)):
+            filemeta = futures[future]
+            try:
+                cache[filemeta] = future.result()
+            except Exception as e:
+                print(f"Failed {filemeta.filename}: {e}")
+                failed.append(filemeta.filename)
+            if (i + 1) % 100 == 0:
+                print(f"{i + 1}/{len(to_get)}")
+
+    print(f"Cached {len(to_get) - len(failed)} files in {args.cache} ({len(failed)} failed)")
+
+
+if __name__ == "__main__":
+    # e.g.
+    # python fileset/warm_preprocessing_cache.py --pfnano v2_2 --years 2016APV,2016,2017,2018
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pfnano", dest="pfnano", default="v2_2", help="pfnano version", type=str)
+    parser.add_argument("--years", dest="years", default="2017", help="years separated by commas", type=str)
+    parser.add_argument("--samples", dest="samples", default=None, help="samples separated by commas (default: all)")
+    parser.add_argument(
+        "--cache",
+        dest="cache",
+        default="fileset/preprocessing_cache.sqlite",
+        help="path to the preprocessing cache",
+        type=str,
+    )
+    parser.add_argument("--redirector", dest="redirector", default="root://cmseos.fnal.gov/", type=str)
+    parser.add_argument("--treename", dest="treename", default="Events", type=str)
+    parser.add_argument("--workers", dest="workers", default=16, help="number of files opened in parallel", type=int)
+    parser.add_argument("--timeout", dest="timeout", default=60, help="xrootd timeout [s]", type=int)
+    parser.add_argument(
+        "--no-mtime", dest="no_mtime", action="store_true", help="do not key the entries by modification time"
+    )
+
+    args = parser.parse_args()
+
+    main(args)
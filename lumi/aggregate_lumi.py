@@ -0,0 +1,124 @@
+#!/usr/bin/python
+
+import argparse
+import glob
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from boostedhiggs.lumi_processor import LumiSet, pack_runs_lumis  # noqa: E402
+
+"""
+This script combines the pkl files produced by the lumi processor and computes the luminosity, per dataset and per
+channel (the union of the ele or mu datasets), from a lumi.csv produced using the GoldenJson.
+
+The (run, lumi) pairs are merged as sorted arrays of packed keys (``LumiSet``), and written to:
+    - {outdir}/lumi_set_{year}.pkl: {dataset: LumiSet}
+    - {outdir}/lumimask_{year}_{dataset or channel}.json: the lumi sections in the format of the CMS lumi masks
+    - {outdir}/lumi_{year}.json: the luminosity [/pb] of the datasets and channels (with --lumi-csv)
+"""
+
+
+def get_channel(dataset: str) -> str:
+    return "mu" if "Muon" in dataset else "ele"
+
+
+def combine_lumi_sets(pkl_files, year):
+    """Returns the ``LumiSet`` of each dataset from the output pkls, loaded one by one."""
+    out_all = {}
+    for pkl_file in pkl_files:
+        with open(pkl_file, "rb") as f:
+            out = pickle.load(f)
+
+        for dataset, output in out.items():
+            lumilist = output[year]["lumilist"]
+            # outputs of the previous lumi processor are python sets of (run, lumi)
+            if isinstance(lumilist, set):
+                pairs = np.array(sorted(lumilist), dtype=np.int64).reshape(-1, 2)
+                lumilist = LumiSet.from_runs_lumis(pairs[:, 0], pairs[:, 1])
+
+            if dataset not in out_all:
+                out_all[dataset] = lumilist
+            else:
+                out_all[dataset] += lumilist
+
+    return out_all
+
+
+def load_lumi_csv(lumi_csv):
+    """Returns the sorted packed (run, lumi) keys and the recorded luminosity [/pb] of the brilcalc csv (--byls)."""
+    # columns: run:fill, ls, time, beamstatus, E(GeV), delivered(/pb), recorded(/pb), ...
+    df = pd.read_csv(lumi_csv, comment="#", header=None, usecols=[0, 1, 6])
+    keys = pack_runs_lumis(
+        df[0].astype(str).str.split(":").str[0].astype(np.int64),
+        df[1].astype(str).str.split(":").str[0].astype(np.int64),
+    )
+    order = np.argsort(keys, kind="stable")
+    return keys[order], df[6].to_numpy(dtype=np.float64)[order]
+
+
+def get_lumi(lumi_set, keys, recorded):
+    """Returns the integrated luminosity of the lumi sections of ``lumi_set``."""
+    idx = np.minimum(np.searchsorted(keys, lumi_set.packed), len(keys) - 1)
+    return float(np.sum(recorded[idx][keys[idx] == lumi_set.packed]))
+
+
+def main(args):
+    pkl_files = sorted(glob.glob(f"{args.indir}/*/outfiles/*.pkl"))
+    print(f"Combining {len(pkl_files)} pkl files")
+
+    lumi_sets = combine_lumi_sets(pkl_files, args.year)
+
+    channels = {}
+    for dataset, lumi_set in lumi_sets.items():
+        ch = get_channel(dataset)
+        channels[ch] = channels.get(ch, LumiSet()) + lumi_set
+
+    os.makedirs(args.outdir, exist_ok=True)
+    with open(f"{args.outdir}/lumi_set_{args.year}.pkl", "wb") as handle:
+        pickle.dump(lumi_sets, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    for name, lumi_set in {**lumi_sets, **channels}.items():
+        with open(f"{args.outdir}/lumimask_{args.year}_{name}.json", "w") as f:
+            json.dump(lumi_set.to_json(), f)
+
+    if args.lumi_csv:
+        # this csv was made using brilcalc and the GoldenJson... refer to lumi/README.md
+        keys, recorded = load_lumi_csv(args.lumi_csv)
+
+        lumis = {
+            "datasets": {dataset: get_lumi(lumi_set, keys, recorded) for dataset, lumi_set in lumi_sets.items()},
+            "channels": {ch: get_lumi(lumi_set, keys, recorded) for ch, lumi_set in channels.items()},
+        }
+        with open(f"{args.outdir}/lumi_{args.year}.json", "w") as f:
+            json.dump(lumis, f, indent=4)
+
+        for dataset, lumi in lumis["datasets"].items():
+            print(f"{dataset}: {len(lumi_sets[dataset])} lumi sections, {lumi:.1f} /pb")
+        print("------------------------------------")
+        for ch, lumi in lumis["channels"].items():
+            print(f"---> Lumi for {ch} channel = {lumi:.1f} /pb")
+        print("------------------------------------")
+
+
+if __name__ == "__main__":
+    # e.g.
+    # run locally on lpc as:
+    # python aggregate_lumi.py --year 2017 --indir /eos/uscms/store/user/fmokhtar/boostedhiggs/lumi_2017/ \
+    #     --lumi-csv lumi2017.csv
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--year", dest="year", required=True, help="year (key of the lumi processor outputs)", type=str)
+    parser.add_argument("--indir", dest="indir", required=True, help="directory with {dataset}/outfiles/*.pkl", type=str)
+    parser.add_argument("--lumi-csv", dest="lumi_csv", default=None, help="brilcalc lumi csv (--byls)", type=str)
+    parser.add_argument("--outdir", dest="outdir", default=".", help="output directory", type=str)
+
+    args = parser.parse_args()
+
+    main(args)
@@ -46,7 +46,7 @@ def get_common_sample_name(sample):
     return sample_to_use
 
 
-def make_events_dict(years, channels, samples_dir, samples, presel, add_THWW=True):
+def make_events_dict(years, channels, samples_dir, samples, presel, add_THWW=True, sidecars=[]):
     """
     Postprocess the parquets by applying preselections, saving an `event_weight` column, and
     a tagger score column in a big concatenated dataframe.
@@ -57,6 +57,7 @@ def make_events_dict(years, channels, samples_dir, samples, presel, add_THWW=Tru
         samples_dir [str]: points to the path of the parquets
         samples [list]: samples to postprocess and save in the output (e.g. ["HWW", "QCD", "Data"])
         presel [dict]: selections to apply per ch (e.g. `presel = {"ele": {"pt cut": fj_pt>250}}`)
+        sidecars [list]: sidecar column families to join onto the nominal parquets (e.g. ["tagger"])
 
     Returns
         a dict() object events_dict[year][channel][samples] that contains big dataframes of procesed events
@@ -92,7 +93,7 @@ def make_events_dict(years, channels, samples_dir, samples, presel, add_THWW=Tru
                     continue
 
                 try:
-                    data = pd.read_parquet(parquet_files)
+                    data = utils.read_parquets(parquet_files, sidecars)
                 except pyarrow.lib.ArrowInvalid:  # empty parquet because no event passed selection
                     continue
 
@@ -110,7 +111,7 @@ def make_events_dict(years, channels, samples_dir, samples, presel, add_THWW=Tru
                     data["event_weight"] = np.ones_like(data["fj_pt"])
 
                 if add_THWW:
-                    # use hidNeurons to get the finetuned scores
+                    # use hidNeurons to get the finetuned scores (or the THWW_{version} scores evaluated in the processor)
                     data["THWW"] = utils.get_finetuned_score(data, modelv="v35_30")
 
                     # drop hidNeuron columns for memory purposes
@@ -187,6 +188,7 @@ def main(args):
             args.samples_dir,
             config["samples"],
             config["presel"],
+            sidecars=config.get("sidecars", []),
         )
         with open(f"{args.outpath}/events_dict.pkl", "wb") as fp:
             pkl.dump(events_dict, fp)
@@ -3,6 +3,7 @@
 import json
 import os
 import pickle as pkl
+import sys
 import warnings
 
 import hist as hist2
@@ -13,6 +14,11 @@ import onnx
 import onnxruntime as ort
 import scipy
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# the sidecar parquets are read with the helper of the processor package
+from boostedhiggs.sidecars import read_parquets  # noqa: E402, F401
+
 plt.style.use(hep.style.CMS)
 
 warnings.filterwarnings("ignore", message="Found duplicate branch ")
@@ -85,6 +91,10 @@ def get_xsecweight(pkl_files, year, sample, is_data, luminosity):
 # ---------------------------------------------------------
 # TAGGER STUFF
 def get_finetuned_score(data, modelv="v2_nor2"):
+    # use the score evaluated in the processor if stored
+    if f"THWW_{modelv}" in data:
+        return data[f"THWW_{modelv}"].values
+
     # add finetuned tagger score
     PATH = f"../../weaver-core-dev/experiments_finetuning/{modelv}/model.onnx"
 
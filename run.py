@@ -1,13 +1,13 @@
 #!/usr/bin/python
 
 import argparse
+import glob
 import json
 import os
 import pickle as pkl
 import time
 
-import pandas as pd
-import uproot
+import pyarrow.parquet as pq
 from coffea import nanoevents, processor
 
 nanoevents.PFNanoAODSchema.warn_missing_crossrefs = False
@@ -17,40 +17,43 @@ import sys
 sys.path.insert(0, "")
 sys.path.append("boostedhiggs/LundReweighting")
 sys.path.append("boostedhiggs/LundReweighting/utils")
+
+from boostedhiggs.preprocessing_cache import get_preprocessing_cache
+from boostedhiggs.reader import get_reader_options, runner_kwargs, set_uproot_defaults
+from boostedhiggs.utils import make_multiyear_fileset, split_year
+
 # # from utils.LundReweighter import *
 # # from utils.Utils import *
 # import LundReweighter
 
 
-def main(args):
-    # make directory for output
-    if not os.path.exists("./outfiles"):
-        os.makedirs("./outfiles")
-
-    channels = ["ele", "mu"]
-    if args.channels:
-        channels = args.channels.split(",")
+def get_files(args, year, multiyear=False):
+    """Returns the files of each sample of a year, {sample: [files]}."""
+    # if --from-skims is specified in args, process the local skims made with --processor skim
+    if args.from_skims:
+        files = {}
+        for sample in sorted(os.listdir(f"{args.skim_dir}/{year}")):
+            files[sample] = sorted(glob.glob(f"{args.skim_dir}/{year}/{sample}/*.root"))
 
     # if --macos is specified in args, process only the files provided
-    if args.macos:
+    elif args.macos:
         files = {}
         files[args.sample] = [f"rootfiles2/rootfiles/{args.sample}/file{i+1}.root" for i in range(1)]
 
     # if --local is specified in args, process only the args.sample provided
     elif args.local:
-        files = {}
-        with open(f"fileset/pfnanoindex_{args.pfnano}_{args.year}.json", "r") as f:
-            files_all = json.load(f)
-            for subdir in files_all[args.year]:
-                for key, flist in files_all[args.year][subdir].items():
-                    if key in args.sample:
-                        files[key] = ["root://cmseos.fnal.gov/" + f for f in flist]
+        from boostedhiggs.catalog import FilesetCatalog
+
+        files = FilesetCatalog(args.catalog).files(args.pfnano, year, args.sample.split(","))
 
     else:
         # get samples
         if "metadata" in args.config:
             with open(args.config, "r") as f:
                 files = json.load(f)
+            # multi-year metadata files are keyed by year first
+            if multiyear:
+                files = files.get(year, {})
         else:
             if not args.config or not args.configkey:
                 raise Exception("No config or configkey provided for condor jobs")
@@ -61,45 +64,23 @@ def main(args):
             files, _ = loadFiles(
                 args.config,
                 args.configkey,
-                args.year,
+                year,
                 args.pfnano,
                 args.sample.split(","),
+                catalog=args.catalog,
             )
 
-            # print(files)
-
-    if not files:
-        print("Did not find files.. Exiting.")
-        exit(1)
+    return files
 
-    # build fileset with files to run per job
-    fileset = {}
-    starti = args.starti
-    job_name = "/" + str(starti * args.n)
-    if args.n != -1:
-        job_name += "-" + str(args.starti * args.n + args.n)
-    for sample, flist in files.items():
-        if args.sample:
-            if sample not in args.sample.split(","):
-                continue
-        if args.n != -1:
-            fileset[sample] = flist[args.starti * args.n : args.starti * args.n + args.n]
-        else:
-            fileset[sample] = flist
-
-    print(
-        len(list(fileset.keys())),
-        "Samples in fileset to be processed: ",
-        list(fileset.keys()),
-    )
-    print(fileset)
-    print(f"Number of files: {len(fileset[list(fileset.keys())[0]])}")
 
-    # define processor
-    year = args.year.replace("APV", "")
-    yearmod = ""
-    if "APV" in args.year:
-        yearmod = "APV"
+def get_processor(args, year, yearmod, channels, sidecars, job_name, outdir="./outfiles"):
+    """Returns the processor of ``args.processor`` with the options of the command line, writing to {outdir}/{job_name}."""
+    # finetuned heads given as version:path (e.g. v35_30:model.onnx)
+    finetuned_heads = {}
+    if args.finetuned_heads:
+        for head in args.finetuned_heads.split(","):
+            version, model_path = head.split(":")
+            finetuned_heads[version] = model_path
 
     if args.processor == "hww":
         from boostedhiggs.hwwprocessor import HwwProcessor
@@ -109,43 +90,190 @@ def main(args):
             yearmod=yearmod,
             channels=channels,
             inference=args.inference,
+            finetuned_heads=finetuned_heads,
+            keep_hidneurons=args.keep_hidneurons,
             systematics=args.systematics,
             getLPweights=args.getLPweights,
+            lp_ratio=args.lp_ratio,
             uselooselep=args.uselooselep,
             fakevalidation=args.fakevalidation,
-            output_location="./outfiles" + job_name,
+            sidecars=sidecars,
+            store_trigger_bits=args.store_trigger_bits,
+            jec_backend=args.jec_backend,
+            jerc_json=args.jerc_json,
+            templates=args.templates,
+            templates_config=args.templates_config,
+            # the templates are returned in the accumulator so no parquets are written
+            output_location=None if args.templates else outdir + job_name,
         )
 
+    elif args.processor == "skim":
+        from boostedhiggs.skimprocessor import SkimProcessor
+
+        # the skims are written to {skim_dir}/{year}/{sample}/ and read back with --from-skims
+        p = SkimProcessor(
+            year=year,
+            yearmod=yearmod,
+            skim_config=args.skim_config,
+            output_location=args.skim_dir + "/",
+        )
+
+    elif args.processor == "btageff":
+        from boostedhiggs.btageffprocessor import BTagEfficiencyProcessor
+
+        # the btageff_{tagger}_{wp}_{year}.coffea lookups are written to {outdir}/{job_name}/
+        p = BTagEfficiencyProcessor(year=year, yearmod=yearmod, output_location=f"{outdir}/{job_name}")
+
     elif args.processor == "lumi":
         from boostedhiggs.lumi_processor import LumiProcessor
 
-        p = LumiProcessor(year=args.year, yearmod=yearmod, output_location=f"./outfiles/{job_name}")
+        p = LumiProcessor(year=year, yearmod=yearmod, output_location=f"{outdir}/{job_name}")
 
     elif args.processor == "input":
         # define processor
         from boostedhiggs.inputprocessor import InputProcessor
 
         assert args.inference is True, "enable --inference to run skimmer"
-        p = InputProcessor(year=args.year, output_location=f"./outfiles/{job_name}")
+        p = InputProcessor(year=args.year, output_location=f"{outdir}/{job_name}", save_pf_features=args.save_pf_features)
 
     elif args.processor == "fakes":
         # define processor
         from boostedhiggs.fakesprocessor import FakesProcessor
 
-        p = FakesProcessor(year=year, yearmod=yearmod, output_location=f"./outfiles/{job_name}")
+        p = FakesProcessor(
+            year=year,
+            yearmod=yearmod,
+            store_trigger_bits=args.store_trigger_bits,
+            output_location=f"{outdir}/{job_name}",
+        )
 
     elif args.processor == "zll":
         # define processor
         from boostedhiggs.zllprocessor import ZllProcessor
 
-        p = ZllProcessor(year=year, yearmod=yearmod, output_location=f"./outfiles/{job_name}")
+        p = ZllProcessor(
+            year=year,
+            yearmod=yearmod,
+            store_trigger_bits=args.store_trigger_bits,
+            output_location=f"{outdir}/{job_name}",
+        )
 
     else:
-        from boostedhiggs.documentation.trigger_efficiencies_processor_ele_MVA_test import (
-            TriggerEfficienciesProcessor,
-        )
+        from boostedhiggs.trigger_efficiencies_processor import TriggerEfficienciesProcessor
+
+        p = TriggerEfficienciesProcessor(year=args.year, histograms=args.trigger_hists, hist_config=args.trigger_hist_config)
+
+    return p
+
+
+def reader_options_from_args(args):
+    """
+    Returns the uproot read settings: a preset (see ``boostedhiggs/data/reader_presets.json``) with the options given
+    explicitly.
+    """
+    return get_reader_options(
+        args.reader_preset,
+        overrides={
+            "xrootd_handler": args.xrootd_handler,
+            "num_workers": args.uproot_workers,
+            "begin_chunk_size": args.begin_chunk_size,
+            "timeout": args.xrootd_timeout,
+            "mmap": args.mmap,
+            "align_clusters": args.align_clusters,
+            "cache": args.column_cache,
+        },
+    )
+
+
+def main(args):
+    # make directory for output
+    if not os.path.exists("./outfiles"):
+        os.makedirs("./outfiles")
+
+    channels = ["ele", "mu"]
+    if args.channels:
+        channels = args.channels.split(",")
+
+    sidecars = args.sidecars.split(",") if args.sidecars else []
 
-        p = TriggerEfficienciesProcessor(year=args.year)
+    # several years (e.g. --year 2016APV,2016,2017,2018) are processed in one job pool (see ``make_multiyear_fileset``)
+    years = args.year.split(",")
+    multiyear = len(years) > 1
+    if multiyear and args.processor not in ["hww", "fakes", "zll", "skim", "btageff"]:
+        raise Exception(f"Processor {args.processor} does not support running over multiple years")
+
+    # the skim preselection is looser than the selections of these processors only (e.g. the input processor keeps
+    # lepton-less events, the lumi processor all the lumi sections)
+    if args.from_skims and args.processor not in ["hww", "fakes", "zll"]:
+        raise Exception(f"Processor {args.processor} does not support running on the skims")
+
+    # build fileset with files to run per job
+    starti = args.starti
+    job_name = "/" + str(starti * args.n)
+    if args.n != -1:
+        job_name += "-" + str(args.starti * args.n + args.n)
+
+    entry_ranges = None
+    if args.ranges:
+        from boostedhiggs.entry_ranges import load_job
+
+        # the job --starti of the entry ranges of --sample (see condor/submit.py --events-per-job)
+        if multiyear or not args.sample or "," in args.sample:
+            raise Exception("--ranges needs one year and one sample")
+        job = load_job(args.ranges, args.sample, args.starti)
+        job_name = "/" + job["name"]
+        entry_ranges = [tuple(entry_range) for entry_range in job["ranges"]]
+        fileset_per_year = {years[0]: {args.sample: list(dict.fromkeys(f for f, _, _ in entry_ranges))}}
+
+    else:
+        fileset_per_year = {}
+        for year in years:
+            files = get_files(args, year, multiyear)
+            if not files:
+                print(f"Did not find files for {year}.. Exiting.")
+                exit(1)
+
+            fileset_per_year[year] = {}
+            for sample, flist in files.items():
+                if args.sample:
+                    if sample not in args.sample.split(","):
+                        continue
+                if args.n != -1:
+                    fileset_per_year[year][sample] = flist[args.starti * args.n : args.starti * args.n + args.n]
+                else:
+                    fileset_per_year[year][sample] = flist
+
+    # copy the inputs to the local staging cache, later runs read them from local disk
+    if args.stage_dir:
+        from boostedhiggs.staging import StagingCache
+
+        staging = StagingCache(args.stage_dir, max_size=args.stage_size * 1e9)
+        staged = {year: staging.stage_files(files) for year, files in fileset_per_year.items()}
+        if entry_ranges is not None:
+            local = dict(zip(fileset_per_year[years[0]][args.sample], staged[years[0]][args.sample]))
+            entry_ranges = [(local[f], start, stop) for f, start, stop in entry_ranges]
+        fileset_per_year = staged
+
+    if multiyear:
+        fileset = make_multiyear_fileset(fileset_per_year)
+    else:
+        fileset = fileset_per_year[years[0]]
+
+    print(
+        len(list(fileset.keys())),
+        "Samples in fileset to be processed: ",
+        list(fileset.keys()),
+    )
+    print(fileset)
+    for year in years:
+        print(f"Number of files ({year}): {sum(len(flist) for flist in fileset_per_year[year].values())}")
+
+    # define processor (for multiple years the year-specific configuration is resolved per chunk)
+    year, yearmod = split_year(years[0])
+    p = get_processor(args, year, yearmod, channels, sidecars, job_name)
+
+    reader_options = reader_options_from_args(args)
+    print(f"Reader options ({args.reader_preset}): {reader_options}")
 
     tic = time.time()
     if args.executor == "dask":
@@ -164,15 +292,16 @@ def main(args):
 
         print("Waiting for at least one worker")
         client.wait_for_workers(1)
+        client.run(set_uproot_defaults, reader_options)
 
         # does treereduction help?
         executor = processor.DaskExecutor(status=True, client=client, treereduction=2)
 
     else:
-        uproot.open.defaults["xrootd_handler"] = uproot.source.xrootd.MultithreadedXRootDSource
+        set_uproot_defaults(reader_options)
 
         if args.executor == "futures":
-            executor = processor.FuturesExecutor(status=True)
+            executor = processor.FuturesExecutor(status=True, workers=args.workers)
         else:
             executor = processor.IterativeExecutor(status=True)
 
@@ -183,18 +312,51 @@ def main(args):
         savemetrics=True,
         schema=nanoevents.PFNanoAODSchema,
         chunksize=args.chunksize,
+        **runner_kwargs(reader_options),
+        metadata_cache=get_preprocessing_cache(args.preprocessing_cache, check_mtime=not args.no_mtime),
     )
 
-    out, metrics = run(fileset, "Events", processor_instance=p)
+    # the chunks of the entry ranges, or the fileset chunked by the runner
+    chunks = fileset
+    if entry_ranges is not None:
+        from boostedhiggs.entry_ranges import entry_range_chunks
+
+        chunks = entry_range_chunks(run.preprocess(fileset, "Events"), entry_ranges, args.chunksize)
+
+    if args.schedule == "cost":
+        from boostedhiggs.scheduling import CostModel, TimedProcessor, log_estimates, log_tail
+
+        if args.executor != "futures":
+            raise Exception("--schedule cost is only supported with --executor futures")
+
+        # submit the chunks from the most to the least expensive, estimated from past runs (see --cost-history)
+        cost_model = CostModel(
+            args.processor,
+            {"inference": args.inference, "systematics": args.systematics, "getLPweights": args.getLPweights},
+            history=args.cost_history,
+        )
+        if entry_ranges is None:
+            chunks = list(run.preprocess(fileset, "Events"))
+        chunks = cost_model.order(chunks)
+        log_estimates(cost_model, chunks, args.workers)
+
+        p = TimedProcessor(p)
+        out, metrics = run(chunks, "Events", processor_instance=p)
+
+        log_tail(p.timings, args.workers)
+        cost_model.update(p.timings)
+
+    else:
+        out, metrics = run(chunks, "Events", processor_instance=p)
 
     elapsed = time.time() - tic
     print(f"Metrics: {metrics}")
     print(f"Finished in {elapsed:.1f}s")
 
     if args.processor == "input":
-        # merge parquet
-        data = pd.read_parquet(f"./outfiles/{job_name}/parquet")
-        data.to_parquet(f"./outfiles/{job_name}.parquet")
+        # merge parquet (with arrow, to keep the fixed-size list columns of the PF features)
+        if os.path.exists(f"./outfiles/{job_name}/parquet"):
+            pq.write_table(pq.read_table(f"./outfiles/{job_name}/parquet"), f"./outfiles/{job_name}.parquet")
 
         # remove unmerged parquet files
         os.system("rm -rf ./outfiles/" + job_name)
@@ -205,29 +367,51 @@ def main(args):
         pkl.dump(out, filehandler)
         filehandler.close()
 
-        if args.processor != "trigger":
-            # merge parquet
+        if args.processor not in ["trigger", "skim", "btageff"] and not args.templates:
+            # chunks of multi-year filesets are written to one directory per year (merged to ./outfiles/{year}/)
+            parquet_dirs = {"": "/parquet"}
+            if multiyear:
+                parquet_dirs = {year: f"/parquet/{year}" for year in years}
+
+            for yeardir, parquet_dir in parquet_dirs.items():
+                outdir = "./outfiles/" + yeardir
+                if not os.path.exists(outdir):
+                    os.makedirs(outdir)
+
+                # merge parquet (with arrow, to keep the fixed-size list columns of the LHE weights)
+                for ch in channels:
+                    if os.path.exists("./outfiles/" + job_name + ch + parquet_dir):
+                        table = pq.read_table("./outfiles/" + job_name + ch + parquet_dir)
+                        pq.write_table(table, outdir + job_name + "_" + ch + ".parquet")
+
+                    # merge the sidecar column families (joined back on the event key when reading)
+                    for family in sidecars:
+                        if not os.path.exists("./outfiles/" + job_name + ch + "_" + family + parquet_dir):
+                            continue
+                        table = pq.read_table("./outfiles/" + job_name + ch + "_" + family + parquet_dir)
+                        pq.write_table(table, outdir + job_name + "_" + ch + "_" + family + ".parquet")
+
+            # remove old parquet files
             for ch in channels:
-                data = pd.read_parquet("./outfiles/" + job_name + ch + "/parquet")
-                data.to_parquet("./outfiles/" + job_name + "_" + ch + ".parquet")
-                # remove old parquet files
                 os.system("rm -rf ./outfiles/" + job_name + ch)
+                for family in sidecars:
+                    os.system("rm -rf ./outfiles/" + job_name + ch + "_" + family)
 
 
-if __name__ == "__main__":
-    # e.g.
-    # noqa: run locally on lpc (hww mc) as: python run.py --year 2017 --processor hww --pfnano v2_2 --n 1 --starti 0 --config samples_inclusive.yaml --key mc
-    # noqa: run locally on lpc (hww trigger) as: python run.py --year 2017 --processor trigger --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele --config samples_inclusive.yaml --key mc
-
-    # noqa: run locally on single file (hww): python run.py --year 2017 --processor hww --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele --config samples_inclusive.yaml --key mc
-
-    # noqa LP: python run.py --year 2017 --processor hww --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele,mu --config samples_inclusive.yaml --key mc --getLPweights --inference
-    # noqa Fakes: python run.py --year 2017 --processor fakes --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele,mu --config samples_inclusive.yaml --key mc
-
+def get_parser():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--year", dest="year", default="2017", help="year", type=str)
+    parser.add_argument(
+        "--year", dest="year", default="2017", help="year, or several years separated by commas (hww, fakes, zll)", type=str
+    )
     parser.add_argument("--starti", dest="starti", default=0, help="start index of files", type=int)
     parser.add_argument("--n", dest="n", default=-1, help="number of files to process", type=int)
+    parser.add_argument(
+        "--ranges",
+        dest="ranges",
+        default=None,
+        help="entry ranges of the jobs (ranges_{key}.json of condor/submit.py --events-per-job), run the job --starti",
+        type=str,
+    )
     parser.add_argument("--config", dest="config", default=None, help="path to datafiles", type=str)
     parser.add_argument(
         "--key",
@@ -261,14 +445,41 @@ if __name__ == "__main__":
         default="v2_2",
         help="pfnano version",
     )
+    parser.add_argument(
+        "--catalog",
+        dest="catalog",
+        default="fileset/catalog.sqlite",
+        help="fileset catalog of the PFNano index jsons used by --local and --config (see fileset/build_catalog.py)",
+        type=str,
+    )
     parser.add_argument("--macos", dest="macos", action="store_true")
     parser.add_argument("--local", dest="local", action="store_true")
     parser.add_argument("--inference", dest="inference", action="store_true")
     parser.add_argument("--no-inference", dest="inference", action="store_false")
+    parser.add_argument(
+        "--finetuned-heads",
+        dest="finetuned_heads",
+        default=None,
+        help="finetuned heads to evaluate after inference as version:path, separated by commas (e.g. v35_30:model.onnx)",
+        type=str,
+    )
+    parser.add_argument(
+        "--keep-hidneurons",
+        dest="keep_hidneurons",
+        action="store_true",
+        help="also store the hidden neurons when finetuned heads are evaluated",
+    )
     parser.add_argument("--systematics", dest="systematics", action="store_true")
     parser.add_argument("--no-systematics", dest="systematics", action="store_false")
     parser.add_argument("--getLPweights", dest="getLPweights", action="store_true")
     parser.add_argument("--no-getLPweights", dest="getLPweights", action="store_false")
+    parser.add_argument(
+        "--lp-ratio",
+        dest="lp_ratio",
+        default=None,
+        help="Lund-plane ratio file (e.g. ratio_{year}.root) to store the LP weights instead of their inputs (hww)",
+        type=str,
+    )
 
     parser.add_argument("--uselooselep", dest="uselooselep", action="store_true")
     parser.add_argument("--no-uselooselep", dest="uselooselep", action="store_false")
@@ -277,7 +488,217 @@ if __name__ == "__main__":
     parser.add_argument("--fakevalidation", dest="fakevalidation", action="store_true")
     parser.add_argument("--no-fakevalidation", dest="fakevalidation", action="store_false")
 
+    # trigger studies
+    parser.add_argument(
+        "--store-trigger-bits",
+        dest="store_trigger_bits",
+        action="store_true",
+        help="store the packed HLT and MET filter bitmasks (hlt_bits, metfilter_bits)",
+    )
+
+    # JECs
+    parser.add_argument(
+        "--jec-backend",
+        dest="jec_backend",
+        default="coffea",
+        choices=["coffea", "correctionlib"],
+        help="JEC/JER from the pickled coffea factories or the correctionlib json of build_jerc.py (hww)",
+    )
+    parser.add_argument(
+        "--jerc-json",
+        dest="jerc_json",
+        default=None,
+        help="correctionlib JEC/JER json of --jec-backend correctionlib instead of the one of build_jerc.py, {year} and "
+        "{jets} are replaced by e.g. 2017_UL and jet/fatJet (e.g. /cvmfs/cms.cern.ch/rsync/cms-nanoAOD/"
+        "jsonpog-integration/POG/JME/{year}/{jets}_jerc.json.gz)",
+        type=str,
+    )
+
+    parser.add_argument(
+        "--save-pf-features",
+        dest="save_pf_features",
+        action="store_true",
+        help="also store the PF candidate and SV tagger inputs as fixed-size list columns (input)",
+    )
+    parser.add_argument(
+        "--trigger-hists",
+        dest="trigger_hists",
+        action="store_true",
+        help="fill trigger efficiency histograms instead of storing the selected events as columns (trigger)",
+    )
+    parser.add_argument(
+        "--trigger-hist-config",
+        dest="trigger_hist_config",
+        default=None,
+        help="histograms of --trigger-hists (default: boostedhiggs/data/trigger_histograms.json)",
+        type=str,
+    )
+
+    # sidecars
+    parser.add_argument(
+        "--sidecars",
+        dest="sidecars",
+        default=None,
+        help="column families to write to separate event-keyed parquets, separated by commas (e.g. tagger,lp,jec,lhe)",
+        type=str,
+    )
+
+    # templates
+    parser.add_argument(
+        "--templates",
+        dest="templates",
+        action="store_true",
+        help="fill the make_templates histograms in the processor and store them in the pkl instead of writing parquets",
+    )
+    parser.add_argument(
+        "--templates-config",
+        dest="templates_config",
+        default=None,
+        help="regions/systematics config for --templates (default: boostedhiggs/data/templates.json)",
+        type=str,
+    )
+
+    # skims
+    parser.add_argument(
+        "--skim-dir",
+        dest="skim_dir",
+        default="./skims",
+        help="local directory of the loose-preselection skims (written by --processor skim, read with --from-skims)",
+        type=str,
+    )
+    parser.add_argument(
+        "--skim-config",
+        dest="skim_config",
+        default=None,
+        help="preselection/branches config for --processor skim (default: boostedhiggs/data/skim.json)",
+        type=str,
+    )
+    parser.add_argument(
+        "--from-skims",
+        dest="from_skims",
+        action="store_true",
+        help="run on the local skims of --skim-dir instead of the PFNano inputs (hww, fakes and zll processors)",
+    )
+
+    # preprocessing
+    parser.add_argument(
+        "--preprocessing-cache",
+        dest="preprocessing_cache",
+        default="fileset/preprocessing_cache.sqlite",
+        help="SQLite cache of the file uuids/number of entries reused across runs ('' to preprocess every file again)",
+        type=str,
+    )
+    parser.add_argument(
+        "--no-mtime",
+        dest="no_mtime",
+        action="store_true",
+        help="trust the preprocessing cache without checking the modification time of the files",
+    )
+
+    # staging
+    parser.add_argument(
+        "--stage-dir",
+        dest="stage_dir",
+        default=None,
+        help="local directory to stage the input files to before processing (e.g. for repeated --local studies)",
+        type=str,
+    )
+    parser.add_argument(
+        "--stage-size",
+        dest="stage_size",
+        default=50,
+        help="size budget of --stage-dir in GB, the least recently used files are evicted",
+        type=float,
+    )
+
+    # uproot reads
+    parser.add_argument(
+        "--reader-preset",
+        dest="reader_preset",
+        default="default",
+        help="uproot read settings preset of boostedhiggs/data/reader_presets.json (default, wide, narrow, local)",
+        type=str,
+    )
+    parser.add_argument(
+        "--xrootd-handler",
+        dest="xrootd_handler",
+        default=None,
+        choices=["multithreaded", "vector"],
+        help="xrootd source: parallel basket requests or coalesced vector reads (overrides the preset)",
+    )
+    parser.add_argument(
+        "--uproot-workers",
+        dest="uproot_workers",
+        default=None,
+        help="parallel fetches per file (overrides the preset)",
+        type=int,
+    )
+    parser.add_argument(
+        "--begin-chunk-size",
+        dest="begin_chunk_size",
+        default=None,
+        help="bytes read when opening a file (overrides the preset)",
+        type=int,
+    )
+    parser.add_argument(
+        "--xrootd-timeout", dest="xrootd_timeout", default=None, help="xrootd timeout in s (overrides the preset)", type=int
+    )
+    parser.add_argument("--mmap", dest="mmap", action="store_true", default=None, help="memory-map local input files")
+    parser.add_argument("--no-mmap", dest="mmap", action="store_false")
+    parser.add_argument(
+        "--align-clusters",
+        dest="align_clusters",
+        action="store_true",
+        default=None,
+        help="align the chunks to the ROOT clusters",
+    )
+    parser.add_argument("--no-align-clusters", dest="align_clusters", action="store_false")
+    parser.add_argument(
+        "--column-cache",
+        dest="column_cache",
+        default=None,
+        help="cache of the columns read by the chunks: size in MB per worker process (0 for none) or dask-worker "
+        "(overrides the preset)",
+        type=str,
+    )
+
+    # scheduling
+    parser.add_argument("--workers", dest="workers", default=1, help="number of processes of the futures executor", type=int)
+    parser.add_argument(
+        "--schedule",
+        dest="schedule",
+        default="fileset",
+        choices=["fileset", "cost"],
+        help="order of the chunks of the futures executor: as in the fileset, or most expensive first",
+    )
+    parser.add_argument(
+        "--cost-history",
+        dest="cost_history",
+        default="chunk_costs.json",
+        help="per-sample processing times of past runs used (and updated) by --schedule cost",
+        type=str,
+    )
+
     parser.set_defaults(inference=False)
+
+    return parser
+
+
+if __name__ == "__main__":
+    # e.g.
+    # noqa: run locally on lpc (hww mc) as: python run.py --year 2017 --processor hww --pfnano v2_2 --n 1 --starti 0 --config samples_inclusive.yaml --key mc
+    # noqa: run locally on lpc (hww trigger) as: python run.py --year 2017 --processor trigger --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele --config samples_inclusive.yaml --key mc
+
+    # noqa: run locally on single file (hww): python run.py --year 2017 --processor hww --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele --config samples_inclusive.yaml --key mc
+
+    # noqa LP: python run.py --year 2017 --processor hww --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele,mu --config samples_inclusive.yaml --key mc --getLPweights --inference
+    # noqa templates: python run.py --year 2017 --processor hww --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele,mu --config samples_inclusive.yaml --key mc --inference --systematics --templates
+    # noqa multi-year (hww): python run.py --year 2016APV,2016,2017,2018 --processor hww --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele,mu --config samples_inclusive.yaml --key mc
+    # noqa skim: python run.py --year 2017 --processor skim --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --skim-dir ./skims
+    # noqa hww on skims: python run.py --year 2017 --processor hww --from-skims --skim-dir ./skims --sample GluGluHToWW_Pt-200ToInf_M-125 --channels ele,mu
+    # noqa Fakes: python run.py --year 2017 --processor fakes --pfnano v2_2 --n 1 --starti 0 --sample GluGluHToWW_Pt-200ToInf_M-125 --local --channels ele,mu --config samples_inclusive.yaml --key mc
+
+    parser = get_parser()
     args = parser.parse_args()
 
     main(args)
@@ -1,8 +1,9 @@
 #!/usr/bin/bash
 
 ###############################################################################################################
-# The following run.py commands on the signal samples are chosen following roughly a 60-40 train-test split
-# after considering the number of files available. For reference, the number of files available are,
+# The following run.py commands run over the files of each sample in two parts (part0, part1). The train-test
+# split (60-40) is done per event by boostedhiggs/training_dataset.py, which also mixes and shuffles the samples
+# (see training_dataset.yaml). For reference, the number of files available are,
     # ggF number of files:
     # - 2018: 22
     # - 2017: 25
@@ -18,59 +19,59 @@
 # run over signal samples (ggF)
 mkdir -p ntuples/GluGluHToWW_Pt-200ToInf_M-125/2018
 python run.py --processor input --local --sample GluGluHToWW_Pt-200ToInf_M-125 --n 13 --starti 0 --inference --year 2018
-mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2018/train
+mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2018/part0
 python run.py --processor input --local --sample GluGluHToWW_Pt-200ToInf_M-125 --n 13 --starti 1 --inference --year 2018
-mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2018/test
+mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2018/part1
 
 mkdir -p ntuples/GluGluHToWW_Pt-200ToInf_M-125/2017
 python run.py --processor input --local --sample GluGluHToWW_Pt-200ToInf_M-125 --n 15 --starti 0 --inference --year 2017
-mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2017/train
+mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2017/part0
 python run.py --processor input --local --sample GluGluHToWW_Pt-200ToInf_M-125 --n 15 --starti 1 --inference --year 2017
-mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2017/test
+mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2017/part1
 
 mkdir -p ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016APV
 python run.py --processor input --local --sample GluGluHToWW_Pt-200ToInf_M-125 --n 13 --starti 0 --inference --year 2016APV
-mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016APV/train
+mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016APV/part0
 python run.py --processor input --local --sample GluGluHToWW_Pt-200ToInf_M-125 --n 13 --starti 1 --inference --year 2016APV
-mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016APV/test
+mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016APV/part1
 
 mkdir -p ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016
 python run.py --processor input --local --sample GluGluHToWW_Pt-200ToInf_M-125 --n 9 --starti 0 --inference --year 2016
-mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016/train
+mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016/part0
 python run.py --processor input --local --sample GluGluHToWW_Pt-200ToInf_M-125 --n 9 --starti 1 --inference --year 2016
-mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016/test
+mv outfiles ntuples/GluGluHToWW_Pt-200ToInf_M-125/2016/part1
 
 # run over signal samples (VBF)
 mkdir -p ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2018
 python run.py --processor input --local --sample VBFHToWWToLNuQQ_M-125_withDipoleRecoil --n 4 --starti 0 --inference --year 2018
-mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2018/train
+mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2018/part0
 python run.py --processor input --local --sample VBFHToWWToLNuQQ_M-125_withDipoleRecoil --n 4 --starti 1 --inference --year 2018
-mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2018/test
+mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2018/part1
 
 mkdir -p ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2017
 python run.py --processor input --local --sample VBFHToWWToLNuQQ_M-125_withDipoleRecoil --n 11 --starti 0 --inference --year 2017
-mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2017/train
+mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2017/part0
 python run.py --processor input --local --sample VBFHToWWToLNuQQ_M-125_withDipoleRecoil --n 11 --starti 1 --inference --year 2017
-mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2017/test
+mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2017/part1
 
 mkdir -p ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016APV
 python run.py --processor input --local --sample VBFHToWWToLNuQQ_M-125_withDipoleRecoil --n 4 --starti 0 --inference --year 2016APV
-mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016APV/train
+mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016APV/part0
 python run.py --processor input --local --sample VBFHToWWToLNuQQ_M-125_withDipoleRecoil --n 4 --starti 1 --inference --year 2016APV
-mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016APV/test
+mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016APV/part1
 
 mkdir -p ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016
 python run.py --processor input --local --sample VBFHToWWToLNuQQ_M-125_withDipoleRecoil --n 9 --starti 0 --inference --year 2016
-mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016/train
+mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016/part0
 python run.py --processor input --local --sample VBFHToWWToLNuQQ_M-125_withDipoleRecoil --n 9 --starti 1 --inference --year 2016
-mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016/test
+mv outfiles ntuples/VBFHToWWToLNuQQ_M-125_withDipoleRecoil/2016/part1
 
 # run over TTbar samples
 mkdir -p ntuples/TTToSemiLeptonic/2018/
 python run.py --processor input --local --sample TTToSemiLeptonic --n 100 --starti 0 --inference --year 2018
-mv outfiles ntuples/TTToSemiLeptonic/2018/train
+mv outfiles ntuples/TTToSemiLeptonic/2018/part0
 python run.py --processor input --local --sample TTToSemiLeptonic --n 100 --starti 1 --inference --year 2018
-mv outfiles ntuples/TTToSemiLeptonic/2018/test
+mv outfiles ntuples/TTToSemiLeptonic/2018/part1
 
 # run over WJetsLNu samples
 for SAMPLE in WJetsToLNu_HT-200To400 WJetsToLNu_HT-400To600 WJetsToLNu_HT-600To800 WJetsToLNu_HT-800To1200
@@ -78,10 +79,10 @@ do
     mkdir -p ntuples/$SAMPLE/2018/
 
     python run.py --processor input --local --sample $SAMPLE --n 5 --starti 0 --inference --year 2018
-    mv outfiles ntuples/$SAMPLE/2018/train
+    mv outfiles ntuples/$SAMPLE/2018/part0
 
     python run.py --processor input --local --sample $SAMPLE --n 5 --starti 1 --inference --year 2018
-    mv outfiles ntuples/$SAMPLE/2018/test
+    mv outfiles ntuples/$SAMPLE/2018/part1
 done
 
 # run over QCD files
@@ -90,8 +91,11 @@ do
     mkdir -p ntuples/$SAMPLE/2018/
 
     python run.py --processor input --local --sample $SAMPLE --n 5 --starti 0 --inference --year 2018
-    mv outfiles ntuples/$SAMPLE/2018/train
+    mv outfiles ntuples/$SAMPLE/2018/part0
 
     python run.py --processor input --local --sample $SAMPLE --n 5 --starti 1 --inference --year 2018
-    mv outfiles ntuples/$SAMPLE/2018/test
+    mv outfiles ntuples/$SAMPLE/2018/part1
 done
+
+# train and test datasets (shuffled, memory-mappable shards)
+python -m boostedhiggs.training_dataset --config training_dataset.yaml --outdir datasets/finetuning --test-fraction 0.4